@@ -0,0 +1,166 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+
+COLUMNS = ['product_id', 'seller_id', 'query', 'search_page', 'position',
+           'title', 'concatenated_tags', 'creation_date', 'price', 'weight',
+           'express_delivery', 'minimum_quantity', 'view_counts',
+           'order_counts', 'category']
+
+CATEGORIES = ['Lembrancinhas', 'Decoração', 'Bebê', 'Papel e Cia',
+              'Outros', 'Bijuterias e Jóias']
+
+CATEGORY_WEIGHTS = [0.40, 0.25, 0.15, 0.10, 0.06, 0.04]
+
+COMMON_WORDS = ['lembrancinha', 'personalizado', 'kit', 'caneca', 'bebe',
+                'festa', 'decoracao', 'mdf', 'croche', 'mandala', 'chaveiro',
+                'caixa', 'adesivo', 'convite', 'quadro', 'tag', 'sacola',
+                'bolsa', 'manta', 'toalha', 'almofada', 'topo', 'bolo',
+                'pais', 'maes', 'casamento', 'aniversario', 'batizado',
+                'maternidade', 'infantil', 'porta', 'papel', 'madeira',
+                'tecido', 'feltro', 'biscuit', 'flores', 'arranjo', 'colar',
+                'brinco', 'pulseira', 'anel', 'prata', 'vela', 'sabonete',
+                'difusor', 'necessaire', 'saia', 'vestido', 'body', 'jogo',
+                'lencol', 'berco', 'cracha', 'cordao', 'album', 'fotos',
+                'cesta', 'cha', 'revelacao', 'nome', 'letra', 'painel']
+
+STOP_WORDS = ['de', 'para', 'com', 'e', 'da', 'do', 'em']
+
+ONSETS = ['', 'b', 'c', 'd', 'f', 'g', 'l', 'm', 'n', 'p', 'r', 's', 't', 'v',
+          'ch', 'lh', 'nh', 'br', 'cr', 'pr', 'tr', 'gr', 'fl']
+VOWELS = ['a', 'e', 'i', 'o', 'u', 'a', 'e', 'o', 'ã', 'é', 'ó', 'ê', 'í']
+CODAS = ['', '', '', '', 's', 'r', 'l', 'm', 'n']
+SUFFIXES = ['', '', '', 'inha', 'inho', 'ção', 'ado', 'ada', 'eiro', 'ento']
+
+
+def make_vocabulary(size, rng):
+    """
+    Returns 'size' distinct Portuguese-like words. The first
+    ones are common words of the elo7 catalog, the remaining
+    are built from random syllables.
+    """
+    words = list(COMMON_WORDS[:size])
+    seen = set(words)
+    while len(words) < size:
+        n_syl = rng.integers(1, 4)
+        word = ''.join(ONSETS[rng.integers(len(ONSETS))]\
+                       + VOWELS[rng.integers(len(VOWELS))]\
+                       + CODAS[rng.integers(len(CODAS))] for _ in range(n_syl))
+        word += SUFFIXES[rng.integers(len(SUFFIXES))]
+        if len(word) > 2 and word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words
+
+
+class CatalogGenerator():
+
+    def __init__(self, seed=0, vocab_size=None, zipf_s=1.1):
+        """
+        Generator of synthetic datasets with the same schema as
+        elo7_recruitment_dataset (see COLUMNS). Words of titles,
+        tags and queries follow a Zipfian distribution (exponent
+        'zipf_s') over the vocabulary, partly shifted by category
+        so that each category has its own frequent terms. Queries
+        are made from words of the product they point to. The
+        same seed always yields the same catalog.
+        """
+        self.seed = seed
+        self.vocab_size = vocab_size
+        self.zipf_s = zipf_s
+
+
+    def generate(self, n_rows, chunk_size=100000):
+        """
+        Yields the catalog as DataFrames of at most 'chunk_size' rows
+        """
+        rng = np.random.default_rng(self.seed)
+        vocab_size = self.vocab_size or int(min(200000, 2000 + 200*np.sqrt(n_rows)))
+        vocab = np.array(make_vocabulary(vocab_size, rng), dtype=object)
+        cdf = np.cumsum(1.0/np.arange(1, vocab_size+1)**self.zipf_s)
+        self._vocab, self._cdf = vocab, cdf/cdf[-1]
+        n_sellers = max(1, n_rows//20)
+        product_ids = rng.permutation(n_rows)*7 + rng.integers(1000000, 1000007)
+        for start in range(0, n_rows, chunk_size):
+            ids = product_ids[start:start+chunk_size]
+            yield self._chunk(rng, ids, n_sellers)
+
+
+    def write(self, path, n_rows, chunk_size=100000):
+        """
+        Writes a catalog of 'n_rows' rows to a csv file
+        """
+        tmp_path = path + '.tmp'
+        header = True
+        for chunk in self.generate(n_rows, chunk_size):
+            chunk.to_csv(tmp_path, mode='w' if header else 'a',
+                         header=header, index=False)
+            header = False
+        os.replace(tmp_path, path)
+        return path
+
+
+    def _chunk(self, rng, ids, n_sellers):
+        n = len(ids)
+        cats = rng.choice(len(CATEGORIES), size=n, p=CATEGORY_WEIGHTS)
+        titles = self._texts(rng, cats, 2, 8, capitalize=True)
+        tags = self._texts(rng, cats, 1, 12)
+        queries = []
+        for title, tag in zip(titles, tags):
+            words = [w for w in (title+' '+tag).lower().split() if w not in STOP_WORDS]
+            n_words = min(len(words), rng.integers(1, 4))
+            queries.append(' '.join(rng.choice(words, size=n_words, replace=False)))
+        dates = np.datetime64('2015-01-01') + rng.integers(0, 5*365*86400, size=n)\
+                .astype('timedelta64[s]')
+        weight = np.round(rng.lognormal(5, 1.5, size=n))
+        weight[rng.random(n) < 0.02] = np.nan
+        orders = np.round(rng.lognormal(2.5, 1.4, size=n))
+        orders[rng.random(n) < 0.5] = np.nan
+        return pd.DataFrame({
+            'product_id': ids,
+            'seller_id': rng.integers(1, n_sellers+1, size=n)*13 + 100000,
+            'query': queries,
+            'search_page': np.minimum(rng.geometric(0.6, size=n), 5),
+            'position': rng.integers(0, 39, size=n),
+            'title': titles,
+            'concatenated_tags': tags,
+            'creation_date': pd.Series(dates).dt.strftime('%Y-%m-%d %H:%M:%S'),
+            'price': np.round(rng.lognormal(4, 0.9, size=n), 2),
+            'weight': weight,
+            'express_delivery': (rng.random(n) < 0.8).astype(int),
+            'minimum_quantity': rng.choice([1, 1, 2, 4, 5, 6, 10, 20, 50, 100], size=n),
+            'view_counts': np.round(rng.lognormal(5.5, 1.3, size=n)).astype(int),
+            'order_counts': orders,
+            'category': np.array(CATEGORIES, dtype=object)[cats]},
+            columns=COLUMNS)
+
+
+    def _texts(self, rng, cats, min_words, max_words, capitalize=False):
+        """
+        Returns one text per category in 'cats', with a random
+        number of Zipf distributed words (and some stop words)
+        """
+        n = len(cats)
+        lengths = rng.integers(min_words, max_words+1, size=n)
+        ranks = np.searchsorted(self._cdf, rng.random(lengths.sum()))
+        shifted = rng.random(len(ranks)) < 0.5
+        owners = np.repeat(cats, lengths)
+        ranks[shifted] = (ranks[shifted] + 97*owners[shifted]) % len(self._vocab)
+        words = self._vocab[ranks]
+        stops = rng.random(len(words)) < 0.1
+        words[stops] = rng.choice(STOP_WORDS, size=stops.sum())
+        bounds = np.concatenate(([0], np.cumsum(lengths)))
+        texts = [' '.join(words[bounds[i]:bounds[i+1]]) for i in range(n)]
+        if capitalize:
+            texts = [t[:1].upper() + t[1:] for t in texts]
+        return texts
+
+
+
+if __name__=="__main__":
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    path = os.path.abspath("data/synthetic_{}.csv".format(n_rows))
+    CatalogGenerator().write(path, n_rows)
+    print(">>> Catalog written to", path)
@@ -0,0 +1,143 @@
+import os
+import json
+import time
+import socket
+import asyncio
+import argparse
+import multiprocessing
+from urllib.parse import urlencode
+import benchmarks.run as bch
+
+
+async def request(reader, writer, path):
+    """
+    Sends a GET request over a kept-alive connection and
+    returns its status and decoded JSON body
+    """
+    writer.write('GET {} HTTP/1.1\r\nHost: localhost\r\n\r\n'.format(path).encode('latin-1'))
+    await writer.drain()
+    head = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+    status = int(head[0].split(' ')[1])
+    length = 0
+    for line in head[1:]:
+        name, _, value = line.partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    body = await reader.readexactly(length)
+    return status, json.loads(body)
+
+
+async def load_test(host, port, queries, concurrency=32, k=10, filters=None):
+    """
+    Sends every query of a list to a search server, from
+    'concurrency' clients with a kept-alive connection each,
+    and returns the latency statistics of the answered
+    searches, the count of each response status and the
+    achieved throughput
+    """
+    filters = filters or {}
+    latencies, statuses = [], {}
+    queue = asyncio.Queue()
+    for query in queries:
+        queue.put_nowait(query)
+
+    async def client():
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            while not queue.empty():
+                query = queue.get_nowait()
+                path = '/search?' + urlencode(dict(filters, q=query, k=k))
+                start = time.perf_counter()
+                status, _ = await request(reader, writer, path)
+                if status == 200:
+                    latencies.append(time.perf_counter() - start)
+                statuses[status] = statuses.get(status, 0) + 1
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    result = bch.latency_stats(latencies) if latencies else {'queries': 0}
+    result['status'] = {str(s): n for s, n in sorted(statuses.items())}
+    result['throughput_qps'] = len(latencies)/elapsed if elapsed > 0 else 0.0
+    return result
+
+
+def free_port(host='127.0.0.1'):
+    with socket.socket() as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+def serve(dataset_path, port, options):
+    """
+    Runs a search server over a dataset (in a worker process)
+    """
+    import src.indexer as idx
+    import src.searcher as sch
+    import src.server as srv
+    searcher = sch.Searcher(idx.Indexer(dataset_path), cache_size=0)
+    srv.SearchServer(searcher, port=port, **options).run()
+
+
+async def wait_ready(host, port, timeout=120):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+            status, _ = await request(reader, writer, '/health')
+            writer.close()
+            if status == 200:
+                return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.2)
+
+
+def run(dataset_path, num_queries=1000, concurrency=32, seed=0, windows=(0, 2)):
+    """
+    Load-tests a local server over a dataset once per batching
+    window (0 disables micro-batching), with the unfiltered and
+    filtered queries of the search benchmark (see
+    run.make_queries()). The server runs in its own process.
+    """
+    queries = bch.make_queries(dataset_path, num_queries, seed)
+    context = multiprocessing.get_context('spawn')
+    report = {'dataset': os.path.basename(dataset_path), 'concurrency': concurrency,
+              'environment': bch.environment(), 'windows': {}}
+    for window in windows:
+        port = free_port()
+        options = {'batch_window_ms': window, 'max_batch': 64 if window else 1}
+        server = context.Process(target=serve, args=(dataset_path, port, options),
+                                 daemon=True)
+        server.start()
+        try:
+            asyncio.run(wait_ready('127.0.0.1', port))
+            result = {}
+            for kind in ['unfiltered', 'filtered']:
+                batch, filters = queries[kind]
+                result[kind] = asyncio.run(load_test('127.0.0.1', port, batch, concurrency,
+                                                     filters=filters))
+            report['windows'][str(window)] = result
+        finally:
+            server.terminate()
+            server.join()
+    return report
+
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description='Load-tests the HTTP search server '
+                                     'on localhost.')
+    parser.add_argument('dataset')
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--windows', type=float, nargs='+', default=[0, 2],
+                        help='micro-batching windows (ms) to compare; 0 disables it')
+    args = parser.parse_args()
+    report = run(os.path.abspath(args.dataset), args.queries, args.concurrency,
+                 args.seed, args.windows)
+    print(json.dumps(report, indent=2, sort_keys=True))
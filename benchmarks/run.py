@@ -0,0 +1,461 @@
+import os
+import sys
+import json
+import time
+import resource
+import argparse
+import platform
+import subprocess
+import multiprocessing
+import numpy as np
+import pandas as pd
+import benchmarks.catalog as ctl
+
+
+SIZES = [10000, 100000, 1000000]
+
+FILTERS = {'price_max': 100, 'category': 'Lembrancinhas'}
+
+COLD_START_BUDGET_S = 1.0
+
+COLD_START = '''
+import time, json
+start = time.perf_counter()
+import src.indexer as idx
+import src.searcher as sch
+imported = time.perf_counter()
+indexer = idx.Indexer({path!r})
+loaded = time.perf_counter()
+sch.Searcher(indexer).search({query!r})
+done = time.perf_counter()
+print(json.dumps([imported-start, loaded-imported, done-loaded]))
+'''
+
+FOOTPRINT = '''
+import json
+import benchmarks.run as bch
+import src.indexer as idx
+import src.searcher as sch
+before = bch.rss_mb()
+indexer = idx.Indexer({path!r}, precision={precision!r})
+indexer.warm()
+warmed = bch.rss_mb()
+sch.Searcher(indexer, cache_size=0).search_many({queries!r}, {k})
+print(json.dumps([warmed - before, bch.rss_mb() - before]))
+'''
+
+
+def rss_mb():
+    """
+    Returns the resident set size of this process, in MB
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+
+def latency_stats(latencies):
+    """
+    Summarizes a list of latencies (seconds) in milliseconds
+    """
+    latencies = np.array(latencies) * 1000
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {'queries': len(latencies),
+            'mean_ms': float(latencies.mean()),
+            'p50_ms': float(p50),
+            'p95_ms': float(p95),
+            'p99_ms': float(p99),
+            'qps': float(1000*len(latencies)/latencies.sum())}
+
+
+def make_queries(dataset_path, num_queries, seed):
+    """
+    Samples the queries of a benchmark from the 'query' column
+    of a dataset. Multi-term queries join two or three of them;
+    conjunctive ones require all of their words (see query.parse()).
+    """
+    rng = np.random.default_rng(seed)
+    queries = pd.read_csv(dataset_path, usecols=['query'])['query'].dropna().tolist()
+    single = [queries[i] for i in rng.integers(len(queries), size=num_queries)]
+    multi = [' '.join(queries[j] for j in rng.integers(len(queries), size=rng.integers(2, 4)))\
+             for _ in range(num_queries)]
+    return {'unfiltered': (single, {}),
+            'filtered': (single, FILTERS),
+            'multi_term': (multi, {}),
+            'conjunctive': ([' AND '.join(q.split()) for q in multi], {})}
+
+
+def bench_build(dataset_path, workers=1, instrument=False):
+    """
+    Builds the index of a dataset from scratch. Runs in a fresh
+    process (see isolated()), so that the peak RSS is its own.
+    With 'instrument', the time of each build stage is reported.
+    """
+    import src.indexer as idx
+    import src.instrumentation as ins
+    index_path = dataset_path[:-4] + '_processed.idx'
+    if os.path.exists(index_path):
+        os.remove(index_path)
+    instrumentation = ins.Instrumentation() if instrument else None
+    start = time.perf_counter()
+    indexer = idx.Indexer(dataset_path, workers=workers, instrumentation=instrumentation)
+    build_time = time.perf_counter() - start
+    result = {'build_s': build_time,
+              'documents': int(indexer.n_doc),
+              'vocabulary': len(indexer.word_idx),
+              'postings': int(len(indexer.inverted_index.data)),
+              'disk_mb': os.path.getsize(index_path) / 2**20,
+              'peak_rss_mb': peak_rss_mb()}
+    if instrument:
+        result['build_stats'] = _stats(instrumentation.snapshot())
+    return result
+
+
+def bench_search(dataset_path, num_queries=1000, seed=0, instrument=False):
+    """
+    Loads a built index and measures the latency of each kind
+    of query (see make_queries()), with the result cache
+    disabled. Memory is measured after loading and after
+    all queries, when the used sections have been paged in.
+    With 'instrument', the time of each search stage and the
+    search counters are reported for each kind of query.
+    Results of the default (cosine) ranking are reported at the
+    top level, the ones of the other rankings under their name.
+    """
+    base_rss = rss_mb()
+    import src.indexer as idx
+    import src.searcher as sch
+    import src.instrumentation as ins
+    modules_rss = rss_mb()
+    start = time.perf_counter()
+    indexer = idx.Indexer(dataset_path)
+    load_time = time.perf_counter() - start
+    loaded_rss = rss_mb()
+    instrumentation = ins.Instrumentation() if instrument else None
+    queries = make_queries(dataset_path, num_queries, seed)
+    result = {'load_s': load_time,
+              'rss_base_mb': base_rss,
+              'rss_modules_mb': modules_rss,
+              'rss_loaded_mb': loaded_rss}
+    for ranking in sch.Searcher.RANKINGS:
+        searcher = sch.Searcher(indexer, cache_size=0, instrumentation=instrumentation,
+                                ranking=ranking)
+        target = result if ranking == 'cosine' else result.setdefault(ranking, {})
+        for kind, (batch, filters) in queries.items():
+            latencies = []
+            for query in batch:
+                start = time.perf_counter()
+                searcher.search(query, **filters)
+                latencies.append(time.perf_counter() - start)
+            target[kind] = latency_stats(latencies)
+            if instrument:
+                target[kind]['stats'] = _stats(instrumentation.snapshot())
+                instrumentation.reset()
+    result['rss_queried_mb'] = rss_mb()
+    result['index_rss_mb'] = result['rss_queried_mb'] - modules_rss
+    return result
+
+
+def bench_precision(dataset_path, num_queries=1000, seed=0, k=10):
+    """
+    Measures, for each precision of the cosine scoring weights
+    (see weights.DocWeights), their size, the latency of the
+    unfiltered and multi-term queries and the mean overlap of
+    their top-k with the one of full precision weights. The
+    resident memory of the whole index, loaded and warmed in a
+    new interpreter, is reported as warm_rss_mb, and after
+    running the queries as index_rss_mb.
+    """
+    import src.indexer as idx
+    import src.searcher as sch
+    import src.weights as wgt
+    queries = make_queries(dataset_path, num_queries, seed)
+    result, reference = {}, {}
+    for precision in wgt.PRECISIONS:
+        indexer = idx.Indexer(dataset_path, precision=precision)
+        searcher = sch.Searcher(indexer, cache_size=0)
+        if indexer.doc_weights is None:
+            matrix = indexer.tfidf_index
+            size = matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+        else:
+            size = indexer.doc_weights.nbytes()
+        warmed, searched = index_footprint(dataset_path, precision,
+                                           queries['unfiltered'][0], k)
+        target = result.setdefault(precision, {'weights_mb': size / 2**20,
+                                               'warm_rss_mb': warmed,
+                                               'index_rss_mb': searched})
+        for kind in ['unfiltered', 'multi_term']:
+            batch, filters = queries[kind]
+            latencies, rankings = [], []
+            for query in batch:
+                start = time.perf_counter()
+                rankings.append(searcher.search(query, k, **filters))
+                latencies.append(time.perf_counter() - start)
+            reference.setdefault(kind, rankings)
+            overlap = [len(set(r) & set(f)) / max(len(f), 1)\
+                       for r, f in zip(rankings, reference[kind])]
+            target[kind] = dict(latency_stats(latencies), overlap=float(np.mean(overlap)))
+    return {'precision': result}
+
+
+def index_footprint(dataset_path, precision, queries, k=10):
+    """
+    Returns the growth of the resident memory, in MB, of a new
+    interpreter that loads the stored index with the given
+    precision and warms it, and after it runs the queries
+    """
+    script = FOOTPRINT.format(path=dataset_path, precision=precision,
+                              queries=list(queries), k=k)
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    output = subprocess.run([sys.executable, '-c', script], cwd=root, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def make_typos(queries, seed):
+    """
+    Returns the queries with one random edit (deletion,
+    insertion, substitution or swap of adjacent letters) in
+    their longest word
+    """
+    rng = np.random.default_rng(seed)
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    typos = []
+    for query in queries:
+        words = query.split()
+        i = max(range(len(words)), key=lambda j: len(words[j])) if words else 0
+        word = words[i] if words else ''
+        if len(word) < 2:
+            typos.append(query)
+            continue
+        pos, edit = int(rng.integers(len(word)-1)), int(rng.integers(4))
+        letter = letters[int(rng.integers(len(letters)))]
+        if edit == 0:
+            word = word[:pos] + word[pos+1:]
+        elif edit == 1:
+            word = word[:pos] + letter + word[pos:]
+        elif edit == 2:
+            word = word[:pos] + letter + word[pos+1:]
+        else:
+            word = word[:pos] + word[pos+1] + word[pos] + word[pos+2:]
+        words[i] = word
+        typos.append(' '.join(words))
+    return typos
+
+
+def bench_fuzzy(dataset_path, num_queries=1000, seed=0, k=10):
+    """
+    Measures fuzzy matching (see fuzzy.DeleteIndex) on the
+    unfiltered queries with a typo each (see make_typos()):
+    the size of the delete index, the latency with and without
+    fuzzy matching, and the mean overlap of the top-k of each
+    with the one of the queries without typos
+    """
+    import src.indexer as idx
+    import src.searcher as sch
+    indexer = idx.Indexer(dataset_path, fuzzy=True)
+    queries = make_queries(dataset_path, num_queries, seed)['unfiltered'][0]
+    typos = make_typos(queries, seed)
+    reference = sch.Searcher(indexer, cache_size=0).search_many(queries, k)
+    result = {'entries': len(indexer.fuzzy_index),
+              'index_mb': indexer.fuzzy_index.nbytes() / 2**20}
+    for name, fuzzy in [('exact', False), ('fuzzy', True)]:
+        searcher = sch.Searcher(indexer, cache_size=0, fuzzy=fuzzy)
+        latencies, overlap = [], []
+        for typo, expected in zip(typos, reference):
+            start = time.perf_counter()
+            ranking = searcher.search(typo, k)
+            latencies.append(time.perf_counter() - start)
+            overlap.append(len(set(ranking) & set(expected)) / max(len(expected), 1))
+        result[name] = dict(latency_stats(latencies), overlap=float(np.mean(overlap)))
+    return {'fuzzy': result}
+
+
+def bench_facets(dataset_path, num_queries=1000, seed=0, k=10):
+    """
+    Measures the latency of the unfiltered queries with and
+    without facets (see searcher.Searcher.search_faceted()),
+    along with the mean number of products they are counted on
+    """
+    import src.indexer as idx
+    import src.searcher as sch
+    indexer = idx.Indexer(dataset_path)
+    searcher = sch.Searcher(indexer, cache_size=0)
+    queries = make_queries(dataset_path, num_queries, seed)['unfiltered'][0]
+    plain, faceted, counted = [], [], []
+    for query in queries:
+        start = time.perf_counter()
+        searcher.search(query, k)
+        plain.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        _, facets = searcher.search_faceted([query], k)[0]
+        faceted.append(time.perf_counter() - start)
+        counted.append(sum(facets['category'].values()))
+    return {'facets': {'plain': latency_stats(plain),
+                       'faceted': latency_stats(faceted),
+                       'mean_candidates': float(np.mean(counted))}}
+
+
+def bench_suggest(dataset_path, num_queries=1000, seed=0, k=10):
+    """
+    Measures the typeahead completions (see suggestions.Suggester)
+    of a built index: their memory, the time to open them and
+    the latency of completing every prefix of the sampled
+    queries, as they would be typed
+    """
+    import src.indexer as idx
+    indexer = idx.Indexer(dataset_path)
+    start = time.perf_counter()
+    suggestions = indexer.suggestions
+    load_time = time.perf_counter() - start
+    single = make_queries(dataset_path, num_queries, seed)['unfiltered'][0]
+    prefixes = [query[:i] for query in single for i in range(1, len(query)+1)]
+    latencies = []
+    for prefix in prefixes:
+        start = time.perf_counter()
+        indexer.suggest(prefix, k)
+        latencies.append(time.perf_counter() - start)
+    return {'suggest': dict(latency_stats(latencies), load_s=load_time,
+                            keys=len(suggestions),
+                            precomputed_prefixes=len(suggestions.prefixes),
+                            memory_mb=suggestions.nbytes() / 2**20)}
+
+
+def _stats(snapshot):
+    """
+    Keeps the aggregated part of an instrumentation snapshot
+    """
+    stages = {name: stage['total_ms'] for name, stage in snapshot['stages'].items()}
+    return dict(snapshot['counters'], stages_ms=stages, **snapshot['ratios'])
+
+
+def bench_cold_start(dataset_path, query='lembrancinha personalizada'):
+    """
+    Measures the time from starting a new interpreter to the
+    result of its first query, on an already built index
+    """
+    script = COLD_START.format(path=dataset_path, query=query)
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', script], cwd=root, check=True,
+                            capture_output=True, text=True).stdout
+    total = time.perf_counter() - start
+    imports, load, first_query = json.loads(output.strip().splitlines()[-1])
+    return {'cold_start_s': total,
+            'cold_import_s': imports,
+            'cold_load_s': load,
+            'cold_first_query_s': first_query,
+            'cold_start_within_budget': total <= COLD_START_BUDGET_S}
+
+
+def isolated(func, *args):
+    """
+    Runs func(*args) in a new interpreter and returns its result
+    """
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(1) as pool:
+        return pool.apply(func, args)
+
+
+def run(sizes, data_dir, num_queries=1000, seed=0, workers=1, isolate=True,
+        instrument=False):
+    """
+    Runs the benchmark for each catalog size. Synthetic catalogs
+    are generated once (with 'seed') and kept in 'data_dir'.
+    Returns a dict that can be dumped as JSON.
+    """
+    call = isolated if isolate else (lambda func, *args: func(*args))
+    os.makedirs(data_dir, exist_ok=True)
+    report = {'environment': environment(), 'seed': seed, 'sizes': {}}
+    for n_rows in sizes:
+        path = os.path.join(data_dir, 'synthetic_{}_{}.csv'.format(n_rows, seed))
+        if not os.path.exists(path):
+            print('>>> Generating a catalog with {} products...'.format(n_rows))
+            ctl.CatalogGenerator(seed).write(path, n_rows)
+        print('>>> Benchmarking {}...'.format(os.path.basename(path)))
+        result = {'rows': n_rows, 'csv_mb': os.path.getsize(path) / 2**20}
+        result.update(call(bench_build, path, workers, instrument))
+        result.update(call(bench_search, path, num_queries, seed, instrument))
+        result.update(call(bench_precision, path, num_queries, seed))
+        result.update(call(bench_suggest, path, num_queries, seed))
+        result.update(call(bench_facets, path, num_queries, seed))
+        result.update(call(bench_fuzzy, path, num_queries, seed))
+        result.update(bench_cold_start(path))
+        report['sizes'][str(n_rows)] = result
+    return report
+
+
+def compare(old, new, threshold=0.1):
+    """
+    Returns the metrics of two reports (as dumped by run())
+    whose relative change exceeds 'threshold', as tuples of
+    (size, metric, old value, new value)
+    """
+    changes = []
+    for size, result in new['sizes'].items():
+        before = _flatten(old['sizes'].get(size, {}))
+        for metric, value in _flatten(result).items():
+            if metric in before and before[metric]:
+                if abs(value-before[metric])/abs(before[metric]) > threshold:
+                    changes.append((size, metric, before[metric], value))
+    return changes
+
+
+def _flatten(result, prefix=''):
+    flat = {}
+    for key, value in result.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, prefix+key+'.'))
+        else:
+            flat[prefix+key] = value
+    return flat
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                                capture_output=True, text=True,
+                                cwd=os.path.dirname(__file__)).stdout.strip()
+    except OSError:
+        commit = ''
+    return {'commit': commit or None,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count()}
+
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description='Benchmarks the search engine '
+                                     'on synthetic elo7-format catalogs.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--data-dir', default=os.path.abspath('data/bench'))
+    parser.add_argument('--instrument', action='store_true',
+                        help='report the time of each build and search stage')
+    parser.add_argument('--output', default=os.path.abspath('data/bench/results.json'))
+    parser.add_argument('--compare', help='previous results (JSON) to compare with')
+    args = parser.parse_args()
+    report = run(args.sizes, args.data_dir, args.queries, args.seed, args.workers,
+                 instrument=args.instrument)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write('\n')
+    print('>>> Results written to', args.output)
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        for size, metric, before, after in compare(previous, report):
+            print('{:>8} {:<24} {:>12.4f} -> {:>12.4f} ({:+.1%})'\
+                  .format(size, metric, before, after, (after-before)/before))
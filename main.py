@@ -1,6 +1,7 @@
 import src.indexer as idx
 import src.searcher as sch
 import src.evaluator as evl
+import src.instrumentation as ins
 import os
 
 
@@ -16,23 +17,27 @@ def main():
             if dataset == "":
                 dataset = datapath
             try:
-                indexer = idx.Indexer(dataset)
+                indexer = idx.Indexer(dataset, positions=True)
             except Exception as e:
                 print('>>> Error while trying to read the dataset: {}\n'.format(e))
                 dataset = ""
         else:
             if prog_mode == "":
-                engine = sch.Searcher(indexer)
-                evaluator = evl.Evaluator(dataset, engine)
+                instrumentation = ins.Instrumentation(slow_query_ms=100)
+                engine = sch.Searcher(indexer, instrumentation=instrumentation)
                 prog_mode = input('>>> Do you wish run the search engine or the evaluator? [search engine]:\n')
                 if prog_mode == '' or prog_mode == 'search engine':
                     prog_mode = 'search_engine'
                 elif prog_mode == 'evaluator':
+                    evaluator = evl.Evaluator(dataset, engine)
                     prog_mode = 'evaluator'
             elif prog_mode == 'search_engine':
-                query = input('>>> Enter your query, type "-o" to show query options, or "-q" to quit:\n')
+                query = input('>>> Enter your query, type "-o" to show query options, "-s" to show statistics, or "-q" to quit:\n')
                 if query == '-o':
                     print('>>> Query usage: query [OPTION] \n'
+                        +'    "words in a row": match an exact phrase\n'
+                        +'    title:word, tags:word, title:"words in a row": match only in a field\n'
+                        +'    word AND word: match only products having both words\n'
                         +'    --prods_to_show=[int]: limit the number of returned items [default: 10]\n'
                         +'    --seller_id=[int]: filter by seller==#\n'
                         +'    --title=[str]: filter by exact title match\n'
@@ -43,28 +48,63 @@ def main():
                         +'    --express_delivery=[bool]: show only items with express delivery option\n'
                         +'    --min_quantity=[int]: filter by minimum purchase quantity\n'
                         +'    --category=[str]: filter by a valid category\n')
+                elif query == '-s':
+                    print('\n' + ins.format_snapshot(engine.stats()) + '\n')
                 elif query == '-q':
                     break
                 else:
                     query = query.split('--')
                     result = ""
-                    if len(query) > 1:
-                        kwargs = {}
-                        for param in query[1:]:
-                            key,value = param.split('=')
-                            kwargs[key] = value
-                        result = engine.search(query[0], **kwargs)
-                    else:
-                        result = engine.search(query[0])
+                    try:
+                        if len(query) > 1:
+                            kwargs = {}
+                            for param in query[1:]:
+                                key,value = param.split('=')
+                                kwargs[key] = value
+                            result = engine.search(query[0], **kwargs)
+                        else:
+                            result = engine.search(query[0])
+                    except ValueError as e:
+                        print('>>> Invalid query: {}\n'.format(e))
+                        continue
                     print("\n>>> Returned products: {}\n".format(result))
             elif prog_mode == 'evaluator':            
-                query = input('>>> How many random queries do you wish to evaluate, or type "-q" to quit [500]:\n')
-                if query == "":
-                    query = 500
+                query = input('>>> How many random queries do you wish to evaluate, type "-o" to show options, or "-q" to quit [500]:\n')
+                if query == '-o':
+                    print('>>> Evaluator usage: num_queries [OPTION] \n'
+                        +'    --seed=[int]: seed of the query sampler [default: random]\n'
+                        +'    --workers=[int]: number of worker processes [default: 1]\n'
+                        +'    --batch_size=[int]: queries ranked together [default: 1]\n'
+                        +'    --limit=[int]: number of returned items [default: 190]\n'
+                        +'    --ranking=[cosine|bm25|all]: ranking to evaluate, "all" compares them [default: cosine]\n'
+                        +'    --precision=[float32|float16|int8]: compare the cosine ranking over reduced precision weights with float64\n')
+                    continue
                 elif query == '-q':
-                    break 
-                err, rmse, std = evaluator.evaluate(int(query))
-                evaluator.show_eval(rmse, std, err)
+                    break
+                query = query.split('--')
+                kwargs = {}
+                for param in query[1:]:
+                    key,value = param.split('=')
+                    kwargs[key.strip()] = value.strip()
+                evaluator.seed = int(kwargs['seed']) if 'seed' in kwargs else None
+                evaluator.workers = int(kwargs.get('workers', 1))
+                evaluator.batch_size = int(kwargs.get('batch_size', 1))
+                num_queries = int(query[0]) if query[0].strip() else 500
+                limit = int(kwargs.get('limit', 190))
+                ranking = kwargs.get('ranking', 'cosine')
+                precision = kwargs.get('precision')
+                if precision is not None:
+                    engines = {'float64': sch.Searcher(indexer),
+                               precision: sch.Searcher(idx.Indexer(dataset, precision=precision))}
+                    evaluator.show_comparison(evaluator.compare(engines, num_queries, limit),
+                                              reference='float64')
+                elif ranking == 'all':
+                    engines = {r: sch.Searcher(indexer, ranking=r) for r in sch.Searcher.RANKINGS}
+                    evaluator.show_comparison(evaluator.compare(engines, num_queries, limit))
+                else:
+                    evaluator.engine = sch.Searcher(indexer, ranking=ranking)
+                    report = evaluator.evaluate(num_queries, limit)
+                    evaluator.show_eval(report, plot=True)
 
 
 ##############
@@ -0,0 +1,92 @@
+import re
+import functools
+import unidecode
+
+
+TOKEN_RE = re.compile(r"\w+(?:(?:[-'./]|,(?=\d))\w+)*|[^\w\s]")
+NUMBER_RE = re.compile(r"(?:\d+\.?\d*|\.\d+)(?:e[+-]?\d+)?")
+
+
+class Analyzer():
+
+    def __init__(self, stop_words, stemmer, cache_size=100000):
+        """
+        Text analysis pipeline shared by indexing and searching.
+        Text is lowercased and split by a precompiled regex, then
+        every token goes through unidecode, number to word
+        conversion, stop word removal and stemming. The stems
+        produced for each raw token are memoized in a bounded
+        LRU cache of 'cache_size' entries.
+        """
+        self.stop_words = frozenset(stop_words)
+        self.stemmer = stemmer
+        self.cache_size = cache_size
+        self._cached_token = functools.lru_cache(cache_size)(self._analyze_token)
+
+
+    def analyze(self, doc):
+        """
+        Returns the list of stems of a text. Non-string
+        values (e.g. missing fields) produce no stems.
+        """
+        if not type(doc) == str:
+            return []
+        stems = []
+        for token in self.tokenize(doc.lower()):
+            stems += self._cached_token(token)
+        return stems
+
+
+    def tokenize(self, text):
+        """
+        Splits text into word tokens and single
+        punctuation marks
+        """
+        return TOKEN_RE.findall(text)
+
+
+    def number_to_word(self, tokens):
+        """
+        Given a list of tokens, it converts the
+        numeric to written representation. Only tokens
+        that look like numbers are handed to num2words,
+        which is only imported when one is found.
+        """
+        new_tokens = []
+        for t in tokens:
+            if NUMBER_RE.fullmatch(t) is None:
+                new_tokens.append(t)
+                continue
+            from num2words import num2words
+            try:
+                word = num2words(t, lang='pt_BR')
+                new_tokens += self.tokenize(word)
+            except (ArithmeticError, ValueError):
+                new_tokens.append(t)
+        return new_tokens
+
+
+    def cache_info(self):
+        """
+        Returns the hit/miss statistics of the token cache
+        """
+        return self._cached_token.cache_info()
+
+
+    def _analyze_token(self, token):
+        text = unidecode.unidecode(token)
+        text = self.number_to_word(self.tokenize(text))
+        return tuple(self.stemmer.stem(w) for w in text if\
+                     (w not in self.stop_words) and (len(w) > 1))
+
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_cached_token']
+        return state
+
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        cached = functools.lru_cache(self.cache_size)(self._analyze_token)
+        self._cached_token = cached
@@ -0,0 +1,315 @@
+import numpy as np
+import src.storage as stg
+
+
+COLUMNS = {'seller_id': 'int',
+           'title': 'str',
+           'price': 'float',
+           'weight': 'float',
+           'express_delivery': 'bool',
+           'minimum_quantity': 'float',
+           'category': 'str'}
+
+FILTERS = {'seller_id': ('seller_id', 'eq'),
+           'title': ('title', 'eq'),
+           'price_min': ('price', 'min'),
+           'price_max': ('price', 'max'),
+           'weight_min': ('weight', 'min'),
+           'weight_max': ('weight', 'max'),
+           'express_delivery': ('express_delivery', 'eq'),
+           'min_quantity': ('minimum_quantity', 'min'),
+           'category': ('category', 'eq')}
+
+FACET_SIZE = 10
+
+FACET_BUCKETS = {'price': [0, 25, 50, 100, 200, 500],
+                 'weight': [0, 100, 250, 500, 1000, 5000]}
+
+
+class AttributeStore():
+
+    def __init__(self, columns, categories):
+        """
+        Typed columns of the document attributes used by query
+        filters, indexed by document ordinal (see COLUMNS).
+        String columns are stored as integer codes into
+        'categories'. Every column has a sorted index (the
+        argsort of its values), so that both range and equality
+        filters are answered by binary search. Documents added
+        after the store was built (see append()) are kept in an
+        unindexed tail and checked directly.
+        """
+        self.columns = columns
+        self.categories = categories
+        self.codes = {name: {c:i for i,c in enumerate(cats)}\
+                      for name, cats in categories.items()}
+        self.orders = {}
+        self.sorted = {}
+        self.tail = {name: [] for name in COLUMNS}
+        self._dense_codes = {}
+
+
+    @classmethod
+    def from_documents(cls, documents):
+        """
+        Builds the store from a list of documents (dicts),
+        in ordinal order
+        """
+        store = cls({}, {name: [] for name, kind in COLUMNS.items() if kind == 'str'})
+        for name, kind in COLUMNS.items():
+            values = [store._encode(name, d.get(name)) for d in documents]
+            store.columns[name] = np.array(values, dtype=_dtype(kind))
+        return store
+
+
+    @classmethod
+    def from_store(cls, documents):
+        """
+        Builds the store from the columns of a document store
+        (see documents.DocumentStore), in ordinal order
+        """
+        store = cls({}, {name: [] for name, kind in COLUMNS.items() if kind == 'str'})
+        for name, kind in COLUMNS.items():
+            column = documents.column(name) if name in documents.fields\
+                     else [None]*len(documents)
+            column = column.tolist() if isinstance(column, np.ndarray) else column
+            values = [store._encode(name, v) for v in column]
+            store.columns[name] = np.array(values, dtype=_dtype(kind))
+        return store
+
+
+    @classmethod
+    def from_index_file(cls, index_file, prefix='attr.'):
+        """
+        Opens a store written by to_sections() (see storage)
+        """
+        columns, categories = {}, {}
+        for name, kind in COLUMNS.items():
+            columns[name] = index_file.array(prefix+name)
+            if kind == 'str':
+                blob = index_file.array(prefix+name+'.categories')
+                offsets = index_file.array(prefix+name+'.categories.offsets')
+                categories[name] = stg.unpack_strings(blob, offsets)
+        store = cls(columns, categories)
+        for name in COLUMNS:
+            store.orders[name] = index_file.array(prefix+name+'.order')
+            store.sorted[name] = index_file.array(prefix+name+'.sorted')
+        return store
+
+
+    def to_sections(self, prefix='attr.'):
+        sections = {}
+        for name, kind in COLUMNS.items():
+            sections[prefix+name] = self.columns[name]
+            sections[prefix+name+'.order'] = self._order(name)
+            sections[prefix+name+'.sorted'] = self.sorted[name]
+            if kind == 'str':
+                blob, offsets, _ = stg.pack_strings(self.categories[name])
+                sections[prefix+name+'.categories'] = blob
+                sections[prefix+name+'.categories.offsets'] = offsets
+        return sections
+
+
+    def append(self, doc):
+        """
+        Appends the attributes of a document to the tail
+        """
+        for name in COLUMNS:
+            self.tail[name].append(self._encode(name, doc.get(name)))
+
+
+    def select(self, live):
+        """
+        Returns a new store holding only the documents of
+        the given boolean mask (tail included); documents
+        appended past the end of the mask are left out
+        """
+        columns = {}
+        for name, kind in COLUMNS.items():
+            n_tail = len(live) - len(self.columns[name])
+            tail = np.array(self.tail[name][:n_tail], dtype=_dtype(kind))
+            columns[name] = np.concatenate((self.columns[name], tail))[live]
+        return AttributeStore(columns, {n: list(c) for n,c in self.categories.items()})
+
+
+    def column(self, name):
+        """
+        Returns the full column of an attribute, tail included
+        """
+        if not self.tail[name]:
+            return self.columns[name]
+        tail = np.array(self.tail[name], dtype=_dtype(COLUMNS[name]))
+        return np.concatenate((self.columns[name], tail))
+
+
+    def mask(self, query_params):
+        """
+        Returns a boolean mask over all document ordinals with the
+        documents that pass every filter in 'query_params' (see
+        FILTERS), or None if none of the parameters is a filter
+        """
+        mask = None
+        for param, value in query_params.items():
+            if param not in FILTERS:
+                continue
+            name, op = FILTERS[param]
+            selected = self._select(name, op, self._parse(name, value))
+            mask = selected if mask is None else mask & selected
+        return mask
+
+
+    def facets(self, ordinals, buckets=None, size=FACET_SIZE):
+        """
+        Returns the facets of a set of document ordinals: the
+        number of documents of each category and of the 'size'
+        sellers having the most of them (most frequent first),
+        and the histograms of price and weight. Histogram buckets
+        are given by their sorted lower bounds ('buckets', name ->
+        bounds, FACET_BUCKETS by default), the last one being
+        open; each bucket is returned as a dict with its 'min',
+        'max' (None for the last one) and 'count'. Each column
+        is gathered once for the whole set.
+        """
+        ordinals = np.asarray(ordinals, dtype=np.int64)
+        unknown = set(buckets or {}) - set(FACET_BUCKETS)
+        if unknown:
+            raise ValueError('No histogram for: {}'.format(', '.join(sorted(unknown))))
+        buckets = dict(FACET_BUCKETS, **(buckets or {}))
+        categories = self.categories['category']
+        codes = self._gather('category', ordinals)
+        counts = np.bincount(codes[codes >= 0], minlength=len(categories))
+        order = np.argsort(-counts, kind='stable')
+        facets = {'category': {categories[c]: int(counts[c])\
+                               for c in order[counts[order] > 0].tolist()}}
+        ids, codes = self._dense('seller_id')
+        counts = np.bincount(codes[ordinals], minlength=len(ids))
+        counts[ids < 0] = 0
+        top = np.argsort(-counts, kind='stable')[:max(size, 0)]
+        top = top[counts[top] > 0]
+        facets['seller_id'] = dict(zip(ids[top].tolist(), counts[top].tolist()))
+        for name in ['price', 'weight']:
+            facets[name] = _histogram(self._gather(name, ordinals), buckets[name])
+        return facets
+
+
+    def normalize(self, query_params):
+        """
+        Returns a canonical, hashable form of the filters in
+        'query_params', with values converted to column types
+        """
+        params = [(p, self._parse(FILTERS[p][0], v))\
+                  for p,v in query_params.items() if p in FILTERS]
+        return tuple(sorted(params))
+
+
+    def __len__(self):
+        return len(self.columns['price']) + len(self.tail['price'])
+
+
+    def _select(self, name, op, value):
+        n_main = len(self.columns[name])
+        mask = np.zeros(len(self), dtype=bool)
+        order = self._order(name)
+        values = self.sorted[name]
+        if op == 'eq':
+            lo = np.searchsorted(values, value, 'left')
+            hi = np.searchsorted(values, value, 'right')
+        elif op == 'min':
+            lo = np.searchsorted(values, value, 'left')
+            hi = np.searchsorted(values, np.nan, 'left')
+        else:
+            lo, hi = 0, np.searchsorted(values, value, 'right')
+        mask[order[lo:hi]] = True
+        if self.tail[name]:
+            tail = np.array(self.tail[name], dtype=_dtype(COLUMNS[name]))
+            if op == 'eq':
+                mask[n_main:] = tail == value
+            elif op == 'min':
+                mask[n_main:] = tail >= value
+            else:
+                mask[n_main:] = tail <= value
+        return mask
+
+
+    def _gather(self, name, ordinals):
+        if not self.tail[name]:
+            return self.columns[name][ordinals]
+        return self.column(name)[ordinals]
+
+
+    def _dense(self, name):
+        """
+        Returns the distinct values of a column, sorted, and the
+        position of the value of each document among them
+        (computed once for the current documents)
+        """
+        if name not in self._dense_codes or len(self._dense_codes[name][1]) != len(self):
+            ids, codes = np.unique(self.column(name), return_inverse=True)
+            self._dense_codes[name] = (ids, codes.astype(np.int32).reshape(-1))
+        return self._dense_codes[name]
+
+
+    def _order(self, name):
+        if name not in self.orders:
+            order = np.argsort(self.columns[name], kind='stable')
+            self.orders[name] = order
+            self.sorted[name] = self.columns[name][order]
+        return self.orders[name]
+
+
+    def _encode(self, name, value):
+        kind = COLUMNS[name]
+        if kind == 'str':
+            if not isinstance(value, str):
+                return -1
+            if value not in self.codes.setdefault(name, {}):
+                self.codes[name][value] = len(self.categories[name])
+                self.categories[name].append(value)
+            return self.codes[name][value]
+        try:
+            return self._parse(name, value)
+        except (TypeError, ValueError):
+            return -1 if kind == 'int' else np.nan
+
+
+    def _parse(self, name, value):
+        """
+        Converts a raw value (possibly a string, as given by the
+        CLI or found in the dataset) to the type of a column.
+        Raises ValueError if the value is not valid.
+        """
+        kind = COLUMNS[name]
+        if kind == 'str':
+            return self.codes[name].get(value, -2)
+        if kind == 'bool':
+            if isinstance(value, str):
+                return int(value.strip().lower() in ['1', 'true', 'yes', 'sim'])
+            return int(bool(value)) if value == value else 0
+        if isinstance(value, str):
+            value = value.replace(',', '.')
+        value = float(value)
+        if kind == 'int':
+            return int(value) if value == value else -1
+        return value
+
+
+
+def _histogram(values, bounds):
+    """
+    Counts the values falling in each bucket starting at one of
+    the (sorted) 'bounds'; missing values and values below the
+    first bound are not counted
+    """
+    bounds = np.asarray(bounds, dtype=np.float64)
+    if bounds.ndim != 1 or not len(bounds) or np.any(np.diff(bounds) <= 0):
+        raise ValueError('Bucket bounds must be increasing: {}'.format(bounds.tolist()))
+    above = [int(np.count_nonzero(values >= bound)) for bound in bounds.tolist()] + [0]
+    counts = [a-b for a, b in zip(above[:-1], above[1:])]
+    maxima = bounds[1:].tolist() + [None]
+    return [{'min': lo, 'max': hi, 'count': n}\
+            for lo, hi, n in zip(bounds.tolist(), maxima, counts)]
+
+
+def _dtype(kind):
+    return {'int': np.int64, 'float': np.float64,
+            'bool': np.int8, 'str': np.int32}[kind]
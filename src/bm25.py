@@ -0,0 +1,205 @@
+import numpy as np
+
+
+K1 = 1.2
+B = 0.75
+
+
+class BM25Index():
+
+    def __init__(self, impacts, upper_bounds, idf, avgdl, k1=K1, b=B):
+        """
+        BM25 weights of an inverted index. 'impacts' is aligned
+        with the postings data of the inverted index: it holds the
+        BM25 score contribution of each (word, document) pair, so
+        scoring a document is a sum of impacts. 'upper_bounds'
+        holds the maximum impact of each word (column), used to
+        skip documents that cannot reach the top-k (see top_k()).
+        """
+        self.impacts = impacts
+        self.upper_bounds = upper_bounds
+        self.idf = idf
+        self.avgdl = avgdl
+        self.k1 = k1
+        self.b = b
+
+
+    @classmethod
+    def from_matrix(cls, tfidf_index, inv_doc_freq, doc_lengths, k1=K1, b=B,
+                    n_doc=None, doc_freq=None, avgdl=None):
+        """
+        Computes the impacts from a N x V tf*idf matrix, whose
+        weights are normalized term frequencies times the
+        (tf*idf) idf of each column, and the number of analyzed
+        words of each document. Impacts follow the order of the
+        matrix in CSC layout (see Indexer._create_inverted_index()).
+        The number of documents, the document frequency of each
+        column and the average length are the ones of the matrix,
+        unless given (e.g. for a shard of a larger corpus).
+        """
+        csc = tfidf_index.tocsc()
+        csc.sort_indices()
+        postings = np.diff(csc.indptr)
+        if n_doc is None:
+            n_doc = csc.shape[0]
+        if doc_freq is None:
+            doc_freq = postings
+        idf = np.log(1 + (n_doc - doc_freq + 0.5)/(doc_freq + 0.5))
+        lengths = np.asarray(doc_lengths, dtype=np.float64)
+        if avgdl is None:
+            avgdl = float(lengths.mean()) if n_doc and lengths.sum() else 1.0
+        cols = np.repeat(np.arange(csc.shape[1]), postings)
+        counts = np.rint(csc.data/inv_doc_freq[cols]*lengths[csc.indices])
+        impacts = weight(counts, lengths[csc.indices], idf[cols], avgdl, k1, b)
+        impacts = impacts.astype(np.float32)
+        upper_bounds = np.zeros(csc.shape[1], dtype=np.float32)
+        nonempty = postings > 0
+        if impacts.size:
+            upper_bounds[nonempty] = np.maximum.reduceat(impacts, csc.indptr[:-1][nonempty])
+        return cls(impacts, upper_bounds, idf, avgdl, k1, b)
+
+
+    @classmethod
+    def from_index_file(cls, index_file, prefix='bm25.'):
+        params = index_file.header['bm25']
+        return cls(index_file.array(prefix+'impacts'),
+                   index_file.array(prefix+'upper_bounds'),
+                   index_file.array(prefix+'idf'),
+                   params['avgdl'], params['k1'], params['b'])
+
+
+    def to_sections(self, prefix='bm25.'):
+        return {prefix+'impacts': self.impacts,
+                prefix+'upper_bounds': self.upper_bounds,
+                prefix+'idf': self.idf}
+
+
+    def params(self):
+        return {'avgdl': self.avgdl, 'k1': self.k1, 'b': self.b}
+
+
+    def word_idf(self, col, n_doc, doc_freq):
+        """
+        Returns the BM25 idf of a column, or computes it from
+        the given counts for words added after the index was built
+        """
+        if col < len(self.idf):
+            return self.idf[col]
+        return np.log(1 + (n_doc - doc_freq + 0.5)/(doc_freq + 0.5))
+
+
+
+def weight(counts, lengths, idf, avgdl, k1=K1, b=B):
+    """
+    BM25 score contribution of words occurring 'counts' times
+    in documents of 'lengths' words
+    """
+    norm = k1*(1 - b + b*lengths/avgdl)
+    return idf*counts*(k1+1)/(counts+norm)
+
+
+def top_k(lists, k, accept=None, seeds=None, prune=True):
+    """
+    Term-at-a-time MaxScore retrieval. 'lists' holds, for each
+    query word, its postings (sorted ordinals), their impacts
+    and the upper bound of those impacts. Words are processed in
+    decreasing order of upper bound. Once the k-th best partial
+    score (theta) exceeds what a document could get from the
+    remaining words, documents not seen yet cannot reach the
+    top-k: the remaining (long, low impact) lists are then only
+    probed for the current candidates, by binary search, and
+    candidates that cannot reach theta anymore are dropped.
+    'accept' is an optional boolean mask of the ordinals that
+    can be returned; 'seeds' (ordinals, scores) are documents
+    scored beforehand. Without 'prune' every posting is scored,
+    with identical results. Returns the ordinals and scores of
+    the top-k, and the number of postings scored.
+    """
+    if seeds is not None:
+        docs, scores = seeds
+        docs, scores = np.array(docs, dtype=np.int64), np.array(scores, dtype=np.float64)
+    else:
+        docs, scores = np.zeros(0, dtype=np.int64), np.zeros(0)
+    if accept is not None:
+        keep = accept[docs]
+        docs, scores = docs[keep], scores[keep]
+    order = sorted(range(len(lists)), key=lambda i: -lists[i][2])
+    remaining = float(sum(lists[i][2] for i in order))
+    scored = 0
+    for i in order:
+        postings, impacts, upper_bound = lists[i]
+        remaining -= upper_bound
+        theta = _kth_score(scores, k) if prune else -np.inf
+        if upper_bound + remaining < theta:
+            scores += _probe(postings, impacts, docs)
+            scored += len(docs)
+        else:
+            if accept is not None:
+                keep = accept[postings]
+                postings, impacts = postings[keep], impacts[keep]
+            docs, scores = _merge(docs, scores, postings, impacts)
+            scored += len(postings)
+        if prune and len(docs) > k:
+            theta = _kth_score(scores, k)
+            keep = scores + remaining + 1e-9 >= theta
+            docs, scores = docs[keep], scores[keep]
+    best = np.lexsort((docs, -scores))[:max(k, 0)]
+    return docs[best], scores[best], scored
+
+
+def top_k_of(lists, k, docs, seeds=None):
+    """
+    Ranks only the given (sorted) ordinals, e.g. the documents
+    matching a conjunctive query, with the same arguments and
+    results as top_k(). Every list is probed for them by binary
+    search instead of being traversed.
+    """
+    docs = np.asarray(docs, dtype=np.int64)
+    scores = np.zeros(len(docs))
+    for postings, impacts, _ in lists:
+        scores += _probe(postings, impacts, docs)
+    if seeds is not None:
+        seed_docs, seed_scores = seeds
+        scores += _probe(np.asarray(seed_docs), np.asarray(seed_scores), docs)
+    best = np.lexsort((docs, -scores))[:max(k, 0)]
+    return docs[best], scores[best], len(docs)*len(lists)
+
+
+def _probe(postings, impacts, docs):
+    """
+    Returns the impact of a postings list for each of the
+    given ordinals (zero where they are missing)
+    """
+    found = np.zeros(len(docs))
+    if not len(postings) or not len(docs):
+        return found
+    pos = np.searchsorted(postings, docs)
+    pos[pos == len(postings)] = 0
+    hit = postings[pos] == docs
+    found[hit] = impacts[pos[hit]]
+    return found
+
+
+def _merge(docs, scores, postings, impacts):
+    """
+    Adds the impacts of a postings list to the (sorted)
+    accumulators, creating the missing ones
+    """
+    if not len(docs):
+        return postings.astype(np.int64), impacts.astype(np.float64)
+    pos = np.searchsorted(docs, postings)
+    found = pos < len(docs)
+    found[found] = docs[pos[found]] == postings[found]
+    scores = scores.copy()
+    scores[pos[found]] += impacts[found]
+    new = ~found
+    docs = np.concatenate((docs, postings[new]))
+    scores = np.concatenate((scores, impacts[new]))
+    order = np.argsort(docs, kind='stable')
+    return docs[order], scores[order]
+
+
+def _kth_score(scores, k):
+    if k <= 0 or len(scores) < k:
+        return -np.inf
+    return np.partition(scores, len(scores)-k)[len(scores)-k]
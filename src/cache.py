@@ -0,0 +1,76 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+class ResultCache():
+
+    def __init__(self, max_size=1024, ttl=300, clock=time.monotonic):
+        """
+        Bounded LRU cache of search results. Entries expire after
+        'ttl' seconds (None disables expiration) and are only
+        valid for the index generation they were computed on.
+        A ranking cached for the top-k also serves any request
+        for fewer products.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def get(self, key, k, generation):
+        """
+        Returns the first 'k' products cached for 'key', or None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry_gen, expires, entry_k, ranking = entry
+                if entry_gen != generation or (expires is not None and\
+                                               self.clock() > expires):
+                    del self._entries[key]
+                elif k <= entry_k or len(ranking) < entry_k:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return ranking[:k]
+            self.misses += 1
+            return None
+
+
+    def put(self, key, k, ranking, generation):
+        """
+        Stores the ranking computed for the top-'k' of 'key'
+        """
+        if self.max_size <= 0:
+            return
+        expires = None if self.ttl is None else self.clock()+self.ttl
+        with self._lock:
+            self._entries[key] = (generation, expires, k, list(ranking))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+    def stats(self):
+        """
+        Returns a snapshot of the cache statistics
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {'size': len(self._entries),
+                    'max_size': self.max_size,
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'hit_rate': self.hits/total if total else 0.0}
@@ -0,0 +1,298 @@
+import numpy as np
+import src.storage as stg
+
+
+INTERN_RATIO = 4
+
+
+class DocumentStore():
+
+    def __init__(self, fields, kinds, columns):
+        """
+        Fields of the indexed products, stored column by column
+        and indexed by document ordinal. Depending on its kind
+        (see from_records()), a column is held as:
+        - int, float: a typed array
+        - str: a utf-8 blob delimited by offsets, with a null
+          mask (see storage.pack_strings())
+        - cat: interned strings, as integer codes (-1 for
+          missing values) into a table of distinct values
+        Only the requested fields of the requested products are
+        decoded (see get() and column()). Products added after
+        the store was built (see append()) are kept as given,
+        in a tail, until the store is rebuilt (see select()).
+        """
+        self.fields = fields
+        self.kinds = kinds
+        self.columns = columns
+        self.tables = {f: stg.unpack_strings(*columns[f][1:])\
+                       for f in fields if kinds[f] == 'cat'}
+        self.tail = []
+
+
+    @classmethod
+    def from_records(cls, records, fields=None):
+        """
+        Builds the store from a list of records (dicts), in
+        ordinal order. Integer and float fields become typed
+        arrays; string fields whose values repeat a lot (fewer
+        than one distinct value every INTERN_RATIO records) are
+        interned, the other ones are packed in a blob.
+        """
+        if fields is None:
+            fields = list(records[0].keys()) if records else []
+        kinds, columns = {}, {}
+        for field in fields:
+            values = [r.get(field, np.nan) for r in records]
+            kinds[field], columns[field] = _pack(values)
+        return cls(fields, kinds, columns)
+
+
+    @classmethod
+    def concatenate(cls, stores):
+        """
+        Builds one store holding the products of a list of
+        stores (built with the same fields, without tails), in
+        order. Numeric columns become float if any store holds
+        floats; string columns stay interned only if every
+        store interned them, with their tables merged.
+        """
+        stores = [s for s in stores if len(s)]
+        if len(stores) <= 1:
+            return stores[0] if stores else cls([], {}, {})
+        fields = list(stores[0].fields)
+        kinds, columns = {}, {}
+        for field in fields:
+            found = {s.kinds[field] for s in stores}
+            if found <= {'int', 'float'}:
+                kinds[field] = 'int' if found == {'int'} else 'float'
+                columns[field] = np.concatenate([s.columns[field] for s in stores])
+            elif found == {'cat'}:
+                table = sorted(set().union(*(s.tables[field] for s in stores)))
+                codes = {v:i for i,v in enumerate(table)}
+                parts = []
+                for s in stores:
+                    remap = np.array([codes[v] for v in s.tables[field]] + [-1], dtype=np.int32)
+                    parts.append(remap[s.columns[field][0]])
+                blob, offsets, _ = stg.pack_strings(table)
+                kinds[field], columns[field] = 'cat', (np.concatenate(parts), blob, offsets)
+            elif found <= {'cat', 'str'}:
+                parts = [s.columns[field] if s.kinds[field] == 'str' else\
+                         stg.pack_strings(s.column(field)) for s in stores]
+                offsets, shift = [], 0
+                for blob, part_offsets, _ in parts:
+                    offsets.append(part_offsets[:-1] + shift)
+                    shift += len(blob)
+                offsets.append(np.array([shift], dtype=np.int64))
+                kinds[field] = 'str'
+                columns[field] = (np.concatenate([p[0] for p in parts]),
+                                  np.concatenate(offsets),
+                                  np.concatenate([p[2] for p in parts]))
+            else:
+                values = []
+                for s in stores:
+                    column = s.column(field)
+                    values += column.tolist() if isinstance(column, np.ndarray) else column
+                kinds[field], columns[field] = _pack(values)
+        return cls(fields, kinds, columns)
+
+
+    @classmethod
+    def from_index_file(cls, index_file, prefix='doc.'):
+        """
+        Opens a store written by to_sections() (see storage)
+        """
+        header = index_file.header
+        fields, kinds = header['doc_fields'], header['doc_kinds']
+        columns = {}
+        for field in fields:
+            name = prefix + field
+            if kinds[field] == 'str':
+                columns[field] = (index_file.array(name), index_file.array(name+'.offsets'),
+                                  index_file.array(name+'.nulls'))
+            elif kinds[field] == 'cat':
+                columns[field] = (index_file.array(name), index_file.array(name+'.table'),
+                                  index_file.array(name+'.table.offsets'))
+            else:
+                columns[field] = index_file.array(name)
+        return cls(fields, kinds, columns)
+
+
+    def to_sections(self, prefix='doc.'):
+        """
+        Returns the arrays to be stored (tail included); the
+        fields and kinds go to the header of the index file
+        """
+        store = self.select(np.ones(len(self), dtype=bool)) if self.tail else self
+        sections = {}
+        for field in store.fields:
+            name, column = prefix + field, store.columns[field]
+            if store.kinds[field] == 'str':
+                sections[name], sections[name+'.offsets'], sections[name+'.nulls'] = column
+            elif store.kinds[field] == 'cat':
+                sections[name], sections[name+'.table'], sections[name+'.table.offsets'] = column
+            else:
+                sections[name] = column
+        return sections
+
+
+    def get(self, ordinal):
+        """
+        Returns the fields of a product as a dict
+        """
+        n_main = self._n_main()
+        if ordinal >= n_main:
+            record = self.tail[ordinal-n_main]
+            return {f: record.get(f, np.nan) for f in self.fields}
+        return {f: self._value(f, ordinal) for f in self.fields}
+
+
+    def column(self, field, ordinals=None):
+        """
+        Returns the values of a field for the given ordinals
+        (all of them by default), as an array for numeric fields
+        and as a list for string fields
+        """
+        if ordinals is None:
+            ordinals = np.arange(len(self))
+        ordinals = np.asarray(ordinals, dtype=np.int64)
+        kind, column = self.kinds[field], self.columns[field]
+        n_main = self._n_main()
+        main = ordinals[ordinals < n_main]
+        tail = [self.tail[o-n_main].get(field, np.nan) for o in ordinals[ordinals >= n_main]]
+        if kind in ['int', 'float']:
+            values = column[main]
+            if tail:
+                tail = np.array(tail)
+                if tail.dtype.kind not in 'iub':
+                    values = values.astype(np.float64)
+                values = np.concatenate((values, tail.astype(values.dtype)))
+            return values
+        return [self._value(field, o) for o in main.tolist()] + tail
+
+
+    def append(self, record):
+        """
+        Appends a product to the tail; it gets the next ordinal
+        """
+        self.tail.append(dict(record))
+
+
+    def select(self, live):
+        """
+        Returns a new store holding only the products of the
+        given boolean mask (tail included), without a tail
+        """
+        rows = np.flatnonzero(live[:self._n_main()])
+        keep = [r for r, k in zip(self.tail, live[self._n_main():]) if k]
+        columns, kinds = {}, {}
+        for field in self.fields:
+            kind, column = self.kinds[field], self.columns[field]
+            tail_kind, tail = _pack([r.get(field, np.nan) for r in keep], kind)
+            if kind in ['int', 'float']:
+                values = column[rows]
+                if kind == 'int' and tail_kind == 'float':
+                    kind, values = tail_kind, values.astype(np.float64)
+                kinds[field] = kind
+                columns[field] = np.concatenate((values, tail.astype(values.dtype)))
+            elif kind == 'str':
+                blob, offsets, nulls = _take_strings(*column, rows)
+                tail_blob, tail_offsets, tail_nulls = tail
+                kinds[field] = kind
+                columns[field] = (np.concatenate((blob, tail_blob)),
+                                  np.concatenate((offsets[:-1], tail_offsets+len(blob))),
+                                  np.concatenate((nulls, tail_nulls)))
+            else:
+                table = list(self.tables[field])
+                codes = {v:i for i,v in enumerate(table)}
+                tail_codes = []
+                for r in keep:
+                    value = r.get(field)
+                    if not isinstance(value, str):
+                        tail_codes.append(-1)
+                        continue
+                    if value not in codes:
+                        codes[value] = len(table)
+                        table.append(value)
+                    tail_codes.append(codes[value])
+                blob, offsets, _ = stg.pack_strings(table)
+                kinds[field] = kind
+                columns[field] = (np.concatenate((column[0][rows],
+                                                  np.array(tail_codes, dtype=np.int32))),
+                                  blob, offsets)
+        return DocumentStore(list(self.fields), kinds, columns)
+
+
+    def nbytes(self):
+        """
+        Returns the size of the stored arrays, in bytes
+        """
+        arrays = [c for f in self.fields for c in\
+                  (self.columns[f] if isinstance(self.columns[f], tuple) else [self.columns[f]])]
+        return int(sum(a.nbytes for a in arrays))
+
+
+    def __len__(self):
+        return self._n_main() + len(self.tail)
+
+
+    def _n_main(self):
+        if not self.fields:
+            return 0
+        field = self.fields[0]
+        column = self.columns[field]
+        if self.kinds[field] == 'str':
+            return len(column[1]) - 1
+        return len(column[0]) if self.kinds[field] == 'cat' else len(column)
+
+
+    def _value(self, field, ordinal):
+        kind, column = self.kinds[field], self.columns[field]
+        if kind == 'int':
+            return int(column[ordinal])
+        if kind == 'float':
+            return float(column[ordinal])
+        if kind == 'cat':
+            code = column[0][ordinal]
+            return self.tables[field][code] if code >= 0 else float('nan')
+        blob, offsets, nulls = column
+        if nulls[ordinal]:
+            return float('nan')
+        return bytes(blob[offsets[ordinal]:offsets[ordinal+1]]).decode('utf-8')
+
+
+
+def _pack(values, kind=None):
+    """
+    Returns the kind of a column of values (unless given)
+    and its packed form
+    """
+    if kind is None or kind in ['int', 'float']:
+        if all(_is_int(v) for v in values):
+            return 'int', np.array(values, dtype=np.int64)
+        if all(_is_int(v) or isinstance(v, (float, np.floating)) for v in values):
+            return 'float', np.array(values, dtype=np.float64)
+    if kind is None and len(values) >= INTERN_RATIO*len(set(values)):
+        table = sorted({v for v in values if isinstance(v, str)})
+        codes = {v:i for i,v in enumerate(table)}
+        blob, offsets, _ = stg.pack_strings(table)
+        return 'cat', (np.array([codes.get(v, -1) if isinstance(v, str) else -1\
+                                 for v in values], dtype=np.int32), blob, offsets)
+    values = [v if isinstance(v, str) or v != v else str(v) for v in values]
+    return 'str', stg.pack_strings(values)
+
+
+def _take_strings(blob, offsets, nulls, rows):
+    """
+    Selects the given rows of a packed string column
+    """
+    starts, ends = offsets[rows], offsets[rows+1]
+    lengths = ends - starts
+    new_offsets = np.zeros(len(rows)+1, dtype=np.int64)
+    new_offsets[1:] = np.cumsum(lengths)
+    flat = np.arange(new_offsets[-1]) + np.repeat(starts - new_offsets[:-1], lengths)
+    return np.asarray(blob)[flat], new_offsets, np.asarray(nulls)[rows]
+
+
+def _is_int(value):
+    return isinstance(value, (int, np.integer, np.bool_))
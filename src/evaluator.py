@@ -1,49 +1,186 @@
-import pandas as pd
 import src.indexer as idx
 import src.searcher as sch
 import os
+import time
+import multiprocessing
 import numpy as np
-import matplotlib.pyplot as plt
 
 
 class Evaluator():
 
-    def __init__(self, dataset_path, engine):
-        dataset = pd.read_csv(dataset_path)
+    def __init__(self, dataset_path, engine, seed=None, workers=1, batch_size=1):
+        """
+        Evaluates the rankings of a search engine against the
+        positions recorded in a dataset. Queries are sampled
+        with a generator seeded by 'seed' (None draws a fresh
+        seed), so runs with the same seed are comparable. They are
+        evaluated by 'workers' forked processes, which share the
+        already loaded engine and index, 'batch_size' queries at a
+        time (see Searcher.search_many()).
+        """
+        import pandas as pd
+        fields = ['product_id', 'query', 'search_page', 'position']
+        dataset = pd.read_csv(dataset_path, usecols=fields)
         self.products = self._select_fields(dataset)
         self.engine = engine
+        self.seed = seed
+        self.workers = workers
+        self.batch_size = batch_size
+
+
+    def sample(self, num_queries):
+        """
+        Returns the dataset rows (indexes) of 'num_queries'
+        random queries, always the same for a given seed
+        """
+        rng = np.random.default_rng(self.seed)
+        return rng.integers(len(self.products), size=num_queries)
 
 
-    def evaluate(self, num_queries=500):
+    def evaluate(self, num_queries=500, limit=190):
         """
         Performs several random queries on the engine, limited
         to 'num_queries'. The root mean squared value is calculated
         based on the distance between the expected position and
-        the actual predicted order. The errors are also returned
-        so that a histogram can be visualized.
+        the actual predicted order, limited to 'limit' products.
+        The latency of every query is also measured (when queries
+        are batched, each one is charged an equal share of its
+        batch). Returns a report (dict) with the errors, so that
+        a histogram can be visualized, the RMSE, the standard
+        deviation, latency percentiles (ms) and queries per second.
         """
         print(">>> Performing {} queries. Please wait...".format(num_queries))
-        rnd_vec = np.random.randint(len(self.products), size=num_queries)
-        errors = []
-        for i, rnd_val in enumerate(rnd_vec):
-            self._show_progress(i, len(rnd_vec))
-            errors.append(self._eval_query(self.products[rnd_val]))
-        mse = np.square(errors).mean()
-        rmse = np.sqrt(mse)
-        std_dev = np.std(errors)
-        return errors, rmse, std_dev
+        return self._evaluate(self.engine, self.sample(num_queries), limit)
+
+
+    def compare(self, engines, num_queries=500, limit=190):
+        """
+        Evaluates several engines (a dict of name -> engine, e.g.
+        Searchers with different rankings) on the same sample of
+        queries. Returns a dict of name -> report (see evaluate()).
+        """
+        print(">>> Performing {} queries on {} engines. Please wait..."\
+              .format(num_queries, len(engines)))
+        rows = self.sample(num_queries)
+        return {name: self._evaluate(engine, rows, limit) for name, engine in engines.items()}
 
 
-    def show_eval(self, rmse, std_dev, errors):
+    def error_delta(self, reports, reference):
         """
-        Visualization of the RMSE, dispersion and histogram of
-        the predicted errors
+        Compares the reports returned by compare() with the one
+        of the 'reference' engine (e.g. the same ranking over full
+        precision weights), query by query. Returns a dict of
+        name -> RMSE delta, mean absolute change of the position
+        error and share of queries whose error changed.
         """
-        print("Average error (RMSE):", rmse)
-        print("Standard deviation: +-", std_dev)
-        plt.hist(errors, bins='auto')
-        plt.title('Histogram of mean errors')
-        plt.show()  
+        base = np.array(reports[reference]['errors'])
+        deltas = {}
+        for name, report in reports.items():
+            change = np.array(report['errors']) - base
+            deltas[name] = {'rmse': report['rmse'] - reports[reference]['rmse'],
+                            'mean_abs_change': float(np.abs(change).mean()),
+                            'changed': float(np.mean(change != 0))}
+        return deltas
+
+
+    def show_eval(self, report, plot=False):
+        """
+        Visualization of the RMSE, dispersion, latency and
+        throughput of an evaluation. With 'plot', the histogram
+        of the predicted errors is shown if matplotlib is
+        available.
+        """
+        print("Average error (RMSE):", report['rmse'])
+        print("Standard deviation: +-", report['std_dev'])
+        print("Latency (ms): p50={p50:.3f} p95={p95:.3f} p99={p99:.3f}"\
+              .format(**report['latency']))
+        print("Throughput: {:.1f} queries/s ({} workers)"\
+              .format(report['qps'], report['workers']))
+        if plot:
+            try:
+                import matplotlib.pyplot as plt
+            except ImportError:
+                print(">>> matplotlib is not installed, skipping the histogram")
+                return
+            plt.hist(report['errors'], bins='auto')
+            plt.title('Histogram of mean errors')
+            plt.show()
+
+
+    def show_comparison(self, reports, reference=None):
+        """
+        Prints the error, latency and throughput of the
+        reports returned by compare(), side by side. With a
+        'reference' engine, the error deltas against it are
+        printed as well (see error_delta()).
+        """
+        print('{:<12}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}'.format(
+            'engine', 'RMSE', 'std', 'p50 ms', 'p95 ms', 'p99 ms', 'QPS'))
+        for name, report in reports.items():
+            latency = report['latency']
+            print('{:<12}{:>10.4f}{:>10.4f}{:>10.3f}{:>10.3f}{:>10.3f}{:>10.1f}'.format(
+                name, report['rmse'], report['std_dev'], latency['p50'],
+                latency['p95'], latency['p99'], report['qps']))
+        if reference is not None:
+            print('\n{:<12}{:>10}{:>14}{:>10}'.format('engine', 'ΔRMSE', '|Δerror|', 'changed'))
+            for name, delta in self.error_delta(reports, reference).items():
+                print('{:<12}{:>+10.4f}{:>14.4f}{:>9.1%}'.format(
+                    name, delta['rmse'], delta['mean_abs_change'], delta['changed']))
+
+
+    def _evaluate(self, engine, rows, limit):
+        batches = [[self.products[r] for r in rows[i:i+self.batch_size]]\
+                   for i in range(0, len(rows), self.batch_size)]
+        errors, latencies = [], []
+        start = time.perf_counter()
+        for i, (errs, lats) in enumerate(self._run(engine, batches, limit)):
+            self._show_progress(i, len(batches))
+            errors += errs
+            latencies += lats
+        elapsed = time.perf_counter() - start
+        return self._report(errors, latencies, elapsed)
+
+
+    def _run(self, engine, batches, limit):
+        """
+        Yields the errors and latencies of each batch, in order.
+        Worker processes are forked after the engine is set as a
+        module global, so they all share the loaded index
+        (copy-on-write, and memory mapped sections are shared
+        anyway) instead of loading or unpickling their own.
+        """
+        global _engine
+        fork = 'fork' in multiprocessing.get_all_start_methods()
+        if self.workers <= 1 or len(batches) <= 1 or not fork:
+            for batch in batches:
+                yield _eval_batch(engine, batch, limit)
+            return
+        _engine = engine
+        context = multiprocessing.get_context('fork')
+        try:
+            with context.Pool(self.workers) as pool:
+                args = [(batch, limit) for batch in batches]
+                chunksize = max(1, len(batches)//(4*self.workers))
+                yield from pool.imap(_eval_shard, args, chunksize)
+        finally:
+            _engine = None
+
+
+    def _report(self, errors, latencies, elapsed):
+        errors = np.array(errors)
+        latencies = np.array(latencies) * 1000
+        if len(errors) == 0:
+            errors = latencies = np.zeros(1)
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        return {'errors': errors.tolist(),
+                'rmse': float(np.sqrt(np.square(errors).mean())),
+                'std_dev': float(np.std(errors)),
+                'latency': {'mean': float(latencies.mean()), 'p50': float(p50),
+                            'p95': float(p95), 'p99': float(p99)},
+                'qps': len(latencies)/elapsed if elapsed > 0 else 0.0,
+                'queries': len(latencies),
+                'workers': self.workers,
+                'seed': self.seed}
 
 
     def _show_progress(self, i, max_i):
@@ -60,13 +197,8 @@ class Evaluator():
         in the rank
         """
         query = product['query']
-        target_pos = product['position']
         ranking = self.engine.search(query, prods_to_show=limit)
-        try:
-            position = ranking.index(product['product_id'])
-            return np.abs(target_pos-position)
-        except:
-            return limit
+        return _position_error(product, ranking, limit)
 
 
     def _select_fields(self, dataset):
@@ -91,10 +223,47 @@ class Evaluator():
 
 
 
+_engine = None
+
+
+def _eval_shard(args):
+    """
+    Evaluates a batch in a worker process (see Evaluator._run())
+    """
+    batch, limit = args
+    return _eval_batch(_engine, batch, limit)
+
+
+def _eval_batch(engine, products, limit):
+    """
+    Ranks the queries of a list of products and returns their
+    position errors and latencies (seconds)
+    """
+    queries = [p['query'] for p in products]
+    start = time.perf_counter()
+    if len(queries) == 1:
+        rankings = [engine.search(queries[0], prods_to_show=limit)]
+    else:
+        rankings = engine.search_many(queries, prods_to_show=limit)
+    latency = (time.perf_counter() - start) / max(len(queries), 1)
+    errors = [_position_error(p, r, limit) for p,r in zip(products, rankings)]
+    return errors, [latency]*len(queries)
+
+
+def _position_error(product, ranking, limit):
+    target_pos = product['position']
+    try:
+        position = ranking.index(product['product_id'])
+        return int(np.abs(target_pos-position))
+    except ValueError:
+        return limit
+
+
+
 if __name__=="__main__":
     datapath = os.path.abspath("../data/elo7_recruitment_dataset.csv")
     indexer =  idx.Indexer(datapath)
     engine = sch.Searcher(indexer)
     evaluator = Evaluator(datapath, engine)
-    errors, rmse, std = evaluator.evaluate()
-    evaluator.show_eval(rmse, std, errors)
+    report = evaluator.evaluate()
+    evaluator.show_eval(report, plot=True)
@@ -0,0 +1,169 @@
+import zlib
+import numpy as np
+import src.storage as stg
+
+
+MAX_DISTANCE = 2
+
+MIN_LENGTH = 3
+
+MAX_LENGTH = 24
+
+BUDGET = 64
+
+
+class DeleteIndex():
+
+    def __init__(self, words, hashes, ordinals, max_distance=MAX_DISTANCE):
+        """
+        Symmetric delete index (as in SymSpell) over a list of
+        words: every string obtained by deleting up to
+        'max_distance' characters of a word (the word itself
+        included) is stored as a 32 bit hash ('hashes', sorted)
+        along with the position of the word ('ordinals'). Two
+        words within that edit distance share one of these
+        strings, so the candidates of a term are found by
+        generating its own deletes, without comparing it to the
+        whole vocabulary. Hash collisions only add candidates,
+        which are checked with their actual edit distance.
+        """
+        self.words = words
+        self.hashes = hashes
+        self.ordinals = ordinals
+        self.max_distance = max_distance
+
+
+    @classmethod
+    def from_words(cls, words, max_distance=MAX_DISTANCE):
+        hashes, ordinals = [], []
+        for i, word in enumerate(words):
+            if MIN_LENGTH <= len(word) <= MAX_LENGTH:
+                variants = [_hash(d) for d in deletes(word, _distance(word, max_distance))]
+                hashes += variants
+                ordinals += [i]*len(variants)
+        hashes = np.array(hashes, dtype=np.uint32)
+        order = np.argsort(hashes, kind='stable')
+        return cls(list(words), hashes[order], np.array(ordinals, dtype=np.int32)[order],
+                   max_distance)
+
+
+    @classmethod
+    def from_index_file(cls, index_file, prefix='fuzzy.'):
+        """
+        Opens the index written by to_sections() (see storage)
+        """
+        words = stg.unpack_strings(index_file.array(prefix+'words'),
+                                   index_file.array(prefix+'words.offsets'))
+        return cls(words, index_file.array(prefix+'hashes'),
+                   index_file.array(prefix+'ordinals'), index_file.header['fuzzy'])
+
+
+    def to_sections(self, prefix='fuzzy.'):
+        blob, offsets, _ = stg.pack_strings(self.words)
+        return {prefix+'words': blob,
+                prefix+'words.offsets': offsets,
+                prefix+'hashes': self.hashes,
+                prefix+'ordinals': self.ordinals}
+
+
+    def candidates(self, term):
+        """
+        Returns the words that may be within the edit distance
+        allowed for a term (see correct())
+        """
+        if not MIN_LENGTH <= len(term) <= MAX_LENGTH:
+            return []
+        variants = deletes(term, _distance(term, self.max_distance))
+        variants = np.array([_hash(d) for d in variants], dtype=np.uint32)
+        starts = np.searchsorted(self.hashes, variants, 'left')
+        ends = np.searchsorted(self.hashes, variants, 'right')
+        found = [self.ordinals[s:e] for s, e in zip(starts.tolist(), ends.tolist()) if e > s]
+        if not found:
+            return []
+        return [self.words[i] for i in np.unique(np.concatenate(found)).tolist()]
+
+
+    def correct(self, term, doc_freq, budget=BUDGET):
+        """
+        Returns the closest known word to a term, or None, along
+        with the number of edit distances computed. The allowed
+        distance is 1 for terms up to 4 characters and
+        'max_distance' for longer ones; shorter or much longer
+        terms are not corrected. Candidates no longer in
+        'doc_freq' (word -> number of documents) are skipped;
+        the others are checked closest in length and most
+        frequent first, at most 'budget' of them, and the
+        closest one wins, the most frequent one among equals.
+        """
+        if term in doc_freq:
+            return term, 0
+        limit = _distance(term, self.max_distance)
+        candidates = [w for w in self.candidates(term) if doc_freq.get(w, 0) > 0]
+        candidates.sort(key=lambda w: (abs(len(w)-len(term)), -doc_freq[w], w))
+        best, spent = None, 0
+        for word in candidates[:max(budget, 0)]:
+            spent += 1
+            distance = edit_distance(term, word, limit)
+            if distance <= limit:
+                key = (distance, -doc_freq[word], word)
+                if best is None or key < best:
+                    best = key
+        return (best[2] if best is not None else None), spent
+
+
+    def nbytes(self):
+        """
+        Returns the size of the delete hashes and ordinals, in bytes
+        """
+        return int(self.hashes.nbytes + self.ordinals.nbytes)
+
+
+    def __len__(self):
+        return len(self.hashes)
+
+
+
+def deletes(word, distance):
+    """
+    Returns the set of strings obtained by deleting up to
+    'distance' characters of a word, the word included. Each
+    combination of positions is deleted once, in increasing
+    order of position.
+    """
+    found, level = {word}, [(word, 0)]
+    for _ in range(distance):
+        level = [(w[:i]+w[i+1:], i) for w, start in level for i in range(start, len(w))]
+        found.update(w for w, _ in level)
+    return found
+
+
+def edit_distance(a, b, limit=None):
+    """
+    Returns the optimal string alignment distance between two
+    strings (insertions, deletions, substitutions and swaps of
+    adjacent characters). Once it exceeds 'limit', limit+1 is
+    returned instead.
+    """
+    if limit is not None and abs(len(a)-len(b)) > limit:
+        return limit+1
+    before, previous = None, list(range(len(b)+1))
+    for i in range(1, len(a)+1):
+        current = [i] + [0]*len(b)
+        for j in range(1, len(b)+1):
+            cost = 0 if a[i-1] == b[j-1] else 1
+            current[j] = min(previous[j]+1, current[j-1]+1, previous[j-1]+cost)
+            if i > 1 and j > 1 and a[i-1] == b[j-2] and a[i-2] == b[j-1]:
+                current[j] = min(current[j], before[j-2]+1)
+        if limit is not None and min(current) > limit:
+            return limit+1
+        before, previous = previous, current
+    distance = previous[-1]
+    return distance if limit is None or distance <= limit else limit+1
+
+
+def _distance(word, max_distance):
+    return min(max_distance, 1) if len(word) <= 4 else max_distance
+
+
+def _hash(text):
+    return zlib.crc32(text.encode('utf-8'))
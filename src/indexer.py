@@ -1,19 +1,46 @@
 import os
-import nltk
-from nltk.stem import RSLPStemmer
-nltk.download('punkt')
-nltk.download('stopwords')
-nltk.download('rslp')
 import string
-from num2words import num2words
-import pandas as pd
-import unidecode
+import multiprocessing
+import threading
 import numpy as np
+from scipy import sparse
+import src.postings as pst
+import src.analyzer as anl
+import src.lexicon as lex
+import src.segments as sgm
+import src.storage as stg
+import src.attributes as atr
+import src.documents as dcs
+import src.weights as wgt
+import src.suggestions as sgg
+import src.fuzzy as fzz
+import src.instrumentation as ins
+import src.bm25 as bm
 
 
 class Indexer():
 
-    def __init__(self, dataset_path):
+    tfidf_index = stg.LazySection()
+    feature_index = stg.LazySection()
+    doc_norms = stg.LazySection()
+    doc_ids = stg.LazySection()
+    doc_idx = stg.LazySection()
+    word_idx = stg.LazySection()
+    inverted_index = stg.LazySection()
+    inv_doc_freq = stg.LazySection()
+    doc_freq = stg.LazySection()
+    doc_lengths = stg.LazySection()
+    bm25 = stg.LazySection()
+    positional_index = stg.LazySection()
+    doc_weights = stg.LazySection()
+    documents = stg.LazySection()
+    attributes = stg.LazySection()
+    suggestions = stg.LazySection()
+    fuzzy_index = stg.LazySection()
+
+    def __init__(self, dataset_path, compress_postings=False, workers=1,
+                 chunk_size=10000, compact_every=1000, instrumentation=None,
+                 positions=False, max_features=None, precision='float64', fuzzy=False):
         """Dataset according to the elo7 format. Fields are
         listed below. the labels [doc] and [eval] indicante
         whether the information is related to the document
@@ -33,56 +60,417 @@ class Indexer():
         - view_counts       [doc]
         - order_counts      [doc]
         - category          [doc]
+        If 'compress_postings' is set, postings lists are
+        stored on disk delta/varint encoded. 'workers' sets the
+        number of processes used to analyze documents when
+        the indexes are built. The dataset is streamed in chunks
+        of 'chunk_size' rows. After 'compact_every' product
+        updates (see upsert()), the index is compacted in
+        background. Stage timings and counters of the index
+        creation are collected by 'instrumentation', if given.
+        With 'positions', the position of every word occurrence
+        is also stored (see postings.PositionalIndex), which
+        phrase and field-scoped queries need (see match()).
+        'max_features' (feature -> maximum value) replaces the
+        maxima found in the dataset, e.g. by the ones of the whole
+        catalog when the dataset is one of its shards.
+        'precision' sets how the tf*idf weights used for cosine
+        scoring are stored: float64 (default), float32, float16
+        or int8 with a scale factor per document (see
+        weights.DocWeights). The float64 weights are still stored,
+        for upsert() and compact(), but are then left on disk.
+        With 'fuzzy', a symmetric delete index of the vocabulary
+        is built as well (see fuzzy.DeleteIndex), so that words
+        of a query that are not in the vocabulary can be replaced
+        by the closest ones (see correct()).
+        A previously built index is reused only if it was built
+        from the same dataset contents; its sections are then
+        loaded lazily, on first use. The options are kept in
+        'settings', to load the index again with the same ones
+        (see searcher.Searcher.reload()).
         """
-        dataset = pd.read_csv(dataset_path)
-        documents = self._drop_fields(dataset)
         self.features = ['view_counts', 'order_counts']
-        max_features = self._calculate_max_features(dataset)
-        self.inverted_index = {}
-        self.tfidf_index = None
-        self.word_idx = None
-        self.doc_idx = None
-        self.inv_doc_freq = {}
-        self.term_freq = {}
-        self.documents = {}
-        self.stop_words = self._generate_stop_words()
-        self.stemmer = RSLPStemmer()
-        if os.path.exists(dataset_path[:-4]+'_processed.npz'):
-            print('>>> Preprocessed index found. Loading...')
-            self._load_indexes(dataset_path)
-        else:
-            self.create_indexes(documents, max_features)
+        self.compress_postings = compress_postings
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.compact_every = compact_every
+        self.store_positions = positions
+        self.store_fuzzy = fuzzy
+        if precision not in wgt.PRECISIONS:
+            raise ValueError('Unknown precision: {}'.format(precision))
+        self.precision = precision
+        self.instrumentation = instrumentation or ins.DISABLED
+        self.settings = {'compress_postings': compress_postings, 'workers': workers,
+                         'chunk_size': chunk_size, 'compact_every': compact_every,
+                         'instrumentation': instrumentation, 'positions': positions,
+                         'precision': precision, 'fuzzy': fuzzy}
+        self.dataset_path = dataset_path
+        self.dataset_hash = stg.dataset_hash(dataset_path)
+        self.n_doc = 0
+        self.max_features = None
+        self.delta = None
+        self.tombstones = set()
+        self.generation = 0
+        self.lock = threading.RLock()
+        self._compact_lock = threading.Lock()
+        self._tombstone_array = None
+        self._compactor = None
+        self._words = None
+        resources = lex.load_resources()
+        self.stop_words = self._generate_stop_words(resources['stop_words'])
+        self.stemmer = lex.RSLPStemmer(resources['rslp'])
+        self.analyzer = anl.Analyzer(self.stop_words, self.stemmer)
+        if not self._load_indexes(dataset_path):
+            self._reset_indexes()
+            if max_features is None:
+                max_features = self._scan_max_features(dataset_path)
+            self.create_indexes(self._read_documents(dataset_path), max_features)
+            self.suggestions = self._create_suggestions(dataset_path)
+            if self.store_fuzzy:
+                self.fuzzy_index = fzz.DeleteIndex.from_words(self._vocabulary())
             self._store_indexes(dataset_path)
+            if self.doc_weights is not None:
+                self._index_file = stg.IndexFile(self._index_path(dataset_path))
+                del self.tfidf_index
 
 
-    def create_indexes(self, documents, max_features):
+    def create_indexes(self, chunks, max_features):
         """
         Creates an inverted index for fast document retrieval
         and a TF-IDF matrix of the form N x (V+F) for ranking, where:
         N is the number of documents and
         V is the vocabulary extracted from the corpus.
         F is the set of non-textual added features
+        The N x V block is stored as a sparse CSR matrix and the
+        N x F block as a dense array kept alongside it.
+        Documents are given as an iterable of chunks (lists of
+        documents), which are analyzed and merged one at a time:
+        each chunk leaves only compact arrays behind (term
+        frequency triplets, features, lengths and a document
+        store), so its dicts are released before the next one is
+        read. Products already indexed are skipped.
         """
+        with self.instrumentation.trace('create_indexes') as trace:
+            self._create_indexes(chunks, max_features, trace)
+
+
+    def _create_indexes(self, chunks, max_features, trace):
         print(">>> Processing documents and creating inverted index...")
-        features = {doc['product_id']: [] for doc in documents}
-        for doc in documents:
+        stores, features, triplets, lengths, tokens = [], [], [], [], []
+        n_doc = 0
+        pool = None
+        if self.workers > 1:
+            pool = multiprocessing.Pool(self.workers)
+        try:
+            for documents in chunks:
+                trace.count('chunks')
+                with trace.stage('documents'):
+                    documents = self._new_documents(documents)
+                    if not documents:
+                        continue
+                    n_doc += len(documents)
+                    for doc in documents:
+                        for feat in self.features:
+                            if np.isnan(doc[feat]):
+                                doc[feat] = 0
+                    features.append(np.array([[1+doc[f]/max_features[f] for f in self.features]\
+                                              for doc in documents], dtype=np.float64)\
+                                    .reshape(len(documents), len(self.features)))
+                    stores.append(dcs.DocumentStore.from_records(documents))
+                with trace.stage('analyze'):
+                    shards = self._split_shards(documents)
+                    if pool is not None:
+                        partials = pool.map(_index_shard, shards)
+                    else:
+                        partials = list(map(_index_shard, shards))
+                with trace.stage('merge'):
+                    for term_freq, doc_freq in partials:
+                        triplets.append(self._merge_shard(term_freq, doc_freq, tokens))
+                        lengths.append(np.array([d[2] for d in term_freq], dtype=np.int32))
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        print(">>> Creating sparse TF-IDF matrix...")
+        trace.count('documents_indexed', n_doc)
+        with trace.stage('idf'):
+            self.doc_freq = dict(self.inv_doc_freq)
+            self.n_doc = n_doc
+            self.max_features = max_features
+            for word in self.inv_doc_freq.keys():
+                n_word = self.inv_doc_freq[word]
+                self.inv_doc_freq[word] = 1+np.log(n_doc/n_word)
+            self.doc_ids = np.array(list(self.doc_idx.keys()), dtype=np.int64)
+        with trace.stage('tfidf'):
+            self.tfidf_index = self._create_tfidf_index(triplets)
+            self.feature_index = np.concatenate(features + [np.zeros((0, len(self.features)))])
+            del triplets, features
+            self.doc_weights = self._create_doc_weights(self.tfidf_index)
+        with trace.stage('postings'):
+            self.inverted_index = self._create_inverted_index(self.tfidf_index,
+                                                             self.word_idx)
+            self.doc_norms = self._calculate_doc_norms(self.tfidf_index,
+                                                       self.feature_index)
+            if self.store_positions:
+                self.positional_index = self._create_positional_index(tokens)
+            del tokens
+        with trace.stage('bm25'):
+            self.doc_lengths = np.concatenate(lengths + [np.zeros(0, dtype=np.int32)])
+            self.bm25 = self._create_bm25_index()
+        trace.count('postings_built', len(self.inverted_index.data))
+        with trace.stage('attributes'):
+            self.documents = dcs.DocumentStore.concatenate(stores)
+            del stores
+            self.attributes = atr.AttributeStore.from_store(self.documents)
+        self.delta = sgm.DeltaSegment(len(self.doc_ids), len(self.features))
+
+
+    def upsert(self, doc):
+        """
+        Adds a product to the index, or replaces the indexed
+        version of it. 'doc' holds the [doc] fields of the
+        dataset. The product is appended to the delta segment
+        and its previous version, if any, is marked as deleted.
+        New words get an idf from the current document
+        frequencies; the idf of known words is only refreshed
+        when the index is compacted.
+        """
+        with self.lock:
+            product_id = doc['product_id']
+            if product_id in self.doc_idx:
+                self._delete(product_id)
             text = self.preprocess(doc['title'])
+            title_length = len(text)
             text += self.preprocess(doc['concatenated_tags'])
-            tf = self._count_frequency(text, doc['product_id'])
-            self.term_freq[doc['product_id']] = tf
-            self.documents[doc['product_id']] = doc
+            tf = _count_frequency(text)
+            self.n_doc += 1
+            for word in tf:
+                self.doc_freq[word] = self.doc_freq.get(word, 0) + 1
+                if word not in self.word_idx:
+                    self.word_idx[word] = len(self.word_idx)
+                    self.inv_doc_freq[word] = 1+np.log(self.n_doc/self.doc_freq[word])
+                    if self._words is not None:
+                        self._words.append(word)
+            n_main = self.tfidf_index.shape[0]
+            self.tfidf_index.resize((n_main, len(self.word_idx)))
             for feat in self.features:
                 if np.isnan(doc[feat]):
                     doc[feat] = 0
-                features[doc['product_id']].append(1+doc[feat]/max_features[feat])
-        print(">>> Creating sparse TF-IDF matrix...")
-        n_doc = len(documents)
-        for word in self.inv_doc_freq.keys():
-            n_word = self.inv_doc_freq[word]
-            self.inv_doc_freq[word] = 1+np.log(n_doc/n_word)
-        self.word_idx = {w:i for i,w in enumerate(self.inv_doc_freq.keys())}
-        self.doc_idx  = {d:i for i,d in enumerate(self.term_freq.keys())}
-        self.tfidf_index = self._create_tfidf_index(features)     
+            features = [1+doc[f]/self.max_features[f] for f in self.features]
+            cols = [self.word_idx[w] for w in tf]
+            vals = [tf[w]*self.inv_doc_freq[w] for w in tf]
+            row = self.delta.add(product_id, cols, vals, features, len(text), title_length)
+            positions = _word_positions(text, title_length) if self.positional_index\
+                        is not None else {}
+            for word in tf:
+                self.delta.add_postings(word, row, positions.get(word))
+            self.doc_idx[product_id] = row
+            self.documents.append(doc)
+            self.attributes.append(doc)
+            self._changed()
+
+
+    def remove(self, product_id):
+        """
+        Removes a product from the index. It is only marked as
+        deleted (tombstone) until the index is compacted.
+        """
+        with self.lock:
+            self._delete(product_id)
+            self._changed()
+
+
+    def compact(self):
+        """
+        Merges the delta segment into the main one, drops the
+        deleted documents and the words that no longer occur in
+        any document, and refreshes the idf of every word along
+        with the stored tf*idf weights. Documents are renumbered.
+        The new main segment is built from a snapshot of the index
+        without holding its lock, so that searches and updates go
+        on meanwhile; the lock is only taken again to swap it in
+        and replay the updates made since the snapshot.
+        """
+        with self._compact_lock:
+            with self.lock:
+                if len(self.delta) == 0 and not self.tombstones:
+                    return
+                snapshot = self._compaction_snapshot()
+            compacted = self._compacted(snapshot)
+            with self.lock:
+                n_main, n_delta = snapshot['n_main'], snapshot['n_delta']
+                renumber = np.cumsum(compacted.pop('live')) - 1
+                deleted = sorted(renumber[o] for o in self.tombstones-snapshot['tombstones']\
+                                 if o < n_main+n_delta)
+                added = [self.documents.tail[r] for r in range(n_delta, len(self.delta))\
+                         if n_main+r not in self.tombstones]
+                for name, value in compacted.items():
+                    setattr(self, name, value)
+                self.n_doc = snapshot['n_doc']
+                self.delta = sgm.DeltaSegment(len(self.doc_ids), len(self.features))
+                self.tombstones = set()
+                self._tombstone_array = None
+                self._words = None
+                self.generation += 1
+                for ordinal in deleted:
+                    self._delete(int(self.doc_ids[ordinal]))
+                for doc in added:
+                    self.upsert(doc)
+
+
+    def _compaction_snapshot(self):
+        """
+        Returns what compact() needs to build the new main
+        segment, taken while holding the lock: references to the
+        main segment arrays (which are replaced, never changed
+        in place) and copies of the delta segment and of the
+        document frequencies
+        """
+        words = list(self.word_idx.keys())
+        main = self.tfidf_index
+        positions = None
+        if self.positional_index is not None:
+            delta_positions = [(self.word_idx[w], o, p) for (w, o), p\
+                               in self.delta.positions.items()]
+            positions = (self.positional_index, self.inverted_index, delta_positions,
+                         np.array(self.delta.title_lengths, dtype=np.int32))
+        return {'words': words,
+                'n_main': main.shape[0],
+                'n_delta': len(self.delta),
+                'main': sparse.csr_matrix((main.data, main.indices, main.indptr),
+                                          shape=(main.shape[0], len(words))),
+                'delta': self.delta.matrix(len(words))[:2],
+                'features': self.feature_index,
+                'lengths': np.concatenate((self.doc_lengths,
+                                           np.array(self.delta.lengths, dtype=np.int32))),
+                'doc_ids': np.concatenate((self.doc_ids,
+                                           np.array(self.delta.doc_ids, dtype=np.int64))),
+                'tombstones': set(self.tombstones),
+                'doc_freq': np.array([self.doc_freq.get(w, 0) for w in words]),
+                'idf': np.array([self.inv_doc_freq[w] for w in words]),
+                'n_doc': self.n_doc,
+                'positions': positions,
+                'documents': self.documents,
+                'attributes': self.attributes}
+
+
+    def _compacted(self, snapshot):
+        """
+        Builds the compacted main segment from a snapshot (see
+        compact()). Returns the attributes to replace, along with
+        the mask of the snapshot ordinals kept ('live').
+        """
+        delta_mat, delta_feat = snapshot['delta']
+        live = np.ones(snapshot['n_main']+snapshot['n_delta'], dtype=bool)
+        live[list(snapshot['tombstones'])] = False
+        matrix = sparse.vstack((snapshot['main'], delta_mat), format='csr')[live]
+        features = np.vstack((snapshot['features'], delta_feat))[live]
+        doc_ids, lengths = snapshot['doc_ids'][live], snapshot['lengths'][live]
+        doc_freq = snapshot['doc_freq']
+        keep = doc_freq > 0
+        new_idf = 1+np.log(snapshot['n_doc']/np.where(keep, doc_freq, 1))
+        matrix.data = matrix.data*(new_idf/snapshot['idf'])[matrix.indices]
+        matrix = matrix[:, keep]
+        matrix.sort_indices()
+        words = [w for w,k in zip(snapshot['words'], keep) if k]
+        word_idx = {w:i for i,w in enumerate(words)}
+        positional_index = None
+        if snapshot['positions'] is not None:
+            cols, docs, pos, title_lengths = self._live_positions(live, *snapshot['positions'])
+            positional_index = pst.PositionalIndex.from_triplets(
+                np.cumsum(keep)[cols]-1, docs, pos, title_lengths)
+        return {'live': live,
+                'word_idx': word_idx,
+                'inv_doc_freq': dict(zip(words, new_idf[keep].tolist())),
+                'doc_freq': dict(zip(words, doc_freq[keep].tolist())),
+                'tfidf_index': matrix,
+                'feature_index': features,
+                'doc_weights': self._create_doc_weights(matrix),
+                'doc_ids': doc_ids,
+                'doc_lengths': lengths,
+                'doc_idx': {d:i for i,d in enumerate(doc_ids.tolist())},
+                'inverted_index': self._create_inverted_index(matrix, word_idx),
+                'doc_norms': self._calculate_doc_norms(matrix, features),
+                'bm25': bm.BM25Index.from_matrix(matrix, new_idf[keep], lengths),
+                'positional_index': positional_index,
+                'documents': snapshot['documents'].select(live),
+                'attributes': snapshot['attributes'].select(live)}
+
+
+    def warm(self):
+        """
+        Loads every section used by searches and pages in their
+        data, so that the first searches on a freshly loaded
+        index do not pay for it. With reduced precision weights,
+        the full precision ones are left on disk.
+        """
+        names = ['feature_index', 'doc_norms', 'doc_ids', 'doc_idx', 'word_idx',
+                 'inverted_index', 'inv_doc_freq', 'doc_freq', 'doc_lengths', 'bm25',
+                 'positional_index', 'doc_weights', 'attributes', 'suggestions', 'fuzzy_index']
+        if self.precision == 'float64':
+            names.append('tfidf_index')
+        for name in names:
+            getattr(self, name)
+        if '_index_file' in self.__dict__:
+            self._index_file.warm()
+
+
+    def local_stats(self):
+        """
+        Returns the corpus statistics of this index that the
+        shards of a catalog add up (see rebase()): the number of
+        indexed rows and, for each word, of rows having it (as
+        used by the tf*idf weights), the same counts over unique
+        documents (as used by BM25), and the total length of them
+        """
+        words = sorted(self.word_idx, key=self.word_idx.get)
+        row_freq = np.bincount(self.tfidf_index.indices, minlength=len(words))
+        return {'n_doc': int(self.n_doc),
+                'doc_freq': {w: int(self.doc_freq[w]) for w in words},
+                'n_rows': int(self.tfidf_index.shape[0]),
+                'row_freq': dict(zip(words, row_freq.tolist())),
+                'total_length': int(np.sum(self.doc_lengths, dtype=np.int64))}
+
+
+    def rebase(self, stats):
+        """
+        Replaces the corpus statistics of this index by the ones
+        of a whole catalog (the sum of local_stats() of its
+        shards): the tf*idf weights, norms and BM25 impacts are
+        recomputed with the global idf and average length, and the
+        words only found in other shards join the vocabulary, so
+        that queries are scored exactly as by an index of the
+        whole catalog. Meant for read-only shards: the rebased
+        index is neither stored nor meant to be updated.
+        """
+        with self.lock:
+            words = sorted(self.word_idx, key=self.word_idx.get)
+            old_idf = np.array([self.inv_doc_freq[w] for w in words])
+            n_doc = stats['n_doc']
+            inv_doc_freq = {w: 1+np.log(n_doc/n) for w,n in stats['doc_freq'].items()}
+            words += [w for w in stats['doc_freq'] if w not in self.word_idx]
+            new_idf = np.array([inv_doc_freq[w] for w in words])
+            matrix = self.tfidf_index
+            lengths = np.repeat(np.asarray(self.doc_lengths, dtype=np.float64),
+                                np.diff(matrix.indptr))
+            counts = np.rint(matrix.data/old_idf[matrix.indices]*lengths)
+            matrix = sparse.csr_matrix((counts/lengths*new_idf[matrix.indices],
+                                        matrix.indices, matrix.indptr),
+                                       shape=(matrix.shape[0], len(words)))
+            self.word_idx = {w:i for i,w in enumerate(words)}
+            self._words = None
+            self.inv_doc_freq = inv_doc_freq
+            self.tfidf_index = matrix
+            self.doc_weights = self._create_doc_weights(self.tfidf_index)
+            self.inverted_index = self._create_inverted_index(self.tfidf_index,
+                                                             self.word_idx)
+            self.doc_norms = self._calculate_doc_norms(self.tfidf_index,
+                                                       self.feature_index)
+            row_freq = np.array([stats['row_freq'][w] for w in words])
+            self.bm25 = bm.BM25Index.from_matrix(matrix, new_idf, self.doc_lengths,
+                                                 n_doc=stats['n_rows'], doc_freq=row_freq,
+                                                 avgdl=stats['total_length']/stats['n_rows'])
+            self.generation += 1
 
 
     def get_document_ids(self, words):
@@ -90,28 +478,200 @@ class Indexer():
         Given a list of words, return a list of product ids
         in which at least the occurance of one of the words
         is observed.
-        """ 
-        products = []    
+        """
+        return self.get_product_ids(self.get_document_ordinals(words)).tolist()
+
+
+    def get_document_ordinals(self, words):
+        """
+        Given a list of words, return the sorted array of
+        internal document ordinals (rows of the TF-IDF matrix)
+        in which at least one of the words occurs.
+        """
+        words = set(words)
+        postings = [self.inverted_index.get(w) for w in words]
+        if len(self.delta):
+            postings += [self.delta.get(w) for w in words]
+        return self._drop_deleted(pst.union(postings))
+
+
+    def match(self, clauses):
+        """
+        Returns the sorted ordinals of the documents meeting
+        every clause of a query (see query.Query), along with the
+        number of postings read. The postings of all the clause
+        words are intersected (see postings.intersection()); only
+        the remaining documents are then checked for phrases and
+        fields, which needs an index built with positions.
+        """
+        words = {w for _, stems in clauses for w in stems}
+        postings = []
         for word in words:
-            if word in self.inverted_index.keys():
-                products += self.inverted_index[word]
-        return products
+            main = self.inverted_index.get(word)
+            postings.append(np.concatenate((main, self.delta.get(word)))\
+                            if len(self.delta) else main)
+        ordinals, touched = pst.intersection(postings, return_touched=True)
+        ordinals = self._drop_deleted(ordinals)
+        for field, stems in clauses:
+            if field is not None or len(stems) > 1:
+                ordinals = self._match_phrase(field, stems, ordinals)
+        return ordinals, touched
+
+
+    def count_postings(self, words):
+        """
+        Returns the total length of the postings lists of a
+        list of words (main index and delta segment)
+        """
+        words = set(words)
+        total = sum(len(self.inverted_index.get(w)) for w in words)
+        if len(self.delta):
+            total += sum(len(self.delta.get(w)) for w in words)
+        return total
+
+
+    def get_bm25_postings(self, query):
+        """
+        Returns, for each distinct word of a preprocessed query
+        found in the main segment, its postings, BM25 impacts and
+        impact upper bound (see bm25.top_k()), multiplied by the
+        number of times the word occurs in the query
+        """
+        counts = _count_words(query)
+        lists = []
+        for word, n in counts.items():
+            col = self.word_idx.get(word)
+            if col is None or col >= len(self.bm25.upper_bounds):
+                continue
+            start, end = self.inverted_index.offsets[col], self.inverted_index.offsets[col+1]
+            if start == end:
+                continue
+            lists.append((self.inverted_index.data[start:end],
+                          self.bm25.impacts[start:end]*n,
+                          float(self.bm25.upper_bounds[col])*n))
+        return lists
+
+
+    def get_delta_bm25(self, query):
+        """
+        Scores with BM25 the documents of the delta segment that
+        contain a word of a preprocessed query. Returns their
+        ordinals and scores.
+        """
+        if not len(self.delta):
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        counts = _count_words(query)
+        ordinals = pst.union([self.delta.get(w) for w in counts])
+        rows = ordinals - self.delta.base
+        matrix, _, _ = self.delta.matrix(len(self.word_idx))
+        lengths = np.array(self.delta.lengths, dtype=np.float64)[rows]
+        scores = np.zeros(len(rows))
+        for word, n in counts.items():
+            col = self.word_idx.get(word)
+            if col is None:
+                continue
+            tf = matrix[rows, col].toarray().ravel()
+            idf = self.bm25.word_idf(col, self.n_doc, self.doc_freq.get(word, 0))
+            counts_in_doc = np.rint(tf/self.inv_doc_freq[word]*lengths)
+            scores += n*bm.weight(counts_in_doc, lengths, idf, self.bm25.avgdl,
+                                  self.bm25.k1, self.bm25.b)
+        return ordinals, scores
+
+
+    def get_product_ids(self, ordinals):
+        """
+        Returns the array of product ids of the
+        given document ordinals
+        """
+        if not len(self.delta):
+            return self.doc_ids[ordinals]
+        ordinals = np.asarray(ordinals)
+        ids = np.empty(len(ordinals), dtype=np.int64)
+        main = ordinals < self.delta.base
+        ids[main] = self.doc_ids[ordinals[main]]
+        delta_ids = np.array(self.delta.doc_ids, dtype=np.int64)
+        ids[~main] = delta_ids[ordinals[~main]-self.delta.base]
+        return ids
+
+
+    def get_vectors(self, ordinals):
+        """
+        Returns the tf*idf rows (sparse), the feature rows and
+        the norms of the given (sorted) document ordinals. Rows
+        are float32 unless the precision is float64.
+        """
+        if not len(self.delta):
+            return (self._get_weights(ordinals), self.feature_index[ordinals],
+                    self.doc_norms[ordinals])
+        ordinals = np.asarray(ordinals)
+        main = ordinals[ordinals < self.delta.base]
+        delta = ordinals[ordinals >= self.delta.base] - self.delta.base
+        weights = self._get_weights(main)
+        matrix, features, norms = self.delta.matrix(len(self.word_idx))
+        return (sparse.vstack((weights, matrix[delta].astype(weights.dtype)), format='csr'),
+                np.vstack((self.feature_index[main], features[delta])),
+                np.concatenate((self.doc_norms[main], norms[delta])))
+
+
+    def suggest(self, prefix, k=10):
+        """
+        Returns up to 'k' completions of a partially typed query
+        (see suggestions.Suggester). They are built with the
+        index, from its vocabulary and the past queries of the
+        dataset, and are not changed by upsert() or remove().
+        """
+        if self.suggestions is None:
+            return []
+        return self.suggestions.suggest(prefix, k)
+
+
+    def correct(self, word, budget=fzz.BUDGET):
+        """
+        Returns the indexed word closest to a (stemmed) word, or
+        None, along with the number of candidates compared (at
+        most 'budget', see fuzzy.DeleteIndex.correct()). Needs an
+        index built with fuzzy=True; words added since then by
+        upsert() are not candidates.
+        """
+        if self.fuzzy_index is None:
+            raise ValueError('Fuzzy matching needs an index built with fuzzy=True')
+        return self.fuzzy_index.correct(word, self.doc_freq, budget)
 
 
     def get_documents(self, prod_ids):
         """
-        Returns the list of products of the dataset
-        indexed by 'product_id'
+        Returns the products of the dataset with the
+        given ids, indexed by 'product_id'
+        """
+        return {p: self.documents.get(self.doc_idx[p]) for p in prod_ids}
+
+
+    def get_document(self, product_id):
+        """
+        Returns the fields of a product as a dict
+        """
+        return self.documents.get(self.doc_idx[product_id])
+
+
+    def get_term_freq(self, product_id):
+        """
+        Returns the normalized term frequencies of a product,
+        recovered by dividing its tf*idf weights by the idf
+        of each word
         """
-        return self.documents
+        cols, vals = self._row(self.doc_idx[product_id])
+        words = self._vocabulary()
+        return {words[c]: v/self.inv_doc_freq[words[c]] for c,v in zip(cols, vals)}
 
 
     def get_vector_doc(self, product_id):
         """
         Returns the tf*idf vector associated to a product
+        as a sparse 1 x (V+F) row
         """
-        row = self.doc_idx[product_id]
-        return self.tfidf_index[row]
+        matrix, features, _ = self.get_vectors([self.doc_idx[product_id]])
+        feat = sparse.csr_matrix(features)
+        return sparse.hstack((matrix, feat), format='csr')
 
 
     def get_number_features(self):
@@ -125,84 +685,314 @@ class Indexer():
         """
         Performs a series of NLP errands:
         Tokenization, converting number to words, stemming, stop word removal
+        (see analyzer.Analyzer)
         """
-        if not type(doc) == str:
-            return []
-        text = doc.lower()
-        text = unidecode.unidecode(text)
-        text = nltk.word_tokenize(text, language='portuguese')
-        text = self._number_to_word(text)
-        text = [self.stemmer.stem(w) for w in text if\
-                (w not in self.stop_words) and (len(w) > 1)]
-        return text
-
-
-    def _count_frequency(self, text, doc_id):
-        """
-        Calculates and return the term frequency (TF) of a given document.
-        It also updates global document frequency
-        """
-        n_words = len(text)
-        words_doc = {w:0 for w in set(text)}
-        for word in text: #building inv index and TF
-            words_doc[word] += 1
-            if word not in self.inverted_index.keys():
-                self.inverted_index[word] = []
-            self.inverted_index[word].append(doc_id)
-        for word in words_doc.keys(): #normalizing TF, counting DF
-            words_doc[word] /= n_words
-            if word not in self.inv_doc_freq.keys():
+        return self.analyzer.analyze(doc)
+
+
+    def _delete(self, product_id):
+        row = self.doc_idx.pop(product_id)
+        self.tombstones.add(row)
+        self._tombstone_array = None
+        self.n_doc -= 1
+        words = self._vocabulary()
+        for col in self._row(row)[0]:
+            self.doc_freq[words[col]] -= 1
+
+
+    def _drop_deleted(self, ordinals):
+        """
+        Removes the deleted documents (tombstones) from sorted
+        ordinals
+        """
+        if not self.tombstones:
+            return ordinals
+        if self._tombstone_array is None:
+            self._tombstone_array = np.array(sorted(self.tombstones))
+        return ordinals[~np.isin(ordinals, self._tombstone_array)]
+
+
+    def _get_weights(self, ordinals):
+        """
+        Returns the scoring weights of main segment documents
+        """
+        if self.doc_weights is None:
+            return self.tfidf_index[ordinals]
+        return self.doc_weights.rows(ordinals, len(self.word_idx))
+
+
+    def _row(self, ordinal):
+        """
+        Returns the columns and tf*idf weights of a document
+        of either segment, as lists
+        """
+        if ordinal >= self.delta.base:
+            cols, vals = self.delta.rows[ordinal-self.delta.base]
+            return cols.tolist(), vals.tolist()
+        matrix = self.tfidf_index
+        start, end = matrix.indptr[ordinal], matrix.indptr[ordinal+1]
+        return matrix.indices[start:end].tolist(), matrix.data[start:end].tolist()
+
+
+    def _vocabulary(self):
+        """
+        Returns the words by column (cached until the
+        vocabulary is renumbered)
+        """
+        if self._words is None:
+            self._words = sorted(self.word_idx, key=self.word_idx.get)
+        return self._words
+
+
+    def _match_phrase(self, field, stems, ordinals):
+        """
+        Keeps the documents, out of sorted ordinals having all the
+        given stems, in which the stems occur in a row within a
+        field ('title', 'concatenated_tags' or None for any)
+        """
+        if self.positional_index is None:
+            raise ValueError('Phrase and field queries need an index '
+                             'built with positions=True')
+        stride = 1 << 32
+        keys = None
+        for i, word in enumerate(stems):
+            owners, positions = self._get_positions(word, ordinals)
+            starts = positions.astype(np.int64) - i
+            valid = starts >= 0
+            word_keys = owners[valid]*stride + starts[valid]
+            if keys is None:
+                keys = word_keys
+            else:
+                keys = np.intersect1d(keys, word_keys, assume_unique=True)
+        owners, starts = keys // stride, keys % stride
+        if field is not None:
+            title_lengths = self._get_title_lengths(ordinals)[owners]
+            if field == 'title':
+                owners = owners[starts < title_lengths]
+            else:
+                owners = owners[starts > title_lengths]
+        return ordinals[np.unique(owners)]
+
+
+    def _get_positions(self, word, ordinals):
+        """
+        Returns the positions of a word in each of the given
+        (sorted) document ordinals, all of which contain it, as
+        two flat arrays: the index in 'ordinals' each position
+        belongs to, and the positions
+        """
+        ordinals = np.asarray(ordinals, dtype=np.int64)
+        n_main = np.searchsorted(ordinals, self.delta.base)
+        owners, positions = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int32)]
+        if n_main:
+            col = self.word_idx[word]
+            start, end = self.inverted_index.offsets[col], self.inverted_index.offsets[col+1]
+            postings = start + np.searchsorted(self.inverted_index.data[start:end],
+                                               ordinals[:n_main])
+            main_owners, main_positions = self.positional_index.gather(postings)
+            owners.append(main_owners)
+            positions.append(main_positions)
+        for i in range(n_main, len(ordinals)):
+            pos = self.delta.positions[(word, int(ordinals[i]))]
+            owners.append(np.full(len(pos), i, dtype=np.int64))
+            positions.append(pos)
+        return np.concatenate(owners), np.concatenate(positions)
+
+
+    def _get_title_lengths(self, ordinals):
+        if not len(self.delta):
+            return self.positional_index.title_lengths[ordinals]
+        title_lengths = np.concatenate((self.positional_index.title_lengths,
+                                        np.array(self.delta.title_lengths, dtype=np.int32)))
+        return title_lengths[ordinals]
+
+
+    def _live_positions(self, live, positional_index, inverted_index, delta_positions,
+                        delta_title_lengths):
+        """
+        Returns the positions of the documents of both segments
+        that are kept by a compaction (boolean mask 'live'), as
+        (word column, new ordinal, position) triplets, along
+        with their title lengths. The delta segment positions
+        are given as (word column, ordinal, positions) triplets.
+        """
+        cols, docs, positions = positional_index.to_triplets(inverted_index)
+        cols, docs, positions = [cols], [docs], [positions]
+        for col, ordinal, pos in delta_positions:
+            cols.append(np.full(len(pos), col, dtype=np.int64))
+            docs.append(np.full(len(pos), ordinal, dtype=np.int64))
+            positions.append(pos)
+        cols, docs = np.concatenate(cols), np.concatenate(docs)
+        positions = np.concatenate(positions)
+        title_lengths = np.concatenate((positional_index.title_lengths, delta_title_lengths))
+        keep = live[docs]
+        renumber = np.cumsum(live) - 1
+        return (cols[keep], renumber[docs[keep]], positions[keep],
+                title_lengths[live])
+
+
+    def _changed(self):
+        """
+        Bumps the index generation and starts a background
+        compaction once enough changes are pending
+        """
+        self.generation += 1
+        pending = len(self.delta) + len(self.tombstones)
+        if self.compact_every and pending >= self.compact_every:
+            if self._compactor is None or not self._compactor.is_alive():
+                self._compactor = threading.Thread(target=self.compact, daemon=True)
+                self._compactor.start()
+
+
+    def _split_shards(self, documents):
+        """
+        Splits the documents into contiguous shards holding
+        only the fields needed for text analysis
+        """
+        n_shards = 1 if self.workers <= 1 else self.workers*4
+        size = max(1, -(-len(documents) // n_shards))
+        shards = []
+        for i in range(0, len(documents), size):
+            docs = [(d['product_id'], d['title'], d['concatenated_tags'])\
+                    for d in documents[i:i+size]]
+            shards.append((self.analyzer, docs, self.store_positions))
+        return shards
+
+
+    def _new_documents(self, documents):
+        """
+        Returns the documents of a chunk whose products were
+        not indexed yet, each product once
+        """
+        seen, new = set(), []
+        for doc in documents:
+            product_id = doc['product_id']
+            if product_id not in self.doc_idx and product_id not in seen:
+                seen.add(product_id)
+                new.append(doc)
+        return new
+
+
+    def _merge_shard(self, term_freq, doc_freq, tokens):
+        """
+        Merges a partial index into the global one and returns
+        its term frequencies as (row, column, tf) arrays. Shards
+        must be merged in order: words and documents get their
+        columns and rows by first appearance, exactly as if
+        the whole dataset was processed at once. The analyzed
+        words of each document, if kept, are appended to
+        'tokens' as (title length, word columns).
+        """
+        for word, n_docs in doc_freq.items():
+            if word not in self.inv_doc_freq:
                 self.inv_doc_freq[word] = 0
-            self.inv_doc_freq[word] += 1
-        return words_doc
+                self.word_idx[word] = len(self.word_idx)
+            self.inv_doc_freq[word] += n_docs
+        rows, cols, vals = [], [], []
+        for product_id, tf, _, text in term_freq:
+            row = self.doc_idx.setdefault(product_id, len(self.doc_idx))
+            for word, value in tf.items():
+                rows.append(row)
+                cols.append(self.word_idx[word])
+                vals.append(value)
+            if text is not None:
+                title_length, words = text
+                tokens.append((title_length, np.array([self.word_idx[w] for w in words],
+                                                      dtype=np.int32)))
+        return (np.array(rows, dtype=np.int32), np.array(cols, dtype=np.int32),
+                np.array(vals, dtype=np.float64))
 
 
-    def _create_tfidf_index(self, features):
+    def _create_tfidf_index(self, triplets):
         """
         Creates a sparse matrix where rows are indexed by documents
         and columns are the vocabulary. The matrix stores the
-        tf*idf values found while building the index.
-        """
-        rows = len(self.term_freq.keys())
-        cols = len(self.inv_doc_freq.keys())
-        matrix = np.zeros((rows, cols))
-        n_feat = len(self.features)
-        feat_mat = np.zeros((rows, n_feat))
-        for i, doc in enumerate(self.term_freq.keys()):
-            for j, word in enumerate(self.inv_doc_freq.keys()):
-                if word in self.term_freq[doc].keys():
-                    tf = self.term_freq[doc][word]
-                    idf = self.inv_doc_freq[word]
-                    matrix[i,j] = tf*idf
-            for k in range(n_feat):
-                feat_mat[i,k] = features[doc][k]
-        matrix = np.hstack((matrix, feat_mat))
+        tf*idf values found while building the index. It is built
+        from the (row, column, tf) triplets of every shard (see
+        _merge_shard()) as a COO matrix, weighted by the idf of
+        each column, which is then compressed into rows (CSR).
+        """
+        empty = (np.zeros(0, dtype=np.int32),)*2 + (np.zeros(0),)
+        rows, cols, tf = (np.concatenate([t[i] for t in triplets] + [empty[i]])\
+                          for i in range(3))
+        idf = np.array([self.inv_doc_freq[w] for w in self.word_idx], dtype=np.float64)
+        shape = (len(self.doc_idx), len(self.word_idx))
+        matrix = sparse.coo_matrix((tf*idf[cols], (rows, cols)), shape=shape)
+        matrix = matrix.tocsr()
+        matrix.sort_indices()
         return matrix
 
         
+    def _create_inverted_index(self, matrix, word_idx):
+        """
+        Builds the postings from a TF-IDF matrix: the postings
+        of a word are the rows of its column, so the inverted
+        index is the CSC layout of the matrix without weights
+        """
+        postings = matrix.tocsc()
+        postings.sort_indices()
+        return pst.InvertedIndex(word_idx, postings.indptr.astype(np.int64),
+                                 postings.indices.astype(np.int32))
+
+
+    def _create_doc_weights(self, matrix):
+        """
+        Stores the scoring weights of a TF-IDF matrix in reduced
+        precision, unless the precision is float64 (see
+        weights.DocWeights)
+        """
+        if self.precision == 'float64':
+            return None
+        return wgt.DocWeights.from_matrix(matrix, self.precision)
+
+
+    def _create_bm25_index(self):
+        """
+        Computes the BM25 impacts of the postings and the impact
+        upper bound of every word (see bm25.BM25Index)
+        """
+        words = sorted(self.word_idx, key=self.word_idx.get)
+        idf = np.array([self.inv_doc_freq[w] for w in words], dtype=np.float64)
+        return bm.BM25Index.from_matrix(self.tfidf_index, idf, self.doc_lengths)
+
+
+    def _create_positional_index(self, tokens):
+        """
+        Builds the positions of the postings from the analyzed
+        words of each document, in ordinal order (see
+        _merge_shard() and postings.PositionalIndex)
+        """
+        return pst.PositionalIndex.from_tokens([t for _, t in tokens],
+                                               [n for n, _ in tokens])
+
+
+    def _calculate_doc_norms(self, matrix, features):
+        """
+        Precomputes the euclidean norm of every (V+F) document
+        vector, so that ranking does not need to recompute them
+        """
+        text = np.asarray(matrix.multiply(matrix).sum(axis=1))
+        feat = np.square(features).sum(axis=1)
+        return np.sqrt(text.ravel() + feat)
+
+
     def _number_to_word(self, tokens):
         """
         Given a list of tokens, it converts the
         numeric to written representation.
         """
-        new_tokens = []
-        for t in tokens:
-            try:
-                word = num2words(t, lang='pt_BR')
-                word = nltk.word_tokenize(word, language='portuguese')
-                new_tokens += word
-            except:
-                new_tokens.append(t)
-        return new_tokens
+        return self.analyzer.number_to_word(tokens)
 
     
-    def _generate_stop_words(self):
+    def _generate_stop_words(self, stop_words=None):
         """
         Creates a list of stop words in Portuguese
+        (see lexicon.load_resources())
         """
         punctuation = string.punctuation
         punctuation += "+-/'\\"
-        stop_words  = nltk.corpus.stopwords.words('portuguese')
+        if stop_words is None:
+            stop_words = lex.load_resources()['stop_words']
         return list(punctuation) + stop_words
 
 
@@ -212,7 +1002,7 @@ class Indexer():
         belong to the actual document to be indexed.
         """
         fields = ['query', 'search_page', 'position']
-        dataset = dataset.drop(fields, axis=1)
+        dataset = dataset.drop(fields, axis=1, errors='ignore')
         return dataset.to_dict(orient='records')
 
 
@@ -223,29 +1013,279 @@ class Indexer():
         return features
 
 
+    def _scan_max_features(self, dataset_path):
+        """
+        First pass over the dataset: streams only the feature
+        columns and returns their maximum values
+        """
+        import pandas as pd
+        max_features = {f:np.nan for f in self.features}
+        for chunk in pd.read_csv(dataset_path, usecols=self.features,
+                                 chunksize=self.chunk_size):
+            chunk_max = self._calculate_max_features(chunk)
+            for feat in self.features:
+                max_features[feat] = np.fmax(max_features[feat], chunk_max[feat])
+        return max_features
+
+
+    def _read_documents(self, dataset_path):
+        """
+        Second pass over the dataset: yields the documents in
+        chunks of at most 'chunk_size' rows, reading only the
+        [doc] fields
+        """
+        import pandas as pd
+        eval_fields = ['query', 'search_page', 'position']
+        for chunk in pd.read_csv(dataset_path, chunksize=self.chunk_size,
+                                 usecols=lambda c: c not in eval_fields):
+            yield self._drop_fields(chunk)
+
+
+    def _create_suggestions(self, dataset_path):
+        """
+        Builds the typeahead completions from the titles and tags
+        of the products and the 'query' column of the dataset,
+        read again and counted in chunks
+        """
+        import pandas as pd
+        with self.instrumentation.trace('create_suggestions'):
+            print('>>> Creating typeahead suggestions...')
+            documents, queries, seen = None, None, set()
+            fields = ['product_id', 'query', 'title', 'concatenated_tags', 'order_counts']
+            for chunk in pd.read_csv(dataset_path, chunksize=self.chunk_size,
+                                     usecols=lambda c: c in fields):
+                orders = chunk['order_counts'].fillna(0).tolist()
+                if 'query' in chunk:
+                    queries = sgg.count_queries(zip(chunk['query'].tolist(), orders), queries)
+                new = ~chunk['product_id'].duplicated().to_numpy()
+                new &= ~chunk['product_id'].isin(seen).to_numpy()
+                seen.update(chunk['product_id'][new].tolist())
+                texts = chunk['title'].fillna('') + ' ' + chunk['concatenated_tags'].fillna('')
+                documents = sgg.count_documents(zip(texts[new].tolist(),
+                                                    np.array(orders)[new].tolist()), documents)
+            documents = documents or sgg.count_documents([])
+            queries = queries or sgg.count_queries([])
+            return sgg.Suggester.from_counts(*documents, *queries, self.stop_words)
+
+
+    def _reset_indexes(self):
+        self.tfidf_index = None
+        self.feature_index = None
+        self.doc_norms = None
+        self.doc_ids = None
+        self.doc_idx = {}
+        self.word_idx = {}
+        self.inverted_index = None
+        self.inv_doc_freq = {}
+        self.doc_freq = {}
+        self._words = None
+        self.documents = None
+        self.attributes = None
+        self.doc_lengths = None
+        self.bm25 = None
+        self.positional_index = None
+        self.doc_weights = None
+        self.suggestions = None
+        self.fuzzy_index = None
+
+
+    def _index_path(self, datapath):
+        return datapath[:-4]+'_processed.idx'
+
+
     def _store_indexes(self, datapath):
-        index_path = datapath[:-4]+'_processed.npz'
+        """
+        Writes the indexes as flat binary sections (see storage).
+        Term frequencies are not stored: they are recovered from
+        the TF-IDF matrix when needed (see get_term_freq()).
+        """
         print('>>> Saving processed indexes for fast loading...')
-        np.savez(index_path, 
-                 inverted_index=self.inverted_index,
-                 tfidf_index=self.tfidf_index,
-                 word_idx=self.word_idx,
-                 doc_idx=self.doc_idx,
-                 inv_doc_freq=self.inv_doc_freq,
-                 term_freq=self.term_freq,
-                 documents=self.documents)
+        self.compact()
+        codec = 'varint' if self.compress_postings else 'raw'
+        offsets, postings = self.inverted_index.to_arrays(codec)
+        words = sorted(self.word_idx, key=self.word_idx.get)
+        vocabulary, vocab_offsets, _ = stg.pack_strings(words)
+        sections = {'tfidf_data': self.tfidf_index.data,
+                    'tfidf_indices': self.tfidf_index.indices,
+                    'tfidf_indptr': self.tfidf_index.indptr,
+                    'feature_index': self.feature_index,
+                    'doc_norms': self.doc_norms,
+                    'doc_ids': self.doc_ids,
+                    'doc_lengths': self.doc_lengths,
+                    'postings_offsets': offsets,
+                    'postings_data': postings,
+                    'vocabulary': vocabulary,
+                    'vocabulary.offsets': vocab_offsets,
+                    'inv_doc_freq': np.array([self.inv_doc_freq[w] for w in words]),
+                    'doc_freq': np.array([self.doc_freq[w] for w in words],
+                                         dtype=np.int64)}
+        sections.update(self.documents.to_sections())
+        sections.update(self.attributes.to_sections())
+        sections.update(self.bm25.to_sections())
+        if self.doc_weights is not None:
+            sections.update(self.doc_weights.to_sections())
+        if self.positional_index is not None:
+            sections.update(self.positional_index.to_sections())
+        if self.suggestions is not None:
+            sections.update(self.suggestions.to_sections())
+        if self.fuzzy_index is not None:
+            sections.update(self.fuzzy_index.to_sections())
+        header = {'dataset_hash': self.dataset_hash,
+                  'tfidf_shape': list(self.tfidf_index.shape),
+                  'n_doc': int(self.n_doc),
+                  'features': self.features,
+                  'max_features': {f: float(v) for f,v in self.max_features.items()},
+                  'postings_codec': codec,
+                  'doc_fields': self.documents.fields,
+                  'doc_kinds': self.documents.kinds,
+                  'bm25': self.bm25.params(),
+                  'positions': self.positional_index is not None,
+                  'precision': self.precision,
+                  'fuzzy': self.fuzzy_index.max_distance if self.fuzzy_index is not None\
+                           else None}
+        stg.write_index(self._index_path(datapath), header, sections)
 
 
     def _load_indexes(self, datapath):
-        index_path = datapath[:-4]+'_processed.npz'
-        indexes = np.load(index_path, allow_pickle=True)
-        self.inverted_index = indexes['inverted_index'].item()
-        self.tfidf_index = indexes['tfidf_index']
-        self.word_idx = indexes['word_idx'].item()
-        self.doc_idx = indexes['doc_idx'].item()
-        self.inv_doc_freq = indexes['inv_doc_freq'].item()
-        self.term_freq = indexes['term_freq'].item()
-        self.documents = indexes['documents'].item()
+        """
+        Opens a stored index. Returns False if there is none,
+        or if it was written by another format version or
+        built from different dataset contents.
+        """
+        index_path = self._index_path(datapath)
+        if not os.path.exists(index_path):
+            return False
+        index_file = stg.IndexFile(index_path)
+        if index_file.version != stg.FORMAT_VERSION or\
+           index_file.dataset_hash != self.dataset_hash:
+            print('>>> Preprocessed index is outdated. Rebuilding...')
+            return False
+        if self.store_positions and not index_file.header.get('positions'):
+            print('>>> Preprocessed index has no positions. Rebuilding...')
+            return False
+        if self.store_fuzzy and not index_file.header.get('fuzzy'):
+            print('>>> Preprocessed index has no fuzzy index. Rebuilding...')
+            return False
+        print('>>> Preprocessed index found. Loading...')
+        self._index_file = index_file
+        header = index_file.header
+        self.n_doc = header['n_doc']
+        self.max_features = header['max_features']
+        self.delta = sgm.DeltaSegment(header['tfidf_shape'][0], len(self.features))
+        return True
+
+
+    def _load_section(self, name):
+        """
+        Reads an index attribute from the index file
+        (see storage.LazySection)
+        """
+        if '_index_file' not in self.__dict__:
+            raise AttributeError(name)
+        index_file = self._index_file
+        if name == 'tfidf_index':
+            return sparse.csr_matrix((index_file.array('tfidf_data'),
+                                      index_file.array('tfidf_indices'),
+                                      index_file.array('tfidf_indptr')),
+                                     shape=tuple(index_file.header['tfidf_shape']))
+        elif name in ['feature_index', 'doc_norms', 'doc_ids', 'doc_lengths']:
+            return index_file.array(name)
+        elif name == 'doc_idx':
+            return {d:i for i,d in enumerate(self.doc_ids.tolist())}
+        elif name == 'word_idx':
+            words = stg.unpack_strings(index_file.array('vocabulary'),
+                                       index_file.array('vocabulary.offsets'))
+            return {w:i for i,w in enumerate(words)}
+        elif name == 'inverted_index':
+            return pst.InvertedIndex.from_arrays(self.word_idx,
+                                                 index_file.array('postings_offsets'),
+                                                 index_file.array('postings_data'),
+                                                 index_file.header['postings_codec'])
+        elif name in ['inv_doc_freq', 'doc_freq']:
+            return dict(zip(self.word_idx, index_file.array(name).tolist()))
+        elif name == 'attributes':
+            return atr.AttributeStore.from_index_file(index_file)
+        elif name == 'doc_weights':
+            if self.precision == 'float64':
+                return None
+            if index_file.header['precision'] == self.precision:
+                return wgt.DocWeights.from_index_file(index_file,
+                                                      index_file.array('tfidf_indptr'),
+                                                      index_file.array('tfidf_indices'),
+                                                      index_file.header['tfidf_shape'])
+            weights = self._create_doc_weights(self._load_section('tfidf_index'))
+            index_file.release('tfidf_data')
+            return weights
+        elif name == 'bm25':
+            return bm.BM25Index.from_index_file(index_file)
+        elif name == 'positional_index':
+            if not index_file.header.get('positions'):
+                return None
+            return pst.PositionalIndex.from_index_file(index_file)
+        elif name == 'documents':
+            return dcs.DocumentStore.from_index_file(index_file)
+        elif name == 'fuzzy_index':
+            if not index_file.header.get('fuzzy'):
+                return None
+            return fzz.DeleteIndex.from_index_file(index_file)
+        elif name == 'suggestions':
+            if 'suggest.keys' not in index_file:
+                return None
+            return sgg.Suggester.from_index_file(index_file)
+        raise AttributeError(name)
+
+
+def _index_shard(shard):
+    """
+    Analyzes a shard of (product_id, title, tags) documents.
+    Returns the term frequencies of each document, in order,
+    and the document frequency of each word of the shard, in
+    order of first appearance. If positions are kept, the
+    analyzed words of each document are returned as well.
+    """
+    analyzer, documents, positions = shard
+    term_freq, doc_freq = [], {}
+    for product_id, title, tags in documents:
+        title = analyzer.analyze(title)
+        text = title + analyzer.analyze(tags)
+        tf = _count_frequency(text)
+        for word in tf:
+            doc_freq[word] = doc_freq.get(word, 0) + 1
+        tokens = (len(title), text) if positions else None
+        term_freq.append((product_id, tf, len(text), tokens))
+    return term_freq, doc_freq
+
+
+def _count_words(text):
+    counts = {}
+    for word in text:
+        counts[word] = counts.get(word, 0) + 1
+    return counts
+
+
+def _word_positions(text, title_length):
+    """
+    Returns the positions of each word of an analyzed document
+    (see postings.PositionalIndex)
+    """
+    positions = {}
+    for i, word in enumerate(text):
+        positions.setdefault(word, []).append(i if i < title_length else i+1)
+    return positions
+
+
+def _count_frequency(text):
+    """
+    Calculates and return the normalized term frequency (TF)
+    of a given document
+    """
+    n_words = len(text)
+    words_doc = {}
+    for word in text:
+        words_doc[word] = words_doc.get(word, 0) + 1
+    for word in words_doc.keys():
+        words_doc[word] /= n_words
+    return words_doc
 
 
 
@@ -0,0 +1,205 @@
+import time
+import threading
+from collections import deque
+
+
+class Instrumentation():
+
+    def __init__(self, timer=time.perf_counter, slow_query_ms=None,
+                 slow_log_size=100, on_slow_query=None, hooks=()):
+        """
+        Collects per-stage timings and counters of the search and
+        indexing paths. Each instrumented call is recorded as a
+        Trace (see trace()), which is merged into the totals when
+        it ends. 'timer' returns the current time in seconds and
+        can be replaced (e.g. by a CPU clock). Calls slower than
+        'slow_query_ms' are kept in a bounded slow-query log and
+        passed to 'on_slow_query', if given. Every 'hooks' function
+        is called with (stage, seconds) when a stage ends, so
+        that timings can be exported elsewhere.
+        """
+        self.enabled = True
+        self.timer = timer
+        self.slow_query_ms = slow_query_ms
+        self.on_slow_query = on_slow_query
+        self.hooks = list(hooks)
+        self.slow_queries = deque(maxlen=slow_log_size)
+        self._lock = threading.Lock()
+        self.reset()
+
+
+    def trace(self, name, **info):
+        """
+        Returns a Trace for one call of 'name', to be used as a
+        context manager. 'info' (e.g. the queries) is only kept
+        if the call ends up in the slow-query log.
+        """
+        return Trace(self, name, info)
+
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}
+            self.counters = {}
+            self.slow_queries.clear()
+
+
+    def snapshot(self):
+        """
+        Returns the current statistics: total and mean time (ms)
+        of each stage, counters, derived ratios and the slow-query log
+        """
+        with self._lock:
+            stages = {name: {'calls': calls, 'total_ms': 1000*total,
+                             'mean_ms': 1000*total/calls if calls else 0.0}\
+                      for name, (calls, total) in self.stages.items()}
+            counters = dict(self.counters)
+            slow = list(self.slow_queries)
+        ratios = {}
+        if counters.get('filter_input'):
+            ratios['filter_selectivity'] = counters.get('filter_output', 0)/counters['filter_input']
+        if counters.get('queries'):
+            ratios['candidates_per_query'] = counters.get('candidates_scored', 0)/counters['queries']
+        return {'stages': stages, 'counters': counters, 'ratios': ratios,
+                'slow_queries': slow}
+
+
+    def _merge(self, trace, elapsed):
+        with self._lock:
+            for name, seconds in trace.timings.items():
+                calls, total = self.stages.get(name, (0, 0.0))
+                self.stages[name] = (calls+1, total+seconds)
+            calls, total = self.stages.get(trace.name, (0, 0.0))
+            self.stages[trace.name] = (calls+1, total+elapsed)
+            for name, n in trace.counters.items():
+                self.counters[name] = self.counters.get(name, 0) + n
+            slow = self.slow_query_ms is not None and 1000*elapsed >= self.slow_query_ms
+            if slow:
+                entry = dict(trace.info, call=trace.name, elapsed_ms=1000*elapsed,
+                             stages={n: 1000*s for n,s in trace.timings.items()},
+                             counters=dict(trace.counters))
+                self.slow_queries.append(entry)
+        if slow and self.on_slow_query is not None:
+            self.on_slow_query(entry)
+
+
+
+class Trace():
+
+    def __init__(self, instrumentation, name, info):
+        """
+        Timings and counters of a single instrumented call
+        """
+        self.instrumentation = instrumentation
+        self.name = name
+        self.info = info
+        self.timer = instrumentation.timer
+        self.timings = {}
+        self.counters = {}
+        self.enabled = True
+
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+
+    def __enter__(self):
+        self.start = self.timer()
+        return self
+
+
+    def __exit__(self, *exc):
+        self.instrumentation._merge(self, self.timer()-self.start)
+        return False
+
+
+
+class _Stage():
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+
+    def __enter__(self):
+        self.start = self.trace.timer()
+
+
+    def __exit__(self, *exc):
+        seconds = self.trace.timer() - self.start
+        timings = self.trace.timings
+        timings[self.name] = timings.get(self.name, 0.0) + seconds
+        for hook in self.trace.instrumentation.hooks:
+            hook(self.name, seconds)
+        return False
+
+
+
+class _NullContext():
+    """
+    Shared no-op context manager, trace and instrumentation:
+    disabled instrumentation costs a couple of attribute
+    lookups and calls per stage.
+    """
+    enabled = False
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        return False
+
+
+    def trace(self, name, **info):
+        return self
+
+
+    def stage(self, name):
+        return self
+
+
+    def count(self, name, n=1):
+        pass
+
+
+    def reset(self):
+        pass
+
+
+    def snapshot(self):
+        return {'stages': {}, 'counters': {}, 'ratios': {}, 'slow_queries': []}
+
+
+
+DISABLED = _NullContext()
+
+
+def format_snapshot(snapshot):
+    """
+    Returns a snapshot (see Instrumentation.snapshot()) as
+    printable text
+    """
+    lines = []
+    if snapshot['stages']:
+        lines.append('{:<22}{:>8}{:>12}{:>12}'.format('stage', 'calls', 'total ms', 'mean ms'))
+        for name, stage in sorted(snapshot['stages'].items()):
+            lines.append('{:<22}{:>8}{:>12.3f}{:>12.4f}'.format(
+                name, stage['calls'], stage['total_ms'], stage['mean_ms']))
+    for name, value in sorted(snapshot['counters'].items()):
+        lines.append('{:<22}{:>8}'.format(name, value))
+    for name, value in sorted(snapshot['ratios'].items()):
+        lines.append('{:<22}{:>12.4f}'.format(name, value))
+    if 'cache' in snapshot:
+        cache = snapshot['cache']
+        lines.append('{:<22}{:>8} hits, {} misses ({:.1%})'.format(
+            'cache', cache['hits'], cache['misses'], cache['hit_rate']))
+    for entry in snapshot['slow_queries']:
+        lines.append('slow {}: {:.3f} ms {}'.format(entry['call'], entry['elapsed_ms'],
+                                                     entry.get('queries', '')))
+    return '\n'.join(lines)
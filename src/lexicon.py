@@ -0,0 +1,128 @@
+import os
+import json
+
+
+RESOURCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'resources', 'portuguese.json')
+RESOURCE_VERSION = 1
+
+_MISSING = ('Portuguese stop words and RSLP rules not found. Build {} with '
+            '"python -m src.lexicon" on a machine with the NLTK "stopwords" and '
+            '"rslp" data'.format(RESOURCE_PATH))
+
+
+def load_resources(path=None):
+    """
+    Returns the Portuguese stop words and RSLP stemmer rules
+    used by the analyzer, as a dict with 'stop_words' and
+    'rslp'. They are read from a precompiled artifact (by default
+    the one in src/resources, see build_resources()); without
+    it, they are compiled from the NLTK data of this machine,
+    which is downloaded first if missing (see
+    compile_resources()).
+    """
+    path = path or os.environ.get('SEARCH_ENGINE_LEXICON', RESOURCE_PATH)
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            resources = json.load(f)
+        if resources.get('version') != RESOURCE_VERSION:
+            raise ValueError('{} has an unsupported version'.format(path))
+        return resources
+    return compile_resources()
+
+
+def compile_resources(download=True):
+    """
+    Reads the stop words and the RSLP rules from the local
+    NLTK data. If they are not installed, the NLTK "stopwords"
+    and "rslp" data are downloaded first (unless 'download' is
+    False); LookupError is raised if they are still missing.
+    """
+    try:
+        stop_words, rules = _read_nltk()
+    except LookupError:
+        if not download:
+            raise LookupError(_MISSING)
+        import nltk
+        print('>>> NLTK stopwords and rslp data not found and no {}: downloading '
+              'them...'.format(os.path.basename(RESOURCE_PATH)))
+        for resource in ['stopwords', 'rslp']:
+            nltk.download(resource, quiet=True)
+        try:
+            stop_words, rules = _read_nltk()
+        except LookupError:
+            raise LookupError(_MISSING)
+    return {'version': RESOURCE_VERSION, 'stop_words': stop_words, 'rslp': rules}
+
+
+def build_resources(path=RESOURCE_PATH):
+    """
+    Compiles the resources from the local NLTK data and writes
+    them to 'path', so that later starts need neither NLTK
+    nor its data
+    """
+    resources = compile_resources()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(resources, f, ensure_ascii=False, indent=1)
+        f.write('\n')
+    return path
+
+
+def _read_nltk():
+    import nltk
+    from nltk.stem import RSLPStemmer
+    stop_words = nltk.corpus.stopwords.words('portuguese')
+    return stop_words, [[list(rule) for rule in step] for step in RSLPStemmer()._model]
+
+
+
+class RSLPStemmer():
+
+    def __init__(self, rules):
+        """
+        Stemmer for Portuguese (Removedor de Sufixos da Lingua
+        Portuguesa), following the algorithm of nltk's RSLPStemmer
+        but built from already parsed rules (see load_resources()).
+        'rules' holds the rules of each step as lists of
+        [suffix, minimum stem size, replacement, exceptions].
+        """
+        self.rules = [[(suffix, size, replacement, frozenset(exceptions))\
+                       for suffix, size, replacement, exceptions in step]\
+                      for step in rules]
+
+
+    def stem(self, word):
+        word = word.lower()
+        if not word:
+            return word
+        if word[-1] == 's':
+            word = self.apply_rule(word, 0)
+        if word and word[-1] == 'a':
+            word = self.apply_rule(word, 1)
+        word = self.apply_rule(word, 3)
+        word = self.apply_rule(word, 2)
+        prev_word = word
+        word = self.apply_rule(word, 4)
+        if word == prev_word:
+            word = self.apply_rule(word, 5)
+            if word == prev_word:
+                word = self.apply_rule(word, 6)
+        return word
+
+
+    def apply_rule(self, word, step):
+        """
+        Replaces the suffix of the first rule of a step that
+        matches the word
+        """
+        for suffix, size, replacement, exceptions in self.rules[step]:
+            n = len(suffix)
+            if word[-n:] == suffix and len(word) >= n+size and word not in exceptions:
+                return word[:-n] + replacement
+        return word
+
+
+
+if __name__=="__main__":
+    print(">>> Resources written to", build_resources())
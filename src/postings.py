@@ -0,0 +1,273 @@
+import numpy as np
+
+
+GALLOP_RATIO = 8
+
+
+class InvertedIndex():
+
+    def __init__(self, word_idx, offsets, data):
+        """
+        Inverted index of the form word -> postings, where
+        each postings list is a sorted array of unique internal
+        document ordinals. All lists are stored back to back
+        in a single typed array ('data'), in the column order
+        given by 'word_idx', and delimited by 'offsets'.
+        """
+        self.word_idx = word_idx
+        self.offsets = offsets
+        self.data = data
+
+
+    @classmethod
+    def from_pairs(cls, word_idx, cols, docs):
+        """
+        Builds the index from (word column, document ordinal)
+        pairs, in any order and possibly repeated
+        """
+        cols = np.asarray(cols, dtype=np.int64)
+        docs = np.asarray(docs, dtype=np.int64)
+        n_docs = docs.max()+1 if len(docs) else 1
+        keys = np.unique(cols*n_docs + docs)
+        cols, docs = keys // n_docs, keys % n_docs
+        offsets = np.searchsorted(cols, np.arange(len(word_idx)+1))
+        return cls(word_idx, offsets.astype(np.int64), docs.astype(np.int32))
+
+
+    @classmethod
+    def from_arrays(cls, word_idx, offsets, data, codec='raw'):
+        """
+        Rebuilds the index from the arrays returned by to_arrays()
+        """
+        if codec == 'varint':
+            data = decode_varint(data, offsets)
+        return cls(word_idx, offsets, data)
+
+
+    def to_arrays(self, codec='raw'):
+        """
+        Returns (offsets, data) ready to be stored. With the
+        'varint' codec, each list is delta encoded and written
+        as variable-length bytes; 'offsets' still refer to
+        the number of postings, not bytes.
+        """
+        if codec == 'varint':
+            return self.offsets, encode_varint(self.data, self.offsets)
+        return self.offsets, self.data
+
+
+    def get(self, word):
+        """
+        Returns the postings of a word, or an empty array if
+        the word is not indexed (or was added to 'word_idx'
+        after this index was built)
+        """
+        col = self.word_idx.get(word)
+        if col is None or col+1 >= len(self.offsets):
+            return self.data[:0]
+        return self.data[self.offsets[col]:self.offsets[col+1]]
+
+
+    def __getitem__(self, word):
+        col = self.word_idx[word]
+        return self.data[self.offsets[col]:self.offsets[col+1]]
+
+
+    def __contains__(self, word):
+        return word in self.word_idx
+
+
+    def __len__(self):
+        return len(self.word_idx)
+
+
+    def keys(self):
+        return self.word_idx.keys()
+
+
+
+class PositionalIndex():
+
+    def __init__(self, offsets, data, title_lengths):
+        """
+        Positions of the words in each document, aligned with the
+        postings of an InvertedIndex: the positions of its i-th
+        posting (in the order of InvertedIndex.data) are the sorted
+        data[offsets[i]:offsets[i+1]]. Positions count analyzed
+        words: the ones of the title come first, followed by the
+        ones of the tags after a gap of one position, so that no
+        phrase spans both fields. 'title_lengths' holds the
+        number of analyzed title words of each document.
+        """
+        self.offsets = offsets
+        self.data = data
+        self.title_lengths = title_lengths
+
+
+    @classmethod
+    def from_triplets(cls, cols, docs, positions, title_lengths):
+        """
+        Builds the index from (word column, document ordinal,
+        position) triplets, in any order. Every (column, ordinal)
+        pair must be a posting of the matching inverted index.
+        """
+        cols = np.asarray(cols, dtype=np.int64)
+        docs = np.asarray(docs, dtype=np.int64)
+        positions = np.asarray(positions, dtype=np.int32)
+        order = np.lexsort((positions, docs, cols))
+        cols, docs, positions = cols[order], docs[order], positions[order]
+        new = np.ones(len(cols), dtype=bool)
+        new[1:] = (cols[1:] != cols[:-1]) | (docs[1:] != docs[:-1])
+        offsets = np.append(np.flatnonzero(new), len(cols)).astype(np.int64)
+        return cls(offsets, positions, np.asarray(title_lengths, dtype=np.int32))
+
+
+    @classmethod
+    def from_tokens(cls, tokens, title_lengths):
+        """
+        Builds the index from the analyzed words of each document,
+        given as arrays of word columns (title words followed by
+        tags words) in ordinal order
+        """
+        lengths = np.array([len(t) for t in tokens], dtype=np.int64)
+        title_lengths = np.asarray(title_lengths, dtype=np.int32)
+        cols = np.concatenate([np.asarray(t, dtype=np.int64) for t in tokens]\
+                              + [np.zeros(0, dtype=np.int64)])
+        docs = np.repeat(np.arange(len(tokens)), lengths)
+        starts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+        positions = np.arange(len(cols)) - starts
+        positions += positions >= np.repeat(title_lengths, lengths)
+        return cls.from_triplets(cols, docs, positions, title_lengths)
+
+
+    def to_triplets(self, inverted_index):
+        """
+        Inverse of from_triplets(), given the inverted index
+        this index is aligned with
+        """
+        n_cols = len(inverted_index.offsets) - 1
+        cols = np.repeat(np.arange(n_cols), np.diff(inverted_index.offsets))
+        counts = np.diff(self.offsets)
+        return (np.repeat(cols, counts), np.repeat(inverted_index.data, counts),
+                np.asarray(self.data))
+
+
+    def gather(self, postings):
+        """
+        Returns the positions of the given postings (indices
+        into InvertedIndex.data) as two flat arrays: the index in
+        'postings' each position belongs to, and the positions
+        """
+        starts, ends = self.offsets[postings], self.offsets[postings+1]
+        counts = ends - starts
+        owners = np.repeat(np.arange(len(postings)), counts)
+        flat = np.arange(counts.sum()) + np.repeat(starts - np.cumsum(counts) + counts, counts)
+        return owners, self.data[flat]
+
+
+    def to_sections(self, prefix='positions.'):
+        return {prefix+'offsets': self.offsets,
+                prefix+'data': self.data,
+                prefix+'title_lengths': self.title_lengths}
+
+
+    @classmethod
+    def from_index_file(cls, index_file, prefix='positions.'):
+        return cls(index_file.array(prefix+'offsets'),
+                   index_file.array(prefix+'data'),
+                   index_file.array(prefix+'title_lengths'))
+
+
+
+def union(postings):
+    """
+    Returns the sorted ordinals present in at least
+    one of the given postings lists
+    """
+    postings = [p for p in postings if len(p)]
+    if not postings:
+        return np.zeros(0, dtype=np.int32)
+    if len(postings) == 1:
+        return postings[0]
+    return np.unique(np.concatenate(postings))
+
+
+def intersection(postings, return_touched=False):
+    """
+    Returns the sorted ordinals present in all of the given
+    postings lists. Lists are intersected from the shortest one,
+    so the intermediate result never grows. When a list is much
+    longer than the current result (GALLOP_RATIO), it is not
+    merged: each remaining ordinal is looked up by binary search
+    in the part of the list between the first and last of them
+    (numpy's searchsorted resumes from the previous position for
+    sorted keys, as a galloping search does). With
+    'return_touched', the number of postings read is also
+    returned: merged lists count as a whole, searched ones as
+    one binary search per ordinal.
+    """
+    touched = 0
+    if not postings:
+        result = np.zeros(0, dtype=np.int32)
+        return (result, touched) if return_touched else result
+    postings = sorted(postings, key=len)
+    result = postings[0]
+    touched += len(result)
+    for p in postings[1:]:
+        if len(result) == 0:
+            break
+        if len(p) > GALLOP_RATIO*len(result):
+            lo, hi = np.searchsorted(p, (result[0], result[-1]+1))
+            window = p[lo:hi]
+            pos = np.searchsorted(window, result)
+            pos[pos == len(window)] = 0
+            found = window[pos] == result if len(window) else np.zeros(len(result), dtype=bool)
+            touched += len(result)*int(np.ceil(np.log2(len(window)+1))) + 2
+            result = result[found]
+        else:
+            result = np.intersect1d(result, p, assume_unique=True)
+            touched += len(p)
+    return (result, touched) if return_touched else result
+
+
+def encode_varint(data, offsets):
+    """
+    Delta encodes each postings list delimited by 'offsets'
+    and packs the gaps as LEB128 varints (7 bits per byte,
+    high bit set on every byte except the last one)
+    """
+    gaps = np.diff(data.astype(np.uint64), prepend=np.uint64(0))
+    starts = offsets[:-1][offsets[:-1] < offsets[1:]]
+    gaps[starts] = data[starts]
+    n_bytes = np.ones(len(gaps), dtype=np.int64)
+    for shift in (7, 14, 21, 28):
+        n_bytes += gaps >= (1 << shift)
+    ends = np.cumsum(n_bytes)
+    out = np.zeros(ends[-1] if len(ends) else 0, dtype=np.uint8)
+    first = ends - n_bytes
+    for k in range(5):
+        has = n_bytes > k
+        byte = (gaps[has] >> np.uint64(7*k)) & np.uint64(0x7f)
+        more = (n_bytes[has] > k+1).astype(np.uint64) << np.uint64(7)
+        out[first[has]+k] = byte | more
+    return out
+
+
+def decode_varint(buf, offsets):
+    """
+    Inverse of encode_varint()
+    """
+    buf = np.asarray(buf, dtype=np.uint8)
+    if len(buf) == 0:
+        return np.zeros(0, dtype=np.int32)
+    last = np.flatnonzero(buf < 0x80)
+    first = np.concatenate(([0], last[:-1]+1))
+    pos = np.arange(len(buf)) - np.repeat(first, last-first+1)
+    vals = (buf & 0x7f).astype(np.uint64) << (7*pos).astype(np.uint64)
+    gaps = np.add.reduceat(vals, first).astype(np.int64)
+    total = np.cumsum(gaps)
+    starts = offsets[:-1][offsets[:-1] < offsets[1:]]
+    base = np.zeros(len(gaps), dtype=np.int64)
+    base[starts] = total[starts] - gaps[starts]
+    base = np.maximum.accumulate(base)
+    return (total - base).astype(np.int32)
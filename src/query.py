@@ -0,0 +1,97 @@
+import re
+
+
+FIELDS = {'title': 'title', 'tags': 'concatenated_tags',
+          'concatenated_tags': 'concatenated_tags'}
+
+OPERATORS = ['or', 'and']
+
+TERM_RE = re.compile(r'(?:(\w+):)?"([^"]*)"?|(\S+)')
+
+
+class Query():
+
+    def __init__(self, words, clauses=()):
+        """
+        Preprocessed query. 'words' are the stems used to score
+        the products; 'clauses' are the conditions a product must
+        meet to be returned at all, as (field, stems) pairs: the
+        stems must occur in a row in the field ('title' or
+        'concatenated_tags'), or anywhere if the field is None.
+        A query without clauses returns every product that has
+        at least one of its words.
+        """
+        self.words = words
+        self.clauses = tuple(clauses)
+
+
+    def key(self):
+        """
+        Returns a hashable form of the query, equal for queries
+        returning the same results
+        """
+        return (tuple(sorted(self.words)), tuple(sorted(set(self.clauses), key=str)))
+
+
+    def needs_positions(self):
+        """
+        Whether matching the query needs positional postings
+        (phrases and field-scoped terms)
+        """
+        return any(field is not None or len(stems) > 1 for field, stems in self.clauses)
+
+
+
+def parse(text, analyzer, operator='or'):
+    """
+    Parses a query string. Besides plain words, it accepts:
+    - "exact phrase": the words must occur in this order
+    - field:word or field:"exact phrase": the word or phrase
+      must occur in the title or in the tags (field 'tags' or
+      'concatenated_tags')
+    - word AND word: both words must occur
+    Phrases and field-scoped terms are always required; plain
+    words are required only around AND, or everywhere if
+    'operator' is 'and'. Every word is used for scoring.
+    Queries without this syntax are analyzed as before.
+    """
+    if operator not in OPERATORS:
+        raise ValueError('Unknown operator: {}'.format(operator))
+    if not type(text) == str:
+        return Query([])
+    if operator == 'or' and '"' not in text and ':' not in text\
+       and 'AND' not in text.split():
+        return Query(analyzer.analyze(text))
+    terms = []
+    for match in TERM_RE.finditer(text):
+        field, phrase, word = match.groups()
+        if word == 'AND':
+            terms.append('AND')
+        elif word == 'OR':
+            terms.append('OR')
+        elif word is not None:
+            field, _, value = word.partition(':')
+            if value and field.lower() in FIELDS:
+                terms.append((FIELDS[field.lower()], analyzer.analyze(value), True, True))
+            else:
+                terms.append((None, analyzer.analyze(word), operator == 'and', False))
+        elif field is not None and field.lower() not in FIELDS:
+            terms.append((None, analyzer.analyze(field), operator == 'and', False))
+            terms.append((None, analyzer.analyze(phrase), True, True))
+        else:
+            field = FIELDS[field.lower()] if field else None
+            terms.append((field, analyzer.analyze(phrase), True, True))
+    words, clauses = [], []
+    for i, term in enumerate(terms):
+        if term in ('AND', 'OR'):
+            continue
+        field, stems, required, phrase = term
+        required = required or 'AND' in terms[max(i-1, 0):i] + terms[i+1:i+2]
+        words += stems
+        if not stems or not required:
+            continue
+        if phrase:
+            clauses.append((field, tuple(stems)))
+        else:
+            clauses += [(None, (s,)) for s in stems]
+    return Query(words, clauses)
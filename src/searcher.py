@@ -1,15 +1,90 @@
 import os
 import src.indexer as idx
+import src.cache as cch
+import src.instrumentation as ins
+import src.bm25 as bm
+import src.query as qry
+import src.postings as pst
+import src.snapshots as snp
+import src.fuzzy as fzz
+import threading
 import numpy as np
+from scipy import sparse
 
 
 class Searcher():
 
-    def __init__(self, index):
-        self.index = index
-        self.word_idx = index.word_idx
-        self.doc_idx = index.doc_idx
-        self.tfidf_index = index.tfidf_index
+    RANKINGS = ['cosine', 'bm25']
+
+
+    def __init__(self, index, cache_size=1024, cache_ttl=300, instrumentation=None,
+                 ranking='cosine', pruning=True, operator='or', fuzzy=False,
+                 fuzzy_budget=fzz.BUDGET):
+        """
+        Search engine over an Indexer. Results are kept in an
+        LRU cache of 'cache_size' queries for 'cache_ttl'
+        seconds (see cache.ResultCache); a cache size of 0
+        disables it. Stage timings and counters are collected
+        by 'instrumentation' (see instrumentation.Instrumentation),
+        if given.
+        'ranking' selects how products are scored:
+        - cosine: cosine similarity between tf*idf vectors, with
+          the non-textual features (default)
+        - bm25: BM25 over the text only, with MaxScore pruning
+          of the documents that cannot reach the top results
+          (see bm25.top_k()); 'pruning' can be turned off to
+          score every candidate.
+        Queries may hold phrases, field-scoped terms and AND (see
+        query.parse()); with 'operator' set to 'and', every word
+        of a query is required.
+        With 'fuzzy', words of a query that are not in the
+        vocabulary are replaced by the closest indexed ones (see
+        indexer.Indexer.correct()), comparing at most
+        'fuzzy_budget' candidates per query; the index must be
+        built with fuzzy=True.
+        The index is held as a snapshot (see snapshots.Snapshot)
+        that can be replaced while searches run (see swap() and
+        reload()); each search runs on a single snapshot.
+        """
+        if ranking not in self.RANKINGS:
+            raise ValueError('Unknown ranking: {}'.format(ranking))
+        if operator not in qry.OPERATORS:
+            raise ValueError('Unknown operator: {}'.format(operator))
+        self.operator = operator
+        self.ranking = ranking
+        self.pruning = pruning
+        if fuzzy and index.fuzzy_index is None:
+            raise ValueError('Fuzzy matching needs an index built with fuzzy=True')
+        self.fuzzy = fuzzy
+        self.fuzzy_budget = fuzzy_budget
+        self.snapshot = snp.Snapshot(index, 0)
+        self.cache = cch.ResultCache(cache_size, cache_ttl)
+        self.instrumentation = instrumentation or ins.DISABLED
+        self.reload_error = None
+        self._swap_lock = threading.Lock()
+        self._reloader = None
+
+
+    @property
+    def index(self):
+        """
+        The index of the current snapshot
+        """
+        return self.snapshot.index
+
+
+    @property
+    def analyzer(self):
+        return self.snapshot.index.analyzer
+
+
+    @property
+    def generation(self):
+        """
+        The generation of the current snapshot; it grows by one
+        at every swap
+        """
+        return self.snapshot.generation
 
 
     def search(self, query, prods_to_show=10, **kwargs):
@@ -18,60 +93,431 @@ class Searcher():
         query. The size of this list is limited by 'prods_to_show'.
         It is also possible to specify other query parameters
         (see _filter_by_params())
+        Changes made to the index are visible right away.
+        """
+        return self.search_many([query], prods_to_show, **kwargs)[0]
+
+
+    def search_many(self, queries, prods_to_show=10, **kwargs):
+        """
+        Returns, for each query of a list, the same ranking as
+        search() would. Queries not found in the cache are
+        stacked in a sparse query matrix and scored together
+        with a single sparse matrix product. The same filters
+        (kwargs) are applied to every query.
+        """
+        return self.search_versioned(queries, prods_to_show, **kwargs)[1]
+
+
+    def search_versioned(self, queries, prods_to_show=10, **kwargs):
+        """
+        Returns the generation of the snapshot a list of queries
+        was run on, along with their rankings (see search_many())
         """
-        query = self.index.preprocess(query)
-        query_vec = self._gen_query_vector(query)
-        products = self.index.get_document_ids(query)
-        similarities = self._cosine_similarity_docs(query_vec,products)
-        ranking = dict(sorted(similarities.items(), 
-                              key=lambda item: item[1], reverse=True))
-        ranking = list(ranking.keys())
-        if kwargs:
-            ranking = self._filter_by_params(ranking, kwargs)
-        return ranking[:int(prods_to_show)]
+        with self.instrumentation.trace('search', queries=queries, filters=kwargs) as trace,\
+             self._acquire() as snapshot:
+            index = snapshot.index
+            with trace.stage('preprocess'):
+                queries = [qry.parse(q, index.analyzer, self.operator) for q in queries]
+            trace.count('queries', len(queries))
+            prods_to_show = int(prods_to_show)
+            with index.lock:
+                queries = self._correct(index, queries, trace)
+                with trace.stage('cache'):
+                    filters = index.attributes.normalize(kwargs)
+                    generation = (snapshot.generation, index.generation)
+                    keys = [(q.key(), filters) for q in queries]
+                    rankings = [self.cache.get(key, prods_to_show, generation) for key in keys]
+                    missing = [i for i,r in enumerate(rankings) if r is None]
+                trace.count('cache_hits', len(queries)-len(missing))
+                if missing:
+                    ranked = self._rank(index, [queries[i] for i in missing], prods_to_show,
+                                        kwargs, trace)
+                    for i, (ordinals, _) in zip(missing, ranked):
+                        rankings[i] = index.get_product_ids(ordinals).tolist()
+                        self.cache.put(keys[i], prods_to_show, rankings[i], generation)
+                return snapshot.generation, rankings
 
 
-    def _gen_query_vector(self, query):
+    def search_scored(self, queries, prods_to_show=10, **kwargs):
         """
-        Given a preprocessed query, it returns a
-        transformed tf*idf associated vector
+        Returns, for each query of a list, the arrays of product
+        ids and scores of its ranking, bypassing the result cache
+        (see sharding.ShardedSearcher)
         """
-        vocab = len(self.word_idx.keys())
-        query_vec = np.zeros((vocab,))
-        for word in query:
-            if word in self.word_idx.keys():
-                query_vec[self.word_idx[word]] += 1
-        query_vec = query_vec/np.sum(query_vec)
-        for word in query:
-            if word in self.index.inv_doc_freq.keys():
-                idf = self.index.inv_doc_freq[word]
-                query_vec[self.word_idx[word]] *= idf
-        n_feat = self.index.get_number_features()
-        query_vec = np.hstack((query_vec, np.ones(n_feat,)))
-        return query_vec    
+        with self.instrumentation.trace('search', queries=queries, filters=kwargs) as trace,\
+             self._acquire() as snapshot:
+            index = snapshot.index
+            with trace.stage('preprocess'):
+                queries = [qry.parse(q, index.analyzer, self.operator) for q in queries]
+            trace.count('queries', len(queries))
+            with index.lock:
+                queries = self._correct(index, queries, trace)
+                ranked = self._rank(index, queries, int(prods_to_show), kwargs, trace)
+                return [(index.get_product_ids(ordinals), scores)\
+                        for ordinals, scores in ranked]
 
 
-    def _cosine_similarity_docs(self, query_vec, docs):
+    def search_faceted(self, queries, prods_to_show=10, buckets=None, **kwargs):
         """
-        Calculates the cosine similarity between the
-        query transformed to the vector space (query_vec)
-        and a list of relevant product ids (docs).
+        Returns, for each query of a list, its ranking along with
+        the facets of all the products it matched, filters
+        applied (see attributes.AttributeStore.facets(), which
+        gets 'buckets'). Facets are counted over the ordinals
+        the ranking is drawn from, in one pass over the attribute
+        columns, instead of searching again per filter value.
+        The result cache is bypassed.
         """
-        similarities = {doc:0 for doc in docs}
-        for doc in docs:
-            doc_vec = self.index.get_vector_doc(doc)
-            dot = np.dot(query_vec, doc_vec)
-            norm1 = np.linalg.norm(query_vec)
-            norm2 = np.linalg.norm(doc_vec)
-            similarities[doc] = dot/(norm1 * norm2)
-        return similarities
+        with self.instrumentation.trace('search', queries=queries, filters=kwargs) as trace,\
+             self._acquire() as snapshot:
+            index = snapshot.index
+            with trace.stage('preprocess'):
+                queries = [qry.parse(q, index.analyzer, self.operator) for q in queries]
+            trace.count('queries', len(queries))
+            with index.lock:
+                queries = self._correct(index, queries, trace)
+                candidates = []
+                ranked = self._rank(index, queries, int(prods_to_show), kwargs, trace,
+                                    candidates)
+                with trace.stage('facets'):
+                    return [(index.get_product_ids(ordinals).tolist(),
+                             index.attributes.facets(found, buckets))\
+                            for (ordinals, _), found in zip(ranked, candidates)]
+
+
+    def suggest(self, prefix, k=10):
+        """
+        Returns up to 'k' completions of a partially typed query
+        (see indexer.Indexer.suggest())
+        """
+        with self.instrumentation.trace('suggest') as trace, self._acquire() as snapshot:
+            suggestions = snapshot.index.suggest(prefix, k)
+            trace.count('suggestions', len(suggestions))
+            return suggestions
+
+
+    def validate(self, query):
+        """
+        Raises ValueError if a query cannot be run on the current
+        index: phrases and field-scoped terms need an index built
+        with positions
+        """
+        index = self.index
+        if qry.parse(query, index.analyzer, self.operator).needs_positions()\
+           and index.positional_index is None:
+            raise ValueError('Phrase and field queries need an index '
+                             'built with positions=True')
+
+
+    def swap(self, index, timeout=None):
+        """
+        Replaces the index served by the Searcher, atomically:
+        searches started before keep running on the previous
+        snapshot, the following ones run on the new one. Waits
+        (up to 'timeout' seconds) for the searches still running
+        on the previous snapshot, which is then released.
+        Returns the generation of the new snapshot.
+        """
+        with self._swap_lock:
+            previous = self.snapshot
+            self.snapshot = snp.Snapshot(index, previous.generation+1)
+            generation = self.snapshot.generation
+        self.cache.clear()
+        previous.wait_idle(timeout)
+        return generation
+
+
+    def reload(self, dataset_path=None, warm_queries=(), timeout=None, **options):
+        """
+        Loads the index of a dataset (by default, the one of the
+        current index; it is rebuilt if outdated, see
+        indexer.Indexer) as a new snapshot, warms it up (see
+        indexer.Indexer.warm()) along with 'warm_queries', and
+        swaps it in (see swap()). Searches keep being served by
+        the current snapshot meanwhile. Index options default to
+        the ones of the current index. Returns the new generation.
+        """
+        current = self.index
+        index = idx.Indexer(dataset_path or current.dataset_path,
+                            **dict(current.settings, **options))
+        index.warm()
+        if warm_queries:
+            Searcher(index, cache_size=0, ranking=self.ranking, pruning=self.pruning,
+                     operator=self.operator, fuzzy=self.fuzzy,
+                     fuzzy_budget=self.fuzzy_budget).search_many(list(warm_queries))
+        return self.swap(index, timeout)
+
+
+    def reload_async(self, *args, **kwargs):
+        """
+        Runs reload() in a background thread, unless one is
+        already running. Returns whether a reload was started;
+        a failed reload leaves its error in 'reload_error'.
+        """
+        with self._swap_lock:
+            if self.reloading():
+                return False
+            self._reloader = threading.Thread(target=self._reload, args=args,
+                                              kwargs=kwargs, daemon=True)
+            self._reloader.start()
+            return True
+
+
+    def reloading(self):
+        return self._reloader is not None and self._reloader.is_alive()
 
 
-    def _filter_by_params(self, ranking, query_params):
+    def cache_stats(self):
+        """
+        Returns the hit/miss statistics of the result cache
+        """
+        return self.cache.stats()
+
+
+    def stats(self):
+        """
+        Returns a snapshot of the instrumentation statistics
+        (see instrumentation.Instrumentation.snapshot()) along
+        with the cache statistics
+        """
+        return dict(self.instrumentation.snapshot(), cache=self.cache_stats(),
+                    generation=self.generation)
+
+
+    def _acquire(self):
+        """
+        Returns the current snapshot, counting a search on it
+        (see snapshots.Snapshot)
+        """
+        with self._swap_lock:
+            return self.snapshot.acquire()
+
+
+    def _reload(self, *args, **kwargs):
+        try:
+            self.reload(*args, **kwargs)
+            self.reload_error = None
+        except Exception as e:
+            print('>>> Reload failed: {}'.format(e))
+            self.reload_error = e
+
+
+    def _rank(self, index, queries, prods_to_show, query_params, trace=ins.DISABLED,
+              candidates=None):
+        """
+        Scores and ranks the products of 'index' matching each
+        one of a list of parsed queries (see query.Query).
+        Returns the ordinals and scores of each ranking. If a
+        'candidates' list is given, the ordinals of all the
+        products each ranking was drawn from are appended to it.
+        """
+        if self.ranking == 'bm25':
+            return self._rank_bm25(index, queries, prods_to_show, query_params, trace,
+                                   candidates)
+        words = [w for q in queries if not q.clauses for w in q.words]
+        with trace.stage('candidates'):
+            query_mat = self._gen_query_vector(index, [q.words for q in queries])
+            products = index.get_document_ordinals(words)
+            matches = self._match(index, queries, trace)
+            if any(m is not None for m in matches):
+                products = pst.union([products] + [m for m in matches if m is not None])
+        if trace.enabled:
+            trace.count('postings_touched', index.count_postings(words))
+        if query_params:
+            with trace.stage('filter'):
+                trace.count('filter_input', len(products))
+                products = self._filter_by_params(index, products, query_params)
+                trace.count('filter_output', len(products))
+        with trace.stage('score'):
+            similarities = self._cosine_similarity_docs(index, query_mat, products)
+        trace.count('candidates_scored', similarities.nnz)
+        rankings = []
+        with trace.stage('sort'):
+            for i in range(len(queries)):
+                start, end = similarities.indptr[i], similarities.indptr[i+1]
+                rows = similarities.indices[start:end]
+                scores = similarities.data[start:end]
+                if matches[i] is not None:
+                    found = np.isin(products[rows], matches[i], assume_unique=True)
+                    rows, scores = rows[found], scores[found]
+                if candidates is not None:
+                    candidates.append(products[rows])
+                top = self._top_k(scores, prods_to_show)
+                rankings.append((products[rows[top]], scores[top]))
+        return rankings
+
+
+    def _rank_bm25(self, index, queries, prods_to_show, query_params, trace=ins.DISABLED,
+                   candidates=None):
+        """
+        Ranks each query with BM25. Filters and deleted documents
+        are applied as a mask while the postings are traversed.
+        As pruning skips products, the candidates (see _rank())
+        are gathered from the postings apart.
+        """
+        with trace.stage('filter'):
+            accept = index.attributes.mask(query_params)
+            tombstones = index.tombstones
+            if tombstones:
+                if accept is None:
+                    accept = np.ones(len(index.attributes), dtype=bool)
+                accept[list(tombstones)] = False
+        rankings = []
+        for query in queries:
+            with trace.stage('candidates'):
+                lists = index.get_bm25_postings(query.words)
+                seeds = index.get_delta_bm25(query.words)
+                matches = self._match(index, [query], trace)[0]
+            if matches is not None:
+                with trace.stage('score'):
+                    if accept is not None:
+                        matches = matches[accept[matches]]
+                    ordinals, scores, scored = bm.top_k_of(lists, prods_to_show, matches,
+                                                           seeds)
+            else:
+                trace.count('postings_touched', sum(len(p) for p,_,_ in lists))
+                with trace.stage('score'):
+                    ordinals, scores, scored = bm.top_k(lists, prods_to_show, accept, seeds,
+                                                        prune=self.pruning)
+            trace.count('candidates_scored', scored)
+            rankings.append((ordinals, scores))
+            if candidates is not None:
+                found = matches if matches is not None else\
+                        index.get_document_ordinals(query.words)
+                if accept is not None and matches is None:
+                    found = found[accept[found]]
+                candidates.append(found)
+        return rankings
+
+
+    def _correct(self, index, queries, trace=ins.DISABLED):
+        """
+        Replaces, in fuzzy mode, the words of each parsed query
+        that are not in the vocabulary by their closest indexed
+        word, if any is found within the budget of the query
+        """
+        if not self.fuzzy:
+            return queries
+        corrected = []
+        with trace.stage('fuzzy'):
+            for query in queries:
+                budget, corrections = self.fuzzy_budget, {}
+                words = query.words + [w for _, stems in query.clauses for w in stems]
+                for word in words:
+                    if word in corrections or word in index.word_idx:
+                        continue
+                    correction, spent = index.correct(word, budget)
+                    budget -= spent
+                    trace.count('fuzzy_candidates', spent)
+                    corrections[word] = correction or word
+                    trace.count('fuzzy_corrections', correction is not None)
+                if corrections:
+                    query = qry.Query([corrections.get(w, w) for w in query.words],
+                                      [(field, tuple(corrections.get(s, s) for s in stems))\
+                                       for field, stems in query.clauses])
+                corrected.append(query)
+        return corrected
+
+
+    def _match(self, index, queries, trace=ins.DISABLED):
+        """
+        Returns, for each parsed query, the sorted ordinals of the
+        products meeting its clauses (see indexer.Indexer.match()),
+        or None if it has no clauses
+        """
+        matches = []
+        for query in queries:
+            if not query.clauses:
+                matches.append(None)
+                continue
+            ordinals, touched = index.match(query.clauses)
+            trace.count('postings_touched', touched)
+            matches.append(ordinals)
+        return matches
+
+
+    def _gen_query_vector(self, index, queries):
+        """
+        Given a list of preprocessed queries, it returns the
+        transformed tf*idf associated vectors as the rows of
+        a sparse matrix. Only the vocabulary part (n x V) is
+        built; the F feature weights of a query are implicitly one.
+        """
+        word_idx = index.word_idx
+        inv_doc_freq = index.inv_doc_freq
+        rows, cols, vals = [], [], []
+        for i, query in enumerate(queries):
+            counts = {}
+            for word in query:
+                if word in word_idx:
+                    counts[word] = counts.get(word, 0) + 1
+            total = sum(counts.values())
+            for word, c in counts.items():
+                rows.append(i)
+                cols.append(word_idx[word])
+                vals.append(c/total*inv_doc_freq[word])
+        return sparse.csr_matrix((vals, (rows, cols)),
+                                 shape=(len(queries), len(word_idx)))
+
+
+    def _cosine_similarity_docs(self, index, query_mat, docs):
+        """
+        Calculates the cosine similarity between the queries
+        transformed to the vector space (rows of query_mat) and
+        an array of relevant document ordinals (docs). All
+        pairs are scored with a single sparse product against
+        the precomputed document norms. Returns a sparse
+        (queries x docs) CSR matrix holding the similarity of
+        every document that shares a word with a query; column
+        indices are positions in 'docs'. Products are computed in
+        the precision of the document weights (see
+        indexer.Indexer.get_vectors()).
+        """
+        n_queries = query_mat.shape[0]
+        if len(docs) == 0:
+            return sparse.csr_matrix((n_queries, 0))
+        n_feat = index.get_number_features()
+        query_norms = np.sqrt(np.asarray(query_mat.multiply(query_mat).sum(axis=1)).ravel()
+                              + n_feat)
+        matrix, features, norms = index.get_vectors(docs)
+        dots = query_mat.astype(matrix.dtype).dot(matrix.T).tocsr()
+        dots.sort_indices()
+        rows = np.repeat(np.arange(n_queries), np.diff(dots.indptr))
+        cols = dots.indices
+        dots.data = (dots.data + features.sum(axis=1)[cols])/(query_norms[rows]*norms[cols])
+        return dots
+
+
+    def _top_k(self, scores, k):
+        """
+        Returns the positions of the 'k' highest scores, in
+        decreasing order. Candidates are partially selected
+        before sorting, so only the returned slice is sorted.
+        Ties keep the order in which candidates were given: of
+        the scores equal to the k-th one, the first ones make it
+        into the selection.
+        """
+        if k <= 0:
+            return np.zeros(0, dtype=int)
+        if k < len(scores):
+            kth = np.partition(scores, len(scores)-k)[len(scores)-k]
+            greater = np.flatnonzero(scores > kth)
+            equal = np.flatnonzero(scores == kth)[:k-len(greater)]
+            best = np.concatenate((greater, equal))
+            best.sort()
+        else:
+            best = np.arange(len(scores))
+        order = np.argsort(-scores[best], kind='stable')
+        return best[order]
+
+
+    def _filter_by_params(self, index, ranking, query_params):
         """
         Filter the ranked output of a search by selected parameters.
+        'ranking' is an array of document ordinals. The combined
+        mask of all filters is computed from the columnar
+        attribute store (see attributes.AttributeStore).
         Valid parameters:
-        - prods_to_show (int)
         - seller_id (int)
         - title (str)
         - price_min (float)
@@ -82,38 +528,10 @@ class Searcher():
         - min_quantity (int)
         - category (str)
         """
-        products = self.index.get_documents(ranking)
-        for param in query_params.keys():
-            if param == 'prods_to_show':
-                ranking = ranking[:int(query_params['prods_to_show'])]
-            elif param == 'seller_id':
-                ranking = [i for i in ranking if products[i]['seller_id']\
-                           == query_params['seller_id']]
-            elif param == 'title':
-                ranking = [i for i in ranking if products[i]['title']\
-                           == query_params['title']]
-            elif param == 'price_min':
-                ranking = [i for i in ranking if products[i]['price']\
-                           >= float(query_params['price_min'])]
-            elif param == 'price_max':
-                ranking = [i for i in ranking if products[i]['price']\
-                           <= float(query_params['price_max'])]
-            elif param == 'weight_min':
-                ranking = [i for i in ranking if products[i]['weight']\
-                           >= float(query_params['weight_min'])]
-            elif param == 'weight_max':
-                ranking = [i for i in ranking if products[i]['weight']\
-                           <= float(query_params['weight_max'])]
-            elif param == 'express_delivery':
-                ranking = [i for i in ranking if products[i]['express_delivery']]
-            elif param == 'min_quantity':
-                ranking = [i for i in ranking if products[i]['minimum_quantity']\
-                           >= float(query_params['min_quantity'])]
-            elif param == 'category':
-                ranking = [i for i in ranking if products[i]['category']\
-                           == query_params['category']]
-        return ranking
-
+        mask = index.attributes.mask(query_params)
+        if mask is None:
+            return ranking
+        return ranking[mask[ranking]]
 
 
 
@@ -0,0 +1,80 @@
+import numpy as np
+from scipy import sparse
+
+
+class DeltaSegment():
+
+    def __init__(self, base, n_feat):
+        """
+        Append-only segment holding the documents added to an
+        index after it was built. Its documents get the ordinals
+        following the ones of the main segment, starting at
+        'base'. Rows are kept as small arrays and only compressed
+        into a CSR matrix when they are read after a change.
+        """
+        self.base = base
+        self.n_feat = n_feat
+        self.doc_ids = []
+        self.rows = []
+        self.features = []
+        self.norms = []
+        self.lengths = []
+        self.title_lengths = []
+        self.postings = {}
+        self.positions = {}
+        self._matrix = None
+
+
+    def add(self, product_id, cols, vals, features, length=0, title_length=0):
+        """
+        Appends a document, given the vocabulary columns and
+        tf*idf values of its words and its number of analyzed
+        words (in total and in the title), and returns its ordinal
+        """
+        ordinal = self.base + len(self.doc_ids)
+        self.doc_ids.append(product_id)
+        self.rows.append((np.asarray(cols, dtype=np.int32),
+                          np.asarray(vals, dtype=np.float64)))
+        self.features.append(features)
+        self.lengths.append(length)
+        self.title_lengths.append(title_length)
+        self.norms.append(np.sqrt(np.square(vals).sum() + np.square(features).sum()))
+        self._matrix = None
+        return ordinal
+
+
+    def add_postings(self, word, ordinal, positions=None):
+        if word not in self.postings:
+            self.postings[word] = []
+        self.postings[word].append(ordinal)
+        if positions is not None:
+            self.positions[(word, ordinal)] = np.asarray(positions, dtype=np.int32)
+
+
+    def get(self, word):
+        """
+        Returns the (sorted) ordinals of the segment
+        in which a word occurs
+        """
+        return np.array(self.postings.get(word, []), dtype=np.int32)
+
+
+    def matrix(self, n_cols):
+        """
+        Returns the segment rows as a CSR matrix with 'n_cols'
+        columns, along with its feature rows and norms
+        """
+        if self._matrix is None or self._matrix[0].shape[1] != n_cols:
+            lengths = [len(cols) for cols,_ in self.rows]
+            indptr = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+            indices = np.concatenate([c for c,_ in self.rows] + [np.zeros(0, np.int32)])
+            data = np.concatenate([v for _,v in self.rows] + [np.zeros(0)])
+            matrix = sparse.csr_matrix((data, indices, indptr),
+                                       shape=(len(self.rows), n_cols))
+            features = np.array(self.features).reshape(-1, self.n_feat)
+            self._matrix = (matrix, features, np.array(self.norms))
+        return self._matrix
+
+
+    def __len__(self):
+        return len(self.doc_ids)
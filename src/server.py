@@ -0,0 +1,462 @@
+import os
+import json
+import time
+import asyncio
+import argparse
+import functools
+import concurrent.futures
+from urllib.parse import urlsplit, parse_qsl
+import src.attributes as atr
+
+
+MAX_K = 1000
+
+MAX_BODY = 1 << 20
+
+REASONS = {200: 'OK', 202: 'Accepted', 400: 'Bad Request', 404: 'Not Found',
+           405: 'Method Not Allowed', 413: 'Payload Too Large', 500: 'Internal Server Error',
+           501: 'Not Implemented', 503: 'Service Unavailable'}
+
+
+def parse_params(params):
+    """
+    Converts the fields of a search request (query string or
+    JSON object) to their types: 'q' (the query), 'k' (the
+    number of products, 10 by default) and the filters of
+    attributes.FILTERS, typed after their attribute. Returns
+    (query, k, filters); raises ValueError on unknown fields
+    or invalid values.
+    """
+    params = dict(params)
+    query = params.pop('q', params.pop('query', None))
+    if not isinstance(query, str) or not query.strip():
+        raise ValueError("Missing query ('q')")
+    k = _to_int(params.pop('k', params.pop('prods_to_show', 10)))
+    if not 0 <= k <= MAX_K:
+        raise ValueError("'k' must be between 0 and {}".format(MAX_K))
+    filters = {}
+    for name, value in params.items():
+        if name not in atr.FILTERS:
+            raise ValueError('Unknown field: {}'.format(name))
+        kind = atr.COLUMNS[atr.FILTERS[name][0]]
+        try:
+            filters[name] = CONVERTERS[kind](value)
+        except (TypeError, ValueError):
+            raise ValueError('Invalid {} for {}: {!r}'.format(kind, name, value))
+    return query, k, filters
+
+
+def _to_int(value):
+    if isinstance(value, bool):
+        raise ValueError('Invalid int: {!r}'.format(value))
+    if isinstance(value, float):
+        if not value.is_integer():
+            raise ValueError('Invalid int: {!r}'.format(value))
+        return int(value)
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError('Invalid int: {!r}'.format(value))
+
+
+def _to_float(value):
+    if isinstance(value, bool):
+        raise ValueError(value)
+    value = float(value)
+    if value != value:
+        raise ValueError(value)
+    return value
+
+
+def _to_bool(value):
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in ['1', 'true', 'yes', 'sim']:
+        return True
+    if text in ['0', 'false', 'no', 'nao', 'não']:
+        return False
+    raise ValueError(value)
+
+
+CONVERTERS = {'int': _to_int, 'float': _to_float, 'bool': _to_bool, 'str': str}
+
+
+
+class MicroBatcher():
+
+    def __init__(self, search, window_ms=2, max_batch=64, executor=None, validate=None):
+        """
+        Groups the requests received within 'window_ms' of each
+        other (at most 'max_batch') into a single call of
+        'search' (see searcher.Searcher.search_versioned()), run
+        in 'executor'. Requests only share a call if they ask for
+        the same number of products with the same filters.
+        While a batch is scored, new requests wait in the queue,
+        so batches grow with the load.
+        Queries are checked with 'validate' (if given, see
+        searcher.Searcher.validate()) before they are queued. If
+        a batch still fails, its queries are run one at a time,
+        so that only the ones causing the error get it.
+        """
+        self.search = search
+        self.validate = validate
+        self.window = window_ms / 1000
+        self.max_batch = max(1, max_batch)
+        self.executor = executor
+        self.batches = 0
+        self.batched = 0
+        self.largest = 0
+        self._queue = None
+        self._task = None
+
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.ensure_future(self._run())
+
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+    async def submit(self, query, k, filters):
+        """
+        Returns the generation of the index a query was run on
+        and its ranking, once its batch is scored
+        """
+        if self.validate is not None:
+            self.validate(query)
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((query, k, filters, future))
+        return await future
+
+
+    def stats(self):
+        return {'batches': self.batches,
+                'batched_queries': self.batched,
+                'mean_batch': self.batched/self.batches if self.batches else 0.0,
+                'largest_batch': self.largest,
+                'queued': self._queue.qsize() if self._queue is not None else 0}
+
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            groups = {}
+            for item in batch:
+                key = (item[1], tuple(sorted(item[2].items())))
+                groups.setdefault(key, []).append(item)
+            for (k, _), items in groups.items():
+                items = [i for i in items if not i[3].cancelled()]
+                if not items:
+                    continue
+                self.batches += 1
+                self.batched += len(items)
+                self.largest = max(self.largest, len(items))
+                call = functools.partial(self.search, [i[0] for i in items], k,
+                                         **items[0][2])
+                try:
+                    generation, rankings = await loop.run_in_executor(self.executor, call)
+                except Exception as e:
+                    if len(items) == 1:
+                        if not items[0][3].done():
+                            items[0][3].set_exception(e)
+                    else:
+                        await self._run_each(items, k)
+                    continue
+                for item, ranking in zip(items, rankings):
+                    if not item[3].done():
+                        item[3].set_result((generation, ranking))
+
+
+    async def _run_each(self, items, k):
+        """
+        Runs the queries of a failed batch one at a time
+        """
+        loop = asyncio.get_running_loop()
+        for query, _, filters, future in items:
+            if future.done():
+                continue
+            call = functools.partial(self.search, [query], k, **filters)
+            try:
+                generation, rankings = await loop.run_in_executor(self.executor, call)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+                continue
+            if not future.done():
+                future.set_result((generation, rankings[0]))
+
+
+
+class SearchServer():
+
+    def __init__(self, engine, host='127.0.0.1', port=8000, max_pending=256,
+                 batch_window_ms=2, max_batch=64, idle_timeout=30):
+        """
+        HTTP/JSON search service over a shared engine (a Searcher
+        or a ShardedSearcher), built on asyncio streams only.
+        Endpoints:
+        - GET /search?q=...&k=...&<filter>=... (or POST /search
+          with a JSON object of the same fields): the ranked
+          product ids (see parse_params() for the fields)
+        - GET /health: liveness and index generation
+        - GET /stats: request, batching and engine statistics
+        - GET /suggest?q=<prefix>&k=...: typeahead completions
+          (see searcher.Searcher.suggest())
+        - POST /reload: reloads the index in the background, if
+          the engine supports it (see searcher.Searcher.reload());
+          searches are served meanwhile, and every search
+          response carries the generation of the index it ran on
+        At most 'max_pending' searches are admitted at a time;
+        further ones are refused right away with 503 (and a
+        Retry-After header), so that overload shows up at the
+        clients instead of as a growing queue. Admitted searches
+        are grouped by a MicroBatcher ('batch_window_ms',
+        'max_batch') and scored one batch at a time by a single
+        worker thread, as the engine is not meant to score
+        concurrently. Connections are kept alive between requests
+        for up to 'idle_timeout' seconds.
+        """
+        self.engine = engine
+        self.host = host
+        self.port = port
+        self.max_pending = max_pending
+        self.idle_timeout = idle_timeout
+        self.executor = concurrent.futures.ThreadPoolExecutor(1)
+        self.batcher = MicroBatcher(engine.search_versioned, batch_window_ms, max_batch,
+                                    self.executor, getattr(engine, 'validate', None))
+        self.pending = 0
+        self.counts = {'requests': 0, 'rejected': 0, 'errors': 0}
+        self.started = None
+        self._server = None
+
+
+    async def start(self):
+        """
+        Starts listening; returns the bound port (useful with
+        port 0, which picks a free one)
+        """
+        self.batcher.start()
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self.started = time.time()
+        return self.port
+
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        print('>>> Serving on http://{}:{}'.format(self.host, self.port))
+        async with self._server:
+            await self._server.serve_forever()
+
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        await self.batcher.stop()
+        self.executor.shutdown(wait=True)
+
+
+    def run(self):
+        """
+        Serves until interrupted (blocking)
+        """
+        try:
+            asyncio.run(self.serve_forever())
+        except KeyboardInterrupt:
+            pass
+
+
+    def stats(self):
+        stats = dict(self.counts, pending=self.pending, max_pending=self.max_pending,
+                     generation=self.engine.generation,
+                     uptime_s=time.time()-self.started if self.started else 0.0)
+        stats.update(self.batcher.stats())
+        return {'server': stats, 'engine': self.engine.stats()}
+
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'),
+                                                  self.idle_timeout)
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                        asyncio.TimeoutError, ConnectionError):
+                    break
+                lines = head.decode('latin-1').split('\r\n')
+                try:
+                    method, target, version = lines[0].split(' ', 2)
+                except ValueError:
+                    await self._respond(writer, 400, {'error': 'Malformed request'}, False)
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    name, _, value = line.partition(':')
+                    if name:
+                        headers[name.strip().lower()] = value.strip()
+                keep_alive = version.strip() == 'HTTP/1.1' and\
+                             headers.get('connection', '').lower() != 'close'
+                try:
+                    length = int(headers.get('content-length') or 0)
+                except ValueError:
+                    length = -1
+                if not 0 <= length <= MAX_BODY:
+                    await self._respond(writer, 413 if length > 0 else 400,
+                                        {'error': 'Invalid body length'}, False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+                status, payload, extra = await self._dispatch(method, target, body)
+                await self._respond(writer, status, payload, keep_alive, extra)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+    async def _dispatch(self, method, target, body):
+        """
+        Returns the status, JSON payload and extra headers of
+        the response to a request
+        """
+        self.counts['requests'] += 1
+        url = urlsplit(target)
+        methods = {'/search': ['GET', 'POST'], '/health': ['GET'], '/stats': ['GET'],
+                   '/reload': ['POST'], '/suggest': ['GET']}
+        if url.path not in methods:
+            return 404, {'error': 'Not found: {}'.format(url.path)}, {}
+        if method not in methods[url.path]:
+            allowed = ', '.join(methods[url.path])
+            return 405, {'error': 'Method not allowed'}, {'Allow': allowed}
+        if url.path == '/health':
+            return 200, {'status': 'ok', 'generation': self.engine.generation,
+                         'reloading': self._reloading(), 'pending': self.pending}, {}
+        if url.path == '/stats':
+            return 200, self.stats(), {}
+        if url.path == '/reload':
+            if not hasattr(self.engine, 'reload_async'):
+                return 501, {'error': 'This engine cannot be reloaded'}, {}
+            started = self.engine.reload_async()
+            return 202, {'started': started, 'generation': self.engine.generation}, {}
+        if url.path == '/suggest':
+            if not hasattr(self.engine, 'suggest'):
+                return 501, {'error': 'This engine has no suggestions'}, {}
+            return self._suggest(url.query)
+        try:
+            params = dict(parse_qsl(url.query, keep_blank_values=True))
+            if method == 'POST' and body:
+                fields = json.loads(body)
+                if not isinstance(fields, dict):
+                    raise ValueError('The body must be a JSON object')
+                params.update(fields)
+            query, k, filters = parse_params(params)
+        except ValueError as e:
+            return 400, {'error': str(e)}, {}
+        if self.pending >= self.max_pending:
+            self.counts['rejected'] += 1
+            return 503, {'error': 'Overloaded, retry later'}, {'Retry-After': '1'}
+        self.pending += 1
+        start = time.perf_counter()
+        try:
+            generation, ranking = await self.batcher.submit(query, k, filters)
+        except ValueError as e:
+            return 400, {'error': str(e)}, {}
+        except Exception as e:
+            self.counts['errors'] += 1
+            return 500, {'error': '{}: {}'.format(type(e).__name__, e)}, {}
+        finally:
+            self.pending -= 1
+        return 200, {'query': query, 'k': k, 'filters': filters, 'results': ranking,
+                     'generation': generation,
+                     'took_ms': (time.perf_counter()-start)*1000}, {}
+
+
+    def _suggest(self, query):
+        """
+        Answers a typeahead request right away: completions are
+        looked up in well under a millisecond, so they are
+        neither batched nor counted as pending searches
+        """
+        start = time.perf_counter()
+        params = dict(parse_qsl(query, keep_blank_values=True))
+        prefix = params.get('q', params.get('prefix', ''))
+        try:
+            k = _to_int(params.get('k', 10))
+            if not 0 <= k <= MAX_K:
+                raise ValueError("'k' must be between 0 and {}".format(MAX_K))
+        except ValueError as e:
+            return 400, {'error': str(e)}, {}
+        suggestions = self.engine.suggest(prefix, k)
+        return 200, {'prefix': prefix, 'suggestions': suggestions,
+                     'took_ms': (time.perf_counter()-start)*1000}, {}
+
+
+    def _reloading(self):
+        return hasattr(self.engine, 'reloading') and self.engine.reloading()
+
+
+    async def _respond(self, writer, status, payload, keep_alive, extra=None):
+        body = json.dumps(payload, default=str).encode('utf-8')
+        head = ['HTTP/1.1 {} {}'.format(status, REASONS.get(status, '')),
+                'Content-Type: application/json',
+                'Content-Length: {}'.format(len(body)),
+                'Connection: {}'.format('keep-alive' if keep_alive else 'close')]
+        head += ['{}: {}'.format(k, v) for k, v in (extra or {}).items()]
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+
+
+
+if __name__=="__main__":
+    import src.indexer as idx
+    import src.searcher as sch
+    import src.instrumentation as ins
+    import src.snapshots as snp
+    parser = argparse.ArgumentParser(description='Serves searches over HTTP/JSON.')
+    parser.add_argument('--dataset', default=os.path.abspath('data/elo7_recruitment_dataset.csv'))
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--ranking', choices=sch.Searcher.RANKINGS, default='cosine')
+    parser.add_argument('--max-pending', type=int, default=256)
+    parser.add_argument('--batch-window-ms', type=float, default=2)
+    parser.add_argument('--max-batch', type=int, default=64)
+    parser.add_argument('--fuzzy', action='store_true',
+                        help='replace the query words that are not in the vocabulary '
+                        'by the closest indexed ones')
+    parser.add_argument('--watch', type=float, default=0,
+                        help='reload the index when the dataset changes, checking it '
+                        'every given seconds (0 disables it)')
+    args = parser.parse_args()
+    searcher = sch.Searcher(idx.Indexer(args.dataset, fuzzy=args.fuzzy), ranking=args.ranking,
+                            instrumentation=ins.Instrumentation(slow_query_ms=100),
+                            fuzzy=args.fuzzy)
+    if args.watch > 0:
+        snp.IndexWatcher(searcher, interval=args.watch).start()
+    SearchServer(searcher, args.host, args.port, args.max_pending,
+                 args.batch_window_ms, args.max_batch).run()
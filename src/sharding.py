@@ -0,0 +1,333 @@
+import os
+import threading
+import multiprocessing
+import numpy as np
+import src.indexer as idx
+import src.searcher as sch
+import src.storage as stg
+import src.cache as cch
+import src.query as qry
+import src.instrumentation as ins
+
+
+FEATURES = ['view_counts', 'order_counts']
+
+HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+TIE_TOLERANCE = 1e-12
+
+
+def shard_of(product_ids, n_shards):
+    """
+    Returns the shard of each product id. Ids are hashed
+    (multiplicative hashing), so that shards get about the same
+    size whatever the ids look like.
+    """
+    ids = np.asarray(product_ids).astype(np.uint64)
+    with np.errstate(over='ignore'):
+        hashed = (ids * HASH_MULTIPLIER) >> np.uint64(32)
+    return (hashed % np.uint64(n_shards)).astype(np.int64)
+
+
+def partition(dataset_path, n_shards, chunk_size=10000):
+    """
+    Splits a dataset by product_id into 'n_shards' datasets,
+    written to the <dataset>_shards directory, and returns its
+    manifest (see storage.IndexFile). The manifest holds the
+    maxima of the features over the whole catalog and the
+    position of every product in it, which breaks ties as in an
+    unsharded index. Shards are reused while the dataset and
+    the number of shards do not change.
+    """
+    import pandas as pd
+    shard_dir = dataset_path[:-4] + '_shards'
+    manifest_path = os.path.join(shard_dir, 'manifest.idx')
+    dataset_hash = stg.dataset_hash(dataset_path)
+    if os.path.exists(manifest_path):
+        manifest = stg.IndexFile(manifest_path)
+        if manifest.version == stg.FORMAT_VERSION and\
+           manifest.dataset_hash == dataset_hash and\
+           manifest.header['n_shards'] == n_shards:
+            return manifest
+    print('>>> Partitioning the dataset into {} shards...'.format(n_shards))
+    os.makedirs(shard_dir, exist_ok=True)
+    names = ['shard_{}.csv'.format(i) for i in range(n_shards)]
+    max_features = {f: np.nan for f in FEATURES}
+    product_ids = []
+    header = True
+    for chunk in pd.read_csv(dataset_path, chunksize=chunk_size):
+        for feat in FEATURES:
+            max_features[feat] = np.fmax(max_features[feat], chunk[feat].max())
+        product_ids.append(chunk['product_id'].to_numpy())
+        shards = shard_of(chunk['product_id'], n_shards)
+        for i, name in enumerate(names):
+            chunk[shards == i].to_csv(os.path.join(shard_dir, name), index=False,
+                                      mode='w' if header else 'a', header=header)
+        header = False
+    product_ids = np.concatenate(product_ids) if product_ids else np.zeros(0, np.int64)
+    product_ids, positions = np.unique(product_ids, return_index=True)
+    stg.write_index(manifest_path,
+                    {'dataset_hash': dataset_hash,
+                     'n_shards': n_shards,
+                     'shards': names,
+                     'max_features': {f: float(v) for f,v in max_features.items()}},
+                    {'product_ids': product_ids.astype(np.int64),
+                     'positions': positions.astype(np.int64)})
+    return stg.IndexFile(manifest_path)
+
+
+def merge_stats(stats):
+    """
+    Adds up the statistics of the shards of a catalog
+    (see indexer.Indexer.local_stats())
+    """
+    total = {'n_doc': 0, 'n_rows': 0, 'total_length': 0, 'doc_freq': {}, 'row_freq': {}}
+    for shard in stats:
+        for key in ['n_doc', 'n_rows', 'total_length']:
+            total[key] += shard[key]
+        for key in ['doc_freq', 'row_freq']:
+            freq = total[key]
+            for word, n in shard[key].items():
+                freq[word] = freq.get(word, 0) + n
+    return total
+
+
+
+class ShardedIndex():
+
+    def __init__(self, dataset_path, n_shards=4, chunk_size=10000,
+                 compress_postings=False, positions=False, precision='float64'):
+        """
+        Catalog split by product_id into 'n_shards' shards (see
+        partition()). Each shard is indexed and stored on its own,
+        as any dataset (see indexer.Indexer), and served by its
+        own worker process. Once every shard is loaded, their
+        statistics are added up and every shard is rebased on
+        them (see indexer.Indexer.rebase()), so that scores are
+        comparable between shards. Requests are sent to all the
+        shards at once and answered in parallel. Shards are
+        read-only. Call close() to stop the workers.
+        """
+        self.manifest = partition(dataset_path, n_shards, chunk_size)
+        header = self.manifest.header
+        self.product_ids = self.manifest.array('product_ids')
+        self.positions = self.manifest.array('positions')
+        self.generation = 0
+        self.lock = threading.Lock()
+        options = {'compress_postings': compress_postings, 'chunk_size': chunk_size,
+                   'positions': positions, 'precision': precision, 'compact_every': 0,
+                   'max_features': header['max_features']}
+        shard_dir = os.path.dirname(self.manifest.path)
+        context = multiprocessing.get_context('spawn')
+        self.connections, self.workers = [], []
+        for name in header['shards']:
+            parent, child = context.Pipe()
+            worker = context.Process(target=_serve, daemon=True,
+                                     args=(os.path.join(shard_dir, name), options, child))
+            worker.start()
+            child.close()
+            self.connections.append(parent)
+            self.workers.append(worker)
+        try:
+            self.stats = merge_stats(self._gather())
+            self.request('rebase', self.stats)
+        except BaseException:
+            self.close()
+            raise
+
+
+    def request(self, *message):
+        """
+        Sends a request to every shard and returns their
+        replies, in shard order
+        """
+        with self.lock:
+            for conn in self.connections:
+                conn.send(message)
+            return self._gather()
+
+
+    def search(self, queries, prods_to_show, filters, settings):
+        """
+        Returns, for each shard, the ranking (product ids and
+        scores) of each query (see searcher.Searcher.search_scored())
+        """
+        return self.request('search', queries, prods_to_show, filters, settings)
+
+
+    def order(self, product_ids):
+        """
+        Returns the position of each product in the catalog
+        """
+        return self.positions[np.searchsorted(self.product_ids, product_ids)]
+
+
+    def close(self):
+        for conn, worker in zip(self.connections, self.workers):
+            try:
+                conn.send(('close',))
+            except OSError:
+                pass
+            conn.close()
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+        self.connections, self.workers = [], []
+
+
+    def _gather(self):
+        replies, error = [], None
+        for conn in self.connections:
+            ok, reply = conn.recv()
+            if not ok and error is None:
+                error = reply
+            replies.append(reply)
+        if error is not None:
+            raise error
+        return replies
+
+
+    def __len__(self):
+        return len(self.workers)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+
+class ShardedSearcher():
+
+    def __init__(self, index, cache_size=1024, cache_ttl=300, instrumentation=None,
+                 ranking='cosine', pruning=True, operator='or'):
+        """
+        Coordinator of a search over a ShardedIndex. Each query
+        is sent to every shard, which returns its own top results
+        (see searcher.Searcher, whose options it takes); these
+        are merged into the global ones. Since shards are rebased
+        on the statistics of the whole catalog, rankings are the
+        ones of an unsharded index.
+        """
+        if ranking not in sch.Searcher.RANKINGS:
+            raise ValueError('Unknown ranking: {}'.format(ranking))
+        if operator not in qry.OPERATORS:
+            raise ValueError('Unknown operator: {}'.format(operator))
+        self.index = index
+        self.settings = {'ranking': ranking, 'pruning': pruning, 'operator': operator}
+        self.cache = cch.ResultCache(cache_size, cache_ttl)
+        self.instrumentation = instrumentation or ins.DISABLED
+
+
+    def search(self, query, prods_to_show=10, **kwargs):
+        """
+        Returns a list of ranked product ids from a query
+        (see searcher.Searcher.search())
+        """
+        return self.search_many([query], prods_to_show, **kwargs)[0]
+
+
+    def search_many(self, queries, prods_to_show=10, **kwargs):
+        """
+        Returns the ranking of each query of a list. Queries not
+        found in the cache are sent to the shards together.
+        """
+        return self.search_versioned(queries, prods_to_show, **kwargs)[1]
+
+
+    def search_versioned(self, queries, prods_to_show=10, **kwargs):
+        """
+        Returns the generation of the index along with the
+        rankings of a list of queries (see search_many())
+        """
+        with self.instrumentation.trace('search', queries=queries, filters=kwargs) as trace:
+            trace.count('queries', len(queries))
+            prods_to_show = int(prods_to_show)
+            with trace.stage('cache'):
+                filters = tuple(sorted((p, str(v)) for p,v in kwargs.items()))
+                generation = self.index.generation
+                keys = [(q, filters) for q in queries]
+                rankings = [self.cache.get(key, prods_to_show, generation) for key in keys]
+                missing = [i for i,r in enumerate(rankings) if r is None]
+            trace.count('cache_hits', len(queries)-len(missing))
+            if missing:
+                with trace.stage('shards'):
+                    replies = self.index.search([queries[i] for i in missing], prods_to_show,
+                                                kwargs, self.settings)
+                with trace.stage('merge'):
+                    for j, i in enumerate(missing):
+                        rankings[i] = self._merge([shard[j] for shard in replies],
+                                                  prods_to_show)
+                        self.cache.put(keys[i], prods_to_show, rankings[i], generation)
+            return generation, rankings
+
+
+    @property
+    def generation(self):
+        return self.index.generation
+
+
+    def cache_stats(self):
+        return self.cache.stats()
+
+
+    def stats(self):
+        return dict(self.instrumentation.snapshot(), cache=self.cache_stats(),
+                    generation=self.generation)
+
+
+    def _merge(self, results, k):
+        """
+        Merges the rankings of the shards into the top-k. Ties,
+        including scores that only differ by rounding, are broken
+        by the position of the products in the catalog, as an
+        unsharded index does.
+        """
+        ids = np.concatenate([r[0] for r in results]).astype(np.int64)
+        scores = np.concatenate([r[1] for r in results]).astype(np.float64)
+        order = np.argsort(-scores, kind='stable')
+        ids, scores = ids[order], scores[order]
+        ties = scores[:-1] - scores[1:] <= TIE_TOLERANCE*np.abs(scores[:-1])
+        groups = np.concatenate(([0], np.cumsum(~ties)))[:len(ids)]
+        order = np.lexsort((self.index.order(ids), groups))[:max(k, 0)]
+        return ids[order].tolist()
+
+
+
+def _serve(shard_path, options, conn):
+    """
+    Main loop of a shard worker: builds or loads the index of
+    a shard, sends its statistics and answers the requests of
+    a ShardedIndex until it is closed
+    """
+    try:
+        indexer = idx.Indexer(shard_path, **options)
+        conn.send((True, indexer.local_stats()))
+    except Exception as e:
+        conn.send((False, e))
+        return
+    searchers = {}
+    while True:
+        request = conn.recv()
+        if request[0] == 'close':
+            break
+        try:
+            if request[0] == 'rebase':
+                indexer.rebase(request[1])
+                reply = None
+            elif request[0] == 'search':
+                _, queries, prods_to_show, filters, settings = request
+                key = tuple(sorted(settings.items()))
+                if key not in searchers:
+                    searchers[key] = sch.Searcher(indexer, cache_size=0, **settings)
+                reply = searchers[key].search_scored(queries, prods_to_show, **filters)
+            else:
+                raise ValueError('Unknown request: {}'.format(request[0]))
+            conn.send((True, reply))
+        except Exception as e:
+            conn.send((False, e))
+    conn.close()
@@ -0,0 +1,122 @@
+import os
+import threading
+
+
+class Snapshot():
+
+    def __init__(self, index, generation):
+        """
+        Index served by a Searcher under a generation number.
+        A snapshot is never modified: the Searcher replaces it as
+        a whole (see searcher.Searcher.swap()). It counts the
+        searches running on it (use it as a context manager), so
+        that a replaced snapshot is only released once they are
+        all done.
+        """
+        self.index = index
+        self.generation = generation
+        self.active = 0
+        self._idle = threading.Condition()
+
+
+    def acquire(self):
+        with self._idle:
+            self.active += 1
+        return self
+
+
+    def release(self):
+        with self._idle:
+            self.active -= 1
+            if self.active == 0:
+                self._idle.notify_all()
+
+
+    def wait_idle(self, timeout=None):
+        """
+        Waits until no search runs on the snapshot; returns
+        False if 'timeout' (seconds) expired first
+        """
+        with self._idle:
+            return self._idle.wait_for(lambda: self.active == 0, timeout)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.release()
+        return False
+
+
+
+class IndexWatcher():
+
+    def __init__(self, searcher, paths=None, interval=2.0, **options):
+        """
+        Watches files (by default, the dataset of the index
+        served by 'searcher') and reloads the searcher in the
+        background when one of them changes (see
+        searcher.Searcher.reload_async(), which gets 'options').
+        A change must be seen by two polls in a row, 'interval'
+        seconds apart, so that files still being written are
+        not loaded.
+        """
+        self.searcher = searcher
+        self.paths = list(paths) if paths is not None else [searcher.index.dataset_path]
+        self.interval = interval
+        self.options = options
+        self.reloads = 0
+        self._seen = self._signature()
+        self._changed = None
+        self._stop = threading.Event()
+        self._thread = None
+
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+    def poll(self):
+        """
+        Checks the files once; returns whether a reload started
+        """
+        signature = self._signature()
+        if signature == self._seen:
+            self._changed = None
+            return False
+        if signature != self._changed:
+            self._changed = signature
+            return False
+        if not self.searcher.reload_async(**self.options):
+            return False
+        self._seen, self._changed = signature, None
+        self.reloads += 1
+        return True
+
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.poll()
+
+
+    def _signature(self):
+        signature = []
+        for path in self.paths:
+            try:
+                stat = os.stat(path)
+                signature.append((stat.st_ino, stat.st_size, stat.st_mtime_ns))
+            except OSError:
+                signature.append(None)
+        return signature
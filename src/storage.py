@@ -0,0 +1,181 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+
+FORMAT_VERSION = 5
+MAGIC = b'ELO7IDX\x00'
+ALIGNMENT = 64
+
+
+def dataset_hash(path):
+    """
+    Returns a hash of the contents of a dataset file,
+    or None if the file does not exist
+    """
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_index(path, header, sections):
+    """
+    Writes an index file. Layout:
+    - MAGIC (8 bytes)
+    - header length (uint64, little endian)
+    - header (JSON): 'version', the given 'header' fields and
+      the table of 'sections' (dtype, shape and offset of
+      each one, relative to the start of the data area)
+    - data area, aligned to ALIGNMENT bytes, where every
+      section is a flat C-ordered array, also aligned.
+    The file is written to a temporary path and then renamed,
+    so readers never see a partially written index.
+    """
+    table, offset = {}, 0
+    arrays = {}
+    for name, arr in sections.items():
+        arr = np.ascontiguousarray(arr)
+        arr = arr.astype(arr.dtype.newbyteorder('<'), copy=False)
+        arrays[name] = arr
+        table[name] = {'dtype': arr.dtype.str, 'shape': list(arr.shape),
+                       'offset': offset}
+        offset += _align(arr.nbytes)
+    header = dict(header, version=FORMAT_VERSION, sections=table)
+    header = json.dumps(header).encode('utf-8')
+    start = _align(len(MAGIC) + 8 + len(header))
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(np.uint64(len(header)).tobytes())
+        f.write(header)
+        for name, arr in arrays.items():
+            f.seek(start + table[name]['offset'])
+            f.write(arr.tobytes())
+        f.truncate(start + offset)
+    os.replace(tmp_path, path)
+
+
+class IndexFile():
+
+    def __init__(self, path):
+        """
+        Read-only view of an index file written by write_index().
+        Only the header is read when the file is opened; sections
+        are memory mapped (zero-copy, shared between processes
+        reading the same file) the first time they are requested.
+        The file is kept open, so that sections are read from it
+        even if the index is rebuilt (and replaced) meanwhile.
+        """
+        self.path = path
+        self._file = open(path, 'rb')
+        f = self._file
+        if f.read(len(MAGIC)) != MAGIC:
+            f.close()
+            raise ValueError('{} is not an index file'.format(path))
+        size = int(np.frombuffer(f.read(8), dtype='<u8')[0])
+        self.header = json.loads(f.read(size).decode('utf-8'))
+        self.data_start = _align(len(MAGIC) + 8 + size)
+        self.version = self.header.get('version')
+        self.dataset_hash = self.header.get('dataset_hash')
+        self._arrays = {}
+
+
+    def array(self, name):
+        """
+        Returns a section as a read-only array
+        """
+        if name not in self._arrays:
+            info = self.header['sections'][name]
+            shape = tuple(info['shape'])
+            if int(np.prod(shape)) == 0:
+                arr = np.zeros(shape, dtype=info['dtype'])
+            else:
+                arr = np.memmap(self._file, dtype=info['dtype'], mode='r',
+                                offset=self.data_start+info['offset'],
+                                shape=shape)
+            self._arrays[name] = arr
+        return self._arrays[name]
+
+
+    def release(self, name):
+        """
+        Drops a section opened by array(), so that warm() leaves
+        it on disk
+        """
+        self._arrays.pop(name, None)
+
+
+    def warm(self, page_size=4096):
+        """
+        Pages in the sections opened so far, by reading a byte
+        of each of their pages. Returns the number of pages read.
+        """
+        pages = 0
+        for arr in self._arrays.values():
+            if isinstance(arr, np.memmap) and arr.flags['C_CONTIGUOUS']:
+                data = arr.reshape(-1).view(np.uint8)
+                data[::page_size].sum()
+                pages += -(-data.size // page_size)
+        return pages
+
+
+    def __contains__(self, name):
+        return name in self.header['sections']
+
+
+
+class LazySection():
+    """
+    Attribute of an index that is read from its index file the
+    first time it is accessed. The owner must implement
+    _load_section(name); assigning the attribute replaces it.
+    """
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        value = obj._load_section(self.name)
+        obj.__dict__[self.name] = value
+        return value
+
+
+
+def pack_strings(values):
+    """
+    Packs a list of strings into a utf-8 blob and an array of
+    offsets (n+1). Values that are not strings are stored as
+    empty strings and flagged in the returned null mask.
+    """
+    nulls = np.array([not isinstance(v, str) for v in values], dtype=bool)
+    encoded = [v.encode('utf-8') if isinstance(v, str) else b'' for v in values]
+    offsets = np.zeros(len(encoded)+1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(e) for e in encoded])
+    blob = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    return blob, offsets, nulls
+
+
+def unpack_strings(blob, offsets, nulls=None):
+    """
+    Inverse of pack_strings(); null entries are returned as NaN
+    """
+    data = bytes(blob)
+    offsets = offsets.tolist()
+    values = [data[offsets[i]:offsets[i+1]].decode('utf-8')\
+              for i in range(len(offsets)-1)]
+    if nulls is not None:
+        for i in np.flatnonzero(nulls).tolist():
+            values[i] = float('nan')
+    return values
+
+
+def _align(n):
+    return -(-n // ALIGNMENT) * ALIGNMENT
@@ -0,0 +1,226 @@
+import sys
+import bisect
+import collections
+import unicodedata
+import numpy as np
+import src.analyzer as anl
+import src.storage as stg
+
+
+TOP_N = 10
+
+LAST_CHAR = chr(sys.maxunicode)
+
+
+def normalize(text, partial=False):
+    """
+    Returns the key under which a text is suggested: lowercased,
+    without accents and with single spaces between words. With
+    'partial' (text being typed), a trailing space is kept, so
+    that 'dia ' only completes to texts having the word 'dia'.
+    """
+    text = text.lower()
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii')
+    words = text.split()
+    key = ' '.join(words)
+    if partial and key and text[-1:].isspace():
+        key += ' '
+    return key
+
+
+
+class Suggester():
+
+    def __init__(self, keys, texts, scores, prefixes, top):
+        """
+        Typeahead completions over a sorted array of keys (see
+        normalize()), each with the text to show and a score.
+        The 'top' completions (key positions, best first) are
+        precomputed for every prefix shared by more keys than
+        they hold ('prefixes', row i of 'top' being the ones of
+        prefixes[i]). Any other prefix matches at most that many
+        keys, found by a binary search and sorted on the fly.
+        """
+        self.keys = keys
+        self.texts = texts
+        self.scores = scores
+        self.prefixes = prefixes
+        self.top = top
+        self.size = top.shape[1]
+        self._top = {p:i for i,p in enumerate(prefixes)}
+
+
+    @classmethod
+    def build(cls, documents, queries, stop_words=(), size=TOP_N):
+        """
+        Builds the completions from the words of the products
+        ('documents': (text, order_counts) pairs) and from past
+        searches ('queries': (query, order_counts) pairs, one per
+        product they returned). A word counts once per product
+        having it; words that are stop words, numbers or single
+        letters are left out. Each key is scored from its
+        frequency (products or search results) and the orders of
+        those products, as
+            frequency * (1 + log(1 + orders/frequency))
+        and shown as its most frequent spelling.
+        """
+        words, word_orders = count_documents(documents)
+        searches, search_orders = count_queries(queries)
+        return cls.from_counts(words, word_orders, searches, search_orders, stop_words, size)
+
+
+    @classmethod
+    def from_counts(cls, words, word_orders, searches, search_orders, stop_words=(),
+                    size=TOP_N):
+        """
+        Builds the completions from the counts of the words of
+        the products and of past searches (see count_documents()
+        and count_queries()), scored as in build()
+        """
+        stop_words = frozenset(normalize(w) for w in stop_words)
+        counts = {}
+
+        def add(key, text, frequency, orders):
+            count = counts.get(key)
+            if count is None:
+                count = counts[key] = [0, 0.0, {}]
+            count[0] += frequency
+            count[1] += orders
+            count[2][text] = count[2].get(text, 0) + frequency
+
+        for word, frequency in words.items():
+            key = normalize(word)
+            if word.isalpha() and len(key) > 1 and key not in stop_words:
+                add(key, word, frequency, word_orders.get(word, 0))
+        for query, frequency in searches.items():
+            add(normalize(query), ' '.join(query.lower().split()), frequency,
+                search_orders.get(query, 0))
+        sorted_keys = sorted(counts)
+        frequency = np.array([counts[k][0] for k in sorted_keys], dtype=np.float64)
+        orders = np.array([counts[k][1] for k in sorted_keys], dtype=np.float64)
+        scores = frequency * (1 + np.log1p(orders/np.maximum(frequency, 1)))
+        texts = [max(counts[k][2], key=counts[k][2].get) for k in sorted_keys]
+        prefixes, top = _top_completions(sorted_keys, scores, size)
+        return cls(sorted_keys, texts, scores.astype(np.float32), prefixes, top)
+
+
+    @classmethod
+    def from_index_file(cls, index_file, prefix='suggest.'):
+        """
+        Opens the completions written by to_sections() (see storage)
+        """
+        strings = [stg.unpack_strings(index_file.array(prefix+name),
+                                      index_file.array(prefix+name+'.offsets'))\
+                   for name in ['keys', 'texts', 'prefixes']]
+        keys, texts, prefixes = strings
+        return cls(keys, texts, index_file.array(prefix+'scores'), prefixes,
+                   index_file.array(prefix+'top'))
+
+
+    def to_sections(self, prefix='suggest.'):
+        sections = {prefix+'scores': self.scores, prefix+'top': self.top}
+        for name, values in [('keys', self.keys), ('texts', self.texts),
+                             ('prefixes', self.prefixes)]:
+            blob, offsets, _ = stg.pack_strings(values)
+            sections[prefix+name] = blob
+            sections[prefix+name+'.offsets'] = offsets
+        return sections
+
+
+    def suggest(self, prefix, k=None):
+        """
+        Returns the texts of the (at most 'k', by default and at
+        most the number precomputed per prefix) best scored keys
+        starting with a prefix
+        """
+        k = self.size if k is None else min(k, self.size)
+        prefix = normalize(prefix, partial=True)
+        if not prefix or k <= 0:
+            return []
+        row = self._top.get(prefix)
+        if row is not None:
+            positions = self.top[row, :k].tolist()
+        else:
+            lo = bisect.bisect_left(self.keys, prefix)
+            hi = bisect.bisect_left(self.keys, prefix+LAST_CHAR, lo)
+            order = np.argsort(-self.scores[lo:hi], kind='stable')[:k]
+            positions = (order+lo).tolist()
+        return [self.texts[p] for p in positions]
+
+
+    def nbytes(self):
+        """
+        Returns the memory held by the completions, in bytes
+        (strings and their lists included)
+        """
+        strings = sum(sys.getsizeof(s) for s in self.keys) + sys.getsizeof(self.keys)
+        strings += sum(sys.getsizeof(s) for s in self.texts) +\
+                   sys.getsizeof(self.texts)
+        strings += sum(sys.getsizeof(s) for s in self.prefixes) + sys.getsizeof(self._top)
+        return int(strings + self.scores.nbytes + self.top.nbytes)
+
+
+    def __len__(self):
+        return len(self.keys)
+
+
+
+def count_documents(documents, counts=None):
+    """
+    Counts the products having each word, and their orders,
+    from (text, order_counts) pairs. Given the (counts,
+    orders) returned by a previous call, they are updated, so
+    that the products can be counted in chunks.
+    """
+    return _count(((set(anl.TOKEN_RE.findall(text.lower())), orders)\
+                   for text, orders in documents if isinstance(text, str)), counts)
+
+
+def count_queries(queries, counts=None):
+    """
+    Counts the results of each past search, and their orders,
+    from (query, order_counts) pairs (see count_documents())
+    """
+    return _count((([query], orders) for query, orders in queries\
+                   if isinstance(query, str) and query.strip()), counts)
+
+
+def _count(groups, counts=None):
+    """
+    Counts the occurrences of the items of (items, orders)
+    groups and adds up the orders of the groups having them
+    """
+    counts, orders = counts or (collections.Counter(), {})
+    for items, n in groups:
+        counts.update(items)
+        if n > 0:
+            for item in items:
+                orders[item] = orders.get(item, 0) + n
+    return counts, orders
+
+
+def _top_completions(keys, scores, size):
+    """
+    Returns the prefixes shared by more than 'size' of the
+    (sorted) keys and their 'size' best scored keys, found by
+    splitting the range of keys of each such prefix by the
+    next character, from the first one on
+    """
+    prefixes, top = [], []
+    ranges = [(0, len(keys), 0)]
+    while ranges:
+        lo, hi, depth = ranges.pop()
+        while lo < hi and len(keys[lo]) == depth:
+            lo += 1
+        while lo < hi:
+            prefix = keys[lo][:depth+1]
+            end = bisect.bisect_left(keys, prefix+LAST_CHAR, lo, hi)
+            if end-lo > size:
+                order = np.argsort(-scores[lo:end], kind='stable')[:size]
+                prefixes.append(prefix)
+                top.append(order+lo)
+                ranges.append((lo, end, depth+1))
+            lo = end
+    top = np.array(top, dtype=np.int32).reshape(len(prefixes), size)
+    return prefixes, top
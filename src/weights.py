@@ -0,0 +1,99 @@
+import numpy as np
+from scipy import sparse
+
+
+PRECISIONS = ['float64', 'float32', 'float16', 'int8']
+
+INT8_MAX = 127
+
+
+class DocWeights():
+
+    def __init__(self, indptr, indices, shape, data, scales=None):
+        """
+        Reduced precision copy of the tf*idf weights of a CSR
+        matrix, used to score documents (see
+        searcher.Searcher._cosine_similarity_docs()). It shares
+        the row pointers and column indices of the matrix and
+        only holds its own weights, as float32, float16 or int8;
+        int8 weights are scaled by a factor per row ('scales'),
+        so that the largest weight of each row maps to INT8_MAX.
+        The full precision weights are only kept for index
+        maintenance and are not read to score documents.
+        """
+        self.indptr = indptr
+        self.indices = indices
+        self.shape = tuple(shape)
+        self.data = data
+        self.scales = scales
+        self.precision = data.dtype.name
+        view = data.view(np.int16) if data.dtype == np.float16 else data
+        self._matrix = sparse.csr_matrix((view, indices, indptr), shape=self.shape)
+
+
+    @classmethod
+    def from_matrix(cls, matrix, precision):
+        """
+        Quantizes the weights of a CSR matrix to 'precision'
+        """
+        if precision not in PRECISIONS[1:]:
+            raise ValueError('Unknown precision: {}'.format(precision))
+        if precision != 'int8':
+            return cls(matrix.indptr, matrix.indices, matrix.shape, matrix.data.astype(precision))
+        lengths = np.diff(matrix.indptr)
+        scales = np.ones(matrix.shape[0], dtype=np.float32)
+        filled = lengths > 0
+        if filled.any():
+            maxima = np.maximum.reduceat(np.abs(matrix.data), matrix.indptr[:-1][filled])
+            scales[filled] = np.where(maxima > 0, maxima/INT8_MAX, 1)
+        data = np.rint(matrix.data/np.repeat(scales.astype(np.float64), lengths))
+        return cls(matrix.indptr, matrix.indices, matrix.shape,
+                   np.clip(data, -INT8_MAX, INT8_MAX).astype(np.int8), scales)
+
+
+    @classmethod
+    def from_index_file(cls, index_file, indptr, indices, shape, prefix='weights.'):
+        """
+        Opens the weights written by to_sections() (see storage)
+        for the matrix of the given row pointers, column indices
+        and shape
+        """
+        scales = index_file.array(prefix+'scales') if prefix+'scales' in index_file\
+                 else None
+        return cls(indptr, indices, shape, index_file.array(prefix+'data'), scales)
+
+
+    def to_sections(self, prefix='weights.'):
+        sections = {prefix+'data': self.data}
+        if self.scales is not None:
+            sections[prefix+'scales'] = self.scales
+        return sections
+
+
+    def rows(self, ordinals, n_cols=None):
+        """
+        Returns the weights of the given document ordinals as
+        a float32 CSR matrix. Rows are gathered in their stored
+        type (float16 weights as raw 16 bit integers, which
+        scipy can index) and only then converted (and scaled,
+        for int8 weights).
+        """
+        ordinals = np.asarray(ordinals, dtype=np.int64)
+        rows = self._matrix[ordinals]
+        data = rows.data
+        if self.data.dtype == np.float16:
+            data = data.view(np.float16)
+        data = data.astype(np.float32)
+        if self.scales is not None:
+            data *= np.repeat(self.scales[ordinals], np.diff(rows.indptr))
+        shape = (len(ordinals), self.shape[1] if n_cols is None else n_cols)
+        return sparse.csr_matrix((data, rows.indices, rows.indptr), shape=shape)
+
+
+    def nbytes(self):
+        """
+        Returns the size of the scoring weights (column indices
+        included), in bytes
+        """
+        scales = 0 if self.scales is None else self.scales.nbytes
+        return int(self.data.nbytes + self.indices.nbytes + self.indptr.nbytes + scales)
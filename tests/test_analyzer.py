@@ -0,0 +1,35 @@
+import unittest
+import src.indexer as idx
+import src.searcher as sch
+import os
+
+class TestAnalyzer(unittest.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        unittest.TestCase.__init__(self,*args,**kwargs)
+        datapath = os.path.abspath("data/elo7_recruitment_dataset_10.csv")
+        self.indexer = idx.Indexer(datapath)
+        self.analyzer = self.indexer.analyzer
+
+
+    def test_tokenize(self):
+        tokens = self.analyzer.tokenize('quadro-negro, 1,5 kg.')
+        expected = ['quadro-negro', ',', '1,5', 'kg', '.']
+        self.assertEqual(expected, tokens)
+
+
+    def test_number_to_word(self):
+        converted = self.analyzer.number_to_word(['70', '10x15'])
+        self.assertEqual(converted, ['setenta', '10x15'])
+
+
+    def test_analyze_cache(self):
+        self.analyzer.analyze('batata batata')
+        hits = self.analyzer.cache_info().hits
+        self.analyzer.analyze('batata')
+        self.assertEqual(self.analyzer.cache_info().hits, hits+1)
+
+
+    def test_shared_analyzer(self):
+        searcher = sch.Searcher(self.indexer)
+        self.assertIs(searcher.analyzer, self.indexer.analyzer)
@@ -0,0 +1,55 @@
+import unittest
+import src.attributes as atr
+import numpy as np
+
+class TestAttributes(unittest.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        unittest.TestCase.__init__(self,*args,**kwargs)
+        documents = [{'seller_id': 1, 'price': '171,89', 'category': 'Decoração',
+                      'express_delivery': 1, 'weight': 10.0},
+                     {'seller_id': 2, 'price': 5.0, 'category': 'Bebê',
+                      'express_delivery': 0, 'weight': np.nan},
+                     {'seller_id': 1, 'price': np.nan, 'category': 'Decoração',
+                      'express_delivery': 1, 'weight': 300.0}]
+        self.store = atr.AttributeStore.from_documents(documents)
+
+
+    def test_range_filters(self):
+        mask = self.store.mask({'price_min': 5})
+        self.assertEqual(mask.tolist(), [True, True, False])
+        mask = self.store.mask({'price_max': '100'})
+        self.assertEqual(mask.tolist(), [False, True, False])
+        mask = self.store.mask({'weight_min': 5, 'weight_max': 200})
+        self.assertEqual(mask.tolist(), [True, False, False])
+
+
+    def test_equality_filters(self):
+        mask = self.store.mask({'seller_id': '1', 'category': 'Decoração'})
+        self.assertEqual(mask.tolist(), [True, False, True])
+        mask = self.store.mask({'express_delivery': 'false'})
+        self.assertEqual(mask.tolist(), [False, True, False])
+        mask = self.store.mask({'category': 'Unknown'})
+        self.assertEqual(mask.tolist(), [False, False, False])
+
+
+    def test_append(self):
+        self.store.append({'seller_id': 3, 'price': 1.0, 'category': 'Bebê'})
+        mask = self.store.mask({'category': 'Bebê', 'price_max': 2})
+        self.assertEqual(mask.tolist(), [False, False, False, True])
+        self.assertIsNone(self.store.mask({'prods_to_show': 3}))
+
+
+    def test_facets(self):
+        facets = self.store.facets([0, 1, 2], size=1)
+        self.assertEqual(facets['category'], {'Decoração': 2, 'Bebê': 1})
+        self.assertEqual(facets['seller_id'], {1: 2})
+        self.assertEqual([b['count'] for b in facets['price']], [1, 0, 0, 1, 0, 0])
+        self.assertEqual(facets['weight'][0], {'min': 0.0, 'max': 100.0, 'count': 1})
+        facets = self.store.facets([1, 2], buckets={'weight': [50, 500]})
+        self.assertEqual(facets['weight'], [{'min': 50.0, 'max': 500.0, 'count': 1},
+                                            {'min': 500.0, 'max': None, 'count': 0}])
+        self.store.append({'seller_id': 3, 'price': 1.0, 'category': 'Bebê'})
+        self.assertEqual(self.store.facets([1, 3])['seller_id'], {2: 1, 3: 1})
+        self.assertRaises(ValueError, self.store.facets, [0], {'color': [0]})
+        self.assertRaises(ValueError, self.store.facets, [0], {'price': [10, 5]})
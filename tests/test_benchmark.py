@@ -0,0 +1,59 @@
+import unittest
+import tempfile
+import os
+import pandas as pd
+import benchmarks.catalog as ctl
+import benchmarks.run as bch
+
+class TestBenchmark(unittest.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        unittest.TestCase.__init__(self,*args,**kwargs)
+        self.sample = pd.read_csv(os.path.abspath("data/elo7_recruitment_dataset_100.csv"))
+
+
+    def test_catalog_schema(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = ctl.CatalogGenerator(seed=5).write(os.path.join(tmp, 'c.csv'), 250, 100)
+            catalog = pd.read_csv(path)
+        self.assertEqual(list(self.sample.columns), list(catalog.columns))
+        self.assertEqual(250, len(catalog))
+        self.assertTrue(catalog['product_id'].is_unique)
+        for column in ['product_id', 'seller_id', 'search_page', 'position', 'price']:
+            self.assertEqual(self.sample[column].dtype.kind, catalog[column].dtype.kind)
+        self.assertTrue(set(catalog['category']) <= set(ctl.CATEGORIES))
+
+
+    def test_catalog_seed(self):
+        first = next(ctl.CatalogGenerator(seed=1).generate(50))
+        second = next(ctl.CatalogGenerator(seed=1).generate(50))
+        other = next(ctl.CatalogGenerator(seed=2).generate(50))
+        self.assertTrue(first.equals(second))
+        self.assertFalse(first['title'].equals(other['title']))
+
+
+    def test_run(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            report = bch.run([300], tmp, num_queries=20, isolate=False)
+        result = report['sizes']['300']
+        self.assertEqual(300, result['documents'])
+        self.assertGreater(result['disk_mb'], 0)
+        for kind in ['unfiltered', 'filtered', 'multi_term', 'conjunctive']:
+            self.assertEqual(20, result[kind]['queries'])
+            self.assertLessEqual(result[kind]['p50_ms'], result[kind]['p99_ms'])
+        precision = result['precision']
+        self.assertEqual(1.0, precision['float64']['unfiltered']['overlap'])
+        self.assertLess(precision['int8']['weights_mb'], precision['float64']['weights_mb'])
+        self.assertGreater(precision['int8']['warm_rss_mb'], 0)
+        self.assertGreater(precision['int8']['index_rss_mb'], 0)
+        self.assertGreater(result['suggest']['queries'], 20)
+        self.assertGreater(result['suggest']['memory_mb'], 0)
+        self.assertGreaterEqual(result['fuzzy']['fuzzy']['overlap'],
+                                result['fuzzy']['exact']['overlap'])
+        self.assertEqual(20, result['facets']['faceted']['queries'])
+        self.assertEqual([], bch.compare(report, report))
+
+
+
+if __name__ == '__main__':
+    unittest.main()
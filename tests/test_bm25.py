@@ -0,0 +1,78 @@
+import unittest
+import src.indexer as idx
+import src.searcher as sch
+import src.bm25 as bm
+import numpy as np
+import os
+
+class TestBM25(unittest.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        unittest.TestCase.__init__(self,*args,**kwargs)
+        datapath = os.path.abspath("data/elo7_recruitment_dataset_100.csv")
+        self.indexer = idx.Indexer(datapath)
+        self.searcher = sch.Searcher(self.indexer, cache_size=0, ranking='bm25')
+        self.exhaustive = sch.Searcher(self.indexer, cache_size=0, ranking='bm25',
+                                       pruning=False)
+        self.queries = ['lembrancinha', 'mandala croche', 'kit bebe maternidade',
+                        'dia dos pais chaveiro', 'saia', 'xyzzy', '']
+
+
+    def test_top_k(self):
+        lists = [(np.array([1, 3, 5]), np.array([1.0, 3.0, 2.0]), 3.0),
+                 (np.array([0, 1, 2, 3, 4, 5, 6]), np.full(7, 0.5), 0.5),
+                 (np.array([2, 5]), np.array([2.5, 0.1]), 2.5)]
+        docs, scores, scored = bm.top_k(lists, 2)
+        self.assertEqual([3, 2], docs.tolist())
+        self.assertEqual([3.5, 3.0], scores.tolist())
+        full_docs, full_scores, full_scored = bm.top_k(lists, 2, prune=False)
+        self.assertEqual(docs.tolist(), full_docs.tolist())
+        self.assertLess(scored, full_scored)
+        accept = np.ones(7, dtype=bool)
+        accept[3] = False
+        docs, _, _ = bm.top_k(lists, 2, accept)
+        self.assertEqual([2, 5], docs.tolist())
+
+
+    def test_pruning_is_exact(self):
+        for k in [1, 5, 20]:
+            for params in [{}, {'price_max': 80}, {'category': 'Bebê'}]:
+                for query in self.queries:
+                    self.assertEqual(self.exhaustive.search(query, k, **params),
+                                     self.searcher.search(query, k, **params))
+
+
+    def test_upper_bounds(self):
+        bm25 = self.indexer.bm25
+        offsets = self.indexer.inverted_index.offsets
+        for col in range(len(offsets)-1):
+            impacts = bm25.impacts[offsets[col]:offsets[col+1]]
+            self.assertEqual(impacts.max(), bm25.upper_bounds[col])
+
+
+    def test_bm25_ranking(self):
+        result = self.searcher.search('lembrancinha maternidade', 3)
+        self.assertEqual(10869150, result[0])
+        self.assertRaises(ValueError, sch.Searcher, self.indexer, ranking='tfidf')
+
+
+    def test_upsert_remove(self):
+        doc = self.indexer.get_document(7621260)
+        doc['product_id'] = 1
+        doc['title'] = 'Saia rodada kwyjibo'
+        self.indexer.upsert(doc)
+        self.assertEqual(self.searcher.search('kwyjibo'), [1])
+        self.assertIn(1, self.searcher.search('saia', seller_id=7274093))
+        self.indexer.remove(7621260)
+        self.assertNotIn(7621260, self.searcher.search('saia'))
+        before = self.searcher.search('saia rodada', 5)
+        self.assertEqual(before, self.exhaustive.search('saia rodada', 5))
+        self.indexer.compact()
+        self.assertEqual(self.searcher.search('kwyjibo'), [1])
+        self.assertEqual(self.exhaustive.search('saia rodada', 5),
+                         self.searcher.search('saia rodada', 5))
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+import unittest
+import src.cache as cch
+
+class TestCache(unittest.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        unittest.TestCase.__init__(self,*args,**kwargs)
+        self.now = 0
+        self.cache = cch.ResultCache(max_size=2, ttl=10, clock=lambda: self.now)
+
+
+    def test_smaller_top_k(self):
+        self.cache.put('a', 5, [1, 2, 3, 4, 5], 0)
+        self.assertEqual(self.cache.get('a', 3, 0), [1, 2, 3])
+        self.assertIsNone(self.cache.get('a', 6, 0))
+        self.cache.put('b', 5, [1, 2], 0)
+        self.assertEqual(self.cache.get('b', 10, 0), [1, 2])
+        self.assertEqual(self.cache.stats()['hits'], 2)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+
+    def test_invalidation(self):
+        self.cache.put('a', 5, [1], 0)
+        self.assertIsNone(self.cache.get('a', 5, 1))
+        self.cache.put('a', 5, [1], 1)
+        self.now = 11
+        self.assertIsNone(self.cache.get('a', 5, 1))
+
+
+    def test_eviction(self):
+        for key in ['a', 'b', 'c']:
+            self.cache.put(key, 5, [1], 0)
+        self.assertIsNone(self.cache.get('a', 5, 0))
+        self.assertEqual(self.cache.stats()['evictions'], 1)
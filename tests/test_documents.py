@@ -0,0 +1,92 @@
+import unittest
+import src.documents as dcs
+import src.storage as stg
+import numpy as np
+import tempfile
+import shutil
+import os
+
+class TestDocuments(unittest.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        unittest.TestCase.__init__(self,*args,**kwargs)
+        self.records = [{'product_id': 10+i, 'title': 'Produto {}'.format(i),
+                         'price': 1.5*i, 'category': ['Bebê', 'Decoração'][i%2]}
+                        for i in range(12)]
+        self.records[3]['title'] = np.nan
+        self.records[4]['category'] = np.nan
+        self.store = dcs.DocumentStore.from_records(self.records)
+
+
+    def assertRecord(self, doc, expected):
+        self.assertEqual(set(doc), set(expected))
+        for field, value in expected.items():
+            if value != value:
+                self.assertTrue(doc[field] != doc[field], field)
+            else:
+                self.assertEqual(doc[field], value, field)
+
+
+    def test_columns(self):
+        kinds = self.store.kinds
+        self.assertEqual((kinds['product_id'], kinds['price']), ('int', 'float'))
+        self.assertEqual((kinds['title'], kinds['category']), ('str', 'cat'))
+        self.assertEqual(len(self.store), 12)
+        for i, record in enumerate(self.records):
+            self.assertRecord(self.store.get(i), record)
+        self.assertEqual(self.store.column('product_id', [1, 5]).tolist(), [11, 15])
+        self.assertEqual(self.store.column('category', [0, 1]), ['Bebê', 'Decoração'])
+
+
+    def test_append_select(self):
+        self.store.append({'product_id': 99, 'title': 'Novo', 'price': np.nan,
+                           'category': 'Papel'})
+        self.assertEqual(len(self.store), 13)
+        self.assertEqual(self.store.get(12)['title'], 'Novo')
+        self.assertEqual(self.store.column('product_id')[-2:].tolist(), [21, 99])
+        live = np.ones(13, dtype=bool)
+        live[[0, 3, 6]] = False
+        selected = self.store.select(live)
+        self.assertEqual(len(selected), 10)
+        self.assertEqual(selected.tail, [])
+        expected = [r for r, k in zip(self.records, live) if k]
+        for i, record in enumerate(expected):
+            self.assertRecord(selected.get(i), record)
+        self.assertEqual(selected.get(9)['category'], 'Papel')
+
+
+    def test_concatenate(self):
+        stores = [dcs.DocumentStore.from_records(self.records[i:j])\
+                  for i, j in [(0, 12), (12, 12), (2, 4), (10, 12)]]
+        stores[2].columns['price'] = stores[2].columns['price'].astype(np.int64)
+        stores[2].kinds['price'] = 'int'
+        self.assertEqual((stores[0].kinds['category'], stores[2].kinds['category']),
+                         ('cat', 'str'))
+        store = dcs.DocumentStore.concatenate(stores)
+        self.assertEqual(len(store), 16)
+        self.assertEqual((store.kinds['price'], store.kinds['category']), ('float', 'str'))
+        expected = self.records + self.records[2:4] + self.records[10:12]
+        expected[12] = dict(expected[12], price=int(expected[12]['price']))
+        expected[13] = dict(expected[13], price=int(expected[13]['price']))
+        for i, record in enumerate(expected):
+            self.assertRecord(store.get(i), record)
+        store = dcs.DocumentStore.concatenate([stores[0], stores[0]])
+        self.assertEqual(store.kinds['category'], 'cat')
+        self.assertEqual(repr(store.column('category')[12:]), repr(store.column('category')[:12]))
+
+
+    def test_storage(self):
+        tmp_dir = tempfile.mkdtemp()
+        path = os.path.join(tmp_dir, 'docs.idx')
+        self.store.append({'product_id': 99, 'title': 'Novo', 'price': 2.0,
+                           'category': 'Bebê'})
+        stg.write_index(path, {'doc_fields': self.store.fields,
+                               'doc_kinds': self.store.kinds},
+                        self.store.to_sections())
+        loaded = dcs.DocumentStore.from_index_file(stg.IndexFile(path))
+        self.assertEqual(len(loaded), 13)
+        for i, record in enumerate(self.records):
+            self.assertRecord(loaded.get(i), record)
+        self.assertEqual(loaded.get(12)['product_id'], 99)
+        del loaded
+        shutil.rmtree(tmp_dir)
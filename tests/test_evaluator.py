@@ -0,0 +1,70 @@
+import unittest
+import src.indexer as idx
+import src.searcher as sch
+import src.evaluator as evl
+import os
+
+class TestEvaluator(unittest.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        unittest.TestCase.__init__(self,*args,**kwargs)
+        self.datapath = os.path.abspath("data/elo7_recruitment_dataset_100.csv")
+        self.indexer = idx.Indexer(self.datapath)
+        self.searcher = sch.Searcher(self.indexer)
+
+
+    def test_seeded_sample(self):
+        evaluator = evl.Evaluator(self.datapath, self.searcher, seed=42)
+        first = evaluator.sample(50).tolist()
+        self.assertEqual(first, evaluator.sample(50).tolist())
+        other = evl.Evaluator(self.datapath, self.searcher, seed=7)
+        self.assertNotEqual(first, other.sample(50).tolist())
+
+
+    def test_parallel_evaluate(self):
+        serial = evl.Evaluator(self.datapath, self.searcher, seed=3)
+        report = serial.evaluate(40)
+        parallel = evl.Evaluator(self.datapath, self.searcher, seed=3,
+                                 workers=2, batch_size=8)
+        result = parallel.evaluate(40)
+        self.assertEqual(report['errors'], result['errors'])
+        self.assertEqual(report['rmse'], result['rmse'])
+        self.assertEqual(40, result['queries'])
+
+
+    def test_compare(self):
+        evaluator = evl.Evaluator(self.datapath, self.searcher, seed=2)
+        engines = {'cosine': self.searcher,
+                   'bm25': sch.Searcher(self.indexer, ranking='bm25')}
+        reports = evaluator.compare(engines, 30)
+        self.assertEqual(['cosine', 'bm25'], list(reports))
+        self.assertEqual(evaluator.evaluate(30)['errors'], reports['cosine']['errors'])
+        self.assertEqual(30, reports['bm25']['queries'])
+
+
+    def test_error_delta(self):
+        evaluator = evl.Evaluator(self.datapath, self.searcher, seed=2)
+        engines = {'float64': self.searcher,
+                   'int8': sch.Searcher(idx.Indexer(self.datapath, precision='int8'))}
+        reports = evaluator.compare(engines, 30)
+        deltas = evaluator.error_delta(reports, 'float64')
+        self.assertEqual(deltas['float64'], {'rmse': 0, 'mean_abs_change': 0, 'changed': 0})
+        self.assertAlmostEqual(deltas['int8']['rmse'],
+                               reports['int8']['rmse'] - reports['float64']['rmse'])
+        self.assertLessEqual(deltas['int8']['changed'], 1)
+
+
+    def test_report(self):
+        evaluator = evl.Evaluator(self.datapath, self.searcher, seed=1)
+        report = evaluator.evaluate(20, limit=10)
+        self.assertEqual(20, len(report['errors']))
+        self.assertTrue(all(e >= 0 for e in report['errors']))
+        latency = report['latency']
+        self.assertLessEqual(latency['p50'], latency['p95'])
+        self.assertLessEqual(latency['p95'], latency['p99'])
+        self.assertGreater(report['qps'], 0)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
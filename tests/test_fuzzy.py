@@ -0,0 +1,74 @@
+import unittest
+import tempfile
+import shutil
+import os
+import src.indexer as idx
+import src.searcher as sch
+import src.storage as stg
+import src.fuzzy as fzz
+
+class TestFuzzy(unittest.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        unittest.TestCase.__init__(self,*args,**kwargs)
+        self.doc_freq = {'lembranc': 30, 'lembr': 2, 'mandal': 5, 'mand': 8, 'croch': 12,
+                         'bol': 4, 'bola': 9}
+        self.index = fzz.DeleteIndex.from_words(list(self.doc_freq) + ['ab'])
+
+
+    def test_deletes(self):
+        self.assertEqual(fzz.deletes('abc', 1), {'abc', 'bc', 'ac', 'ab'})
+        self.assertEqual(len(fzz.deletes('abcd', 2)), 1+4+6)
+        self.assertEqual(fzz.deletes('aab', 1), {'aab', 'ab', 'aa'})
+
+
+    def test_edit_distance(self):
+        self.assertEqual(fzz.edit_distance('croche', 'croche'), 0)
+        self.assertEqual(fzz.edit_distance('croche', 'corche'), 1)
+        self.assertEqual(fzz.edit_distance('lembranc', 'lembrac'), 1)
+        self.assertEqual(fzz.edit_distance('mandala', 'mnadla'), 2)
+        self.assertEqual(fzz.edit_distance('kitten', 'sitting'), 3)
+        self.assertEqual(fzz.edit_distance('kitten', 'sitting', 1), 2)
+
+
+    def test_correct(self):
+        self.assertEqual(self.index.correct('lembranc', self.doc_freq), ('lembranc', 0))
+        self.assertEqual(self.index.correct('lembrac', self.doc_freq)[0], 'lembranc')
+        self.assertEqual(self.index.correct('crohc', self.doc_freq)[0], 'croch')
+        self.assertEqual(self.index.correct('mandla', self.doc_freq)[0], 'mandal')
+        self.assertEqual(self.index.correct('bolo', self.doc_freq)[0], 'bola')
+        self.assertEqual(self.index.correct('xyzw', self.doc_freq), (None, 0))
+        self.assertIsNone(self.index.correct('ac', self.doc_freq)[0])
+        self.assertEqual(self.index.correct('lembrac', self.doc_freq, budget=0),
+                         (None, 0))
+        self.assertEqual(self.index.correct('lembrac', dict(self.doc_freq, lembranc=0))[0],
+                         'lembr')
+
+
+    def test_storage(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'fuzzy.idx')
+            stg.write_index(path, {'fuzzy': 2}, self.index.to_sections())
+            index = fzz.DeleteIndex.from_index_file(stg.IndexFile(path))
+            self.assertEqual(index.words, self.index.words)
+            self.assertEqual(index.correct('mandla', self.doc_freq)[0], 'mandal')
+            self.assertEqual(len(index), len(self.index))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
+    def test_search(self):
+        path = os.path.abspath('data/elo7_recruitment_dataset_100.csv')
+        self.assertRaises(ValueError, sch.Searcher, idx.Indexer(path), fuzzy=True)
+        indexer = idx.Indexer(path, fuzzy=True)
+        exact = sch.Searcher(indexer)
+        fuzzy = sch.Searcher(indexer, fuzzy=True)
+        self.assertEqual(exact.search('lembracinha'), [])
+        self.assertEqual(fuzzy.search('lembracinha'), exact.search('lembrancinha'))
+        self.assertEqual(fuzzy.search('mandla croche'), exact.search('mandala croche'))
+        self.assertEqual(fuzzy.search('croche AND mandla'), exact.search('croche AND mandala'))
+        self.assertEqual(sch.Searcher(indexer, fuzzy=True, fuzzy_budget=0)\
+                         .search('lembracinha'), [])
+        loaded = sch.Searcher(idx.Indexer(path, fuzzy=True), fuzzy=True)
+        self.assertEqual(loaded.search('lembracinha'), exact.search('lembrancinha'))
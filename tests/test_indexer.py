@@ -3,6 +3,9 @@ import src.indexer as idx
 import os
 import pandas as pd
 import string
+import shutil
+import tempfile
+import numpy as np
 
 class TestIndexer(unittest.TestCase):
 
@@ -32,9 +35,27 @@ class TestIndexer(unittest.TestCase):
     def test_store_indexes(self):
         test_name = self.datapath + '_test_.csv'
         self.indexer._store_indexes(test_name)
-        val = os.path.exists(test_name[:-4] + '_processed.npz')
+        val = os.path.exists(test_name[:-4] + '_processed.idx')
         self.assertTrue(val)
-        os.remove(test_name[:-4] + '_processed.npz')
+        os.remove(test_name[:-4] + '_processed.idx')
+
+
+    def test_stale_index(self):
+        dataset = pd.read_csv(self.datapath)
+        tmp_dir = tempfile.mkdtemp()
+        path = os.path.join(tmp_dir, 'dataset.csv')
+        dataset[:5].to_csv(path, index=False)
+        self.assertEqual(len(idx.Indexer(path).doc_ids), 5)
+        dataset.to_csv(path, index=False)
+        self.assertEqual(len(idx.Indexer(path).doc_ids), len(dataset))
+        shutil.rmtree(tmp_dir)
+
+
+    def test_lazy_load(self):
+        indexer = idx.Indexer(self.datapath)
+        self.assertNotIn('documents', indexer.__dict__)
+        self.assertEqual(indexer.get_document(16153119)['product_id'], 16153119)
+        self.assertIn('documents', indexer.__dict__)
 
 
     def test_generate_stop_words(self):
@@ -62,6 +83,33 @@ class TestIndexer(unittest.TestCase):
         self.assertEqual(expected, doc[0])
 
 
+    def test_parallel_create_indexes(self):
+        src = os.path.abspath("data/elo7_recruitment_dataset_100.csv")
+        tmp_dir = tempfile.mkdtemp()
+        indexers = []
+        for workers, chunk_size in [(1, 10000), (3, 7)]:
+            path = os.path.join(tmp_dir, 'dataset_{}.csv'.format(workers))
+            shutil.copy(src, path)
+            indexers.append(idx.Indexer(path, workers=workers,
+                                        chunk_size=chunk_size))
+        shutil.rmtree(tmp_dir)
+        serial, parallel = indexers
+        self.assertEqual(serial.word_idx, parallel.word_idx)
+        self.assertEqual(serial.inv_doc_freq, parallel.inv_doc_freq)
+        self.assertTrue(np.array_equal(serial.doc_ids, parallel.doc_ids))
+        for attr in ['data', 'indices', 'indptr']:
+            self.assertTrue(np.array_equal(getattr(serial.tfidf_index, attr),
+                                           getattr(parallel.tfidf_index, attr)))
+        self.assertTrue(np.array_equal(serial.inverted_index.data,
+                                       parallel.inverted_index.data))
+        self.assertTrue(np.array_equal(serial.feature_index,
+                                       parallel.feature_index))
+        self.assertTrue(np.array_equal(serial.doc_lengths, parallel.doc_lengths))
+        for product_id in serial.doc_ids.tolist():
+            self.assertEqual(repr(serial.get_document(product_id)),
+                             repr(parallel.get_document(product_id)))
+
+
     def test_preprocess(self):
         doc = 'batata quente amarela'
         text = self.indexer.preprocess(doc)
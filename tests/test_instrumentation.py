@@ -0,0 +1,78 @@
+import unittest
+import src.indexer as idx
+import src.searcher as sch
+import src.instrumentation as ins
+import os
+
+class TestInstrumentation(unittest.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        unittest.TestCase.__init__(self,*args,**kwargs)
+        datapath = os.path.abspath("data/elo7_recruitment_dataset_100.csv")
+        self.indexer = idx.Indexer(datapath)
+        self.ticks = 0
+
+
+    def clock(self):
+        self.ticks += 1
+        return self.ticks / 1000
+
+
+    def test_trace(self):
+        seen = []
+        stats = ins.Instrumentation(timer=self.clock, hooks=[lambda n,s: seen.append(n)])
+        for _ in range(2):
+            with stats.trace('search') as trace:
+                with trace.stage('score'):
+                    trace.count('candidates_scored', 5)
+        snapshot = stats.snapshot()
+        self.assertEqual(2, snapshot['stages']['search']['calls'])
+        self.assertEqual(2, snapshot['stages']['score']['calls'])
+        self.assertAlmostEqual(1.0, snapshot['stages']['score']['mean_ms'])
+        self.assertAlmostEqual(3.0, snapshot['stages']['search']['mean_ms'])
+        self.assertEqual(10, snapshot['counters']['candidates_scored'])
+        self.assertEqual(['score', 'score'], seen)
+        stats.reset()
+        self.assertEqual({}, stats.snapshot()['stages'])
+
+
+    def test_slow_query_log(self):
+        logged = []
+        stats = ins.Instrumentation(timer=self.clock, slow_query_ms=2.5,
+                                    on_slow_query=logged.append)
+        with stats.trace('search', queries=['fast']):
+            pass
+        with stats.trace('search', queries=['slow']) as trace:
+            with trace.stage('sort'):
+                pass
+        slow = stats.snapshot()['slow_queries']
+        self.assertEqual(1, len(slow))
+        self.assertEqual(['slow'], slow[0]['queries'])
+        self.assertEqual(slow, logged)
+
+
+    def test_disabled(self):
+        searcher = sch.Searcher(self.indexer)
+        self.assertIs(ins.DISABLED, searcher.instrumentation)
+        searcher.search('lembrancinha', price_max=100)
+        self.assertEqual({}, searcher.stats()['stages'])
+
+
+    def test_searcher_stats(self):
+        stats = ins.Instrumentation()
+        searcher = sch.Searcher(self.indexer, cache_size=0, instrumentation=stats)
+        result = searcher.search('lembrancinha', prods_to_show=5, price_max=100)
+        snapshot = searcher.stats()
+        for stage in ['search', 'preprocess', 'candidates', 'filter', 'score', 'sort']:
+            self.assertIn(stage, snapshot['stages'])
+        counters = snapshot['counters']
+        self.assertEqual(1, counters['queries'])
+        self.assertGreaterEqual(counters['postings_touched'], counters['filter_input'])
+        self.assertGreaterEqual(counters['candidates_scored'], len(result))
+        self.assertLessEqual(snapshot['ratios']['filter_selectivity'], 1)
+        self.assertIn('cache', ins.format_snapshot(snapshot))
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+import subprocess
+import tempfile
+from unittest import mock
+import sys
+import os
+import src.indexer as idx
+import src.searcher as sch
+import src.lexicon as lex
+
+class TestLexicon(unittest.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        unittest.TestCase.__init__(self,*args,**kwargs)
+        self.datapath = os.path.abspath("data/elo7_recruitment_dataset_100.csv")
+        self.indexer = idx.Indexer(self.datapath)
+
+
+    def test_build_resources(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = lex.build_resources(os.path.join(tmp, 'portuguese.json'))
+            resources = lex.load_resources(path)
+        self.assertEqual(lex.compile_resources(), resources)
+        self.assertIn('de', resources['stop_words'])
+
+
+    def test_download_fallback(self):
+        rules = [[['s', 2, '', []]]]
+        expected = {'version': lex.RESOURCE_VERSION, 'stop_words': ['de'], 'rslp': rules}
+        with tempfile.TemporaryDirectory() as tmp:
+            missing = os.path.join(tmp, 'missing.json')
+            with mock.patch('nltk.download') as download,\
+                 mock.patch.object(lex, '_read_nltk', side_effect=[LookupError, (['de'], rules)]):
+                self.assertEqual(lex.load_resources(missing), expected)
+            self.assertEqual(sorted(c.args[0] for c in download.call_args_list),
+                             ['rslp', 'stopwords'])
+            with mock.patch('nltk.download') as download,\
+                 mock.patch.object(lex, '_read_nltk', side_effect=LookupError):
+                self.assertRaises(LookupError, lex.load_resources, missing)
+                self.assertRaises(LookupError, lex.compile_resources, download=False)
+            self.assertEqual(download.call_count, 2)
+
+
+    def test_stemmer(self):
+        from nltk.stem import RSLPStemmer
+        reference = RSLPStemmer()
+        stemmer = lex.RSLPStemmer(lex.load_resources()['rslp'])
+        words = set()
+        for doc in self.indexer.get_documents(self.indexer.doc_ids.tolist()).values():
+            words.update(self.indexer.analyzer.tokenize(doc['title'].lower()))
+        for word in words:
+            self.assertEqual(reference.stem(word), stemmer.stem(word))
+
+
+    def test_offline_start(self):
+        script = ('import sys\n'
+                  'import src.indexer as idx\n'
+                  'import src.searcher as sch\n'
+                  'import src.evaluator as evl\n'
+                  'indexer = idx.Indexer({!r})\n'
+                  'print(sch.Searcher(indexer).search("bolsa", 3))\n'
+                  'print([m for m in ["nltk", "pandas", "num2words", "matplotlib"]'
+                  ' if m in sys.modules])\n').format(self.datapath)
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, NLTK_DATA=tmp,
+                       SEARCH_ENGINE_LEXICON=lex.build_resources(os.path.join(tmp, 'pt.json')))
+            output = subprocess.run([sys.executable, '-c', script], env=env, check=True,
+                                    capture_output=True, text=True).stdout
+        result, modules = output.strip().splitlines()[-2:]
+        expected = sch.Searcher(self.indexer).search('bolsa', 3)
+        self.assertEqual(str(expected), result)
+        self.assertEqual('[]', modules)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+import src.postings as pst
+import numpy as np
+
+class TestPostings(unittest.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        unittest.TestCase.__init__(self,*args,**kwargs)
+        word_idx = {'a':0, 'b':1, 'c':2}
+        cols = [0, 1, 0, 0, 2, 1]
+        docs = [3, 0, 1, 3, 300, 0]
+        self.index = pst.InvertedIndex.from_pairs(word_idx, cols, docs)
+
+
+    def test_from_pairs(self):
+        self.assertEqual(self.index['a'].tolist(), [1, 3])
+        self.assertEqual(self.index['b'].tolist(), [0])
+        self.assertEqual(self.index['c'].tolist(), [300])
+        self.assertEqual(len(self.index.get('z')), 0)
+
+
+    def test_varint_roundtrip(self):
+        offsets = np.array([0, 4, 4, 7])
+        data = np.array([0, 127, 128, 70000, 5, 2**28, 2**31-1], dtype=np.int32)
+        buf = pst.encode_varint(data, offsets)
+        self.assertEqual(buf.dtype, np.uint8)
+        decoded = pst.decode_varint(buf, offsets)
+        self.assertEqual(decoded.tolist(), data.tolist())
+
+
+    def test_union(self):
+        result = pst.union([np.array([1, 4, 9]), np.array([2, 4])])
+        self.assertEqual(result.tolist(), [1, 2, 4, 9])
+
+
+    def test_intersection(self):
+        result = pst.intersection([np.array([1, 4, 9]), np.array([2, 4, 9])])
+        self.assertEqual(result.tolist(), [4, 9])
+
+
+    def test_galloping_intersection(self):
+        short = np.array([3, 500, 999])
+        long = np.arange(0, 1000, 3)
+        result, touched = pst.intersection([long, short], return_touched=True)
+        self.assertEqual(result.tolist(), [3, 999])
+        self.assertLess(touched, len(long))
+        self.assertEqual(pst.intersection([long, np.array([1000])]).tolist(), [])
+
+
+    def test_positional_index(self):
+        tokens = [[0, 1, 0], [2, 0]]
+        positions = pst.PositionalIndex.from_tokens(tokens, [2, 0])
+        index = pst.InvertedIndex.from_pairs({'a':0, 'b':1, 'c':2}, [0, 1, 0, 2, 0],
+                                             [0, 0, 0, 1, 1])
+        self.assertEqual(index['a'].tolist(), [0, 1])
+        owners, pos = positions.gather(np.array([0, 1]))
+        self.assertEqual(owners.tolist(), [0, 0, 1])
+        self.assertEqual(pos.tolist(), [0, 3, 2])
+        cols, docs, pos = positions.to_triplets(index)
+        rebuilt = pst.PositionalIndex.from_triplets(cols, docs, pos, [2, 0])
+        self.assertEqual(rebuilt.data.tolist(), positions.data.tolist())
+        self.assertEqual(rebuilt.offsets.tolist(), positions.offsets.tolist())
@@ -0,0 +1,112 @@
+import unittest
+import src.indexer as idx
+import src.searcher as sch
+import src.query as qry
+import pandas as pd
+import tempfile
+import shutil
+import os
+
+class TestQuery(unittest.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        unittest.TestCase.__init__(self,*args,**kwargs)
+        self.datapath = os.path.abspath("data/elo7_recruitment_dataset_100.csv")
+        self.dataset = pd.read_csv(self.datapath)
+        self.tmp_dir = tempfile.mkdtemp()
+        path = os.path.join(self.tmp_dir, 'dataset.csv')
+        self.dataset.to_csv(path, index=False)
+        self.indexer = idx.Indexer(path, positions=True)
+        self.analyzer = self.indexer.analyzer
+        self.searcher = sch.Searcher(self.indexer, cache_size=0)
+
+
+    def __del__(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+    def brute_force(self, clauses):
+        """
+        Product ids meeting the clauses, found by scanning
+        the analyzed fields of every product
+        """
+        def contains(words, stems):
+            n = len(stems)
+            return any(tuple(words[i:i+n]) == stems for i in range(len(words)-n+1))
+        result = set()
+        for doc in self.indexer.get_documents(self.indexer.doc_idx).values():
+            title = self.analyzer.analyze(doc['title'])
+            tags = self.analyzer.analyze(doc['concatenated_tags'])
+            fields = {'title': [title], 'concatenated_tags': [tags], None: [title, tags]}
+            if all(any(contains(f, stems) for f in fields[field]) for field, stems in clauses):
+                result.add(doc['product_id'])
+        return result
+
+
+    def test_parse(self):
+        plain = qry.parse('mandala croche', self.analyzer)
+        self.assertEqual(plain.words, self.analyzer.analyze('mandala croche'))
+        self.assertEqual(plain.clauses, ())
+        stem = lambda w: self.analyzer.analyze(w)[0]
+        query = qry.parse('kit AND caneca "dia dos pais" title:mandala', self.analyzer)
+        self.assertEqual(query.clauses, ((None, (stem('kit'),)), (None, (stem('caneca'),)),
+                                         (None, (stem('dia'), stem('pais'))),
+                                         ('title', (stem('mandala'),))))
+        query = qry.parse('tags:"lembrancinha personalizada" bolsa', self.analyzer)
+        self.assertEqual(query.clauses, (('concatenated_tags', (stem('lembrancinha'),
+                                                                stem('personalizada'))),))
+        self.assertIn(stem('bolsa'), query.words)
+        query = qry.parse('kit caneca', self.analyzer, operator='and')
+        self.assertEqual(len(query.clauses), 2)
+        self.assertRaises(ValueError, qry.parse, 'kit', self.analyzer, 'xor')
+
+
+    def test_match(self):
+        queries = ['lembrancinha AND personalizada', '"dia dos pais"', 'title:mandala',
+                   'tags:croche', 'title:"kit bebe"', 'kit AND caneca AND xyzzy',
+                   'tags:"lembrancinha maternidade"']
+        for text in queries:
+            clauses = qry.parse(text, self.analyzer).clauses
+            ordinals, touched = self.indexer.match(clauses)
+            found = set(self.indexer.get_product_ids(ordinals).tolist())
+            self.assertEqual(found, self.brute_force(clauses), text)
+            self.assertLessEqual(touched, self.indexer.count_postings(
+                [w for _, stems in clauses for w in stems]) + 2*len(clauses))
+
+
+    def test_search(self):
+        for ranking in sch.Searcher.RANKINGS:
+            searcher = sch.Searcher(self.indexer, cache_size=0, ranking=ranking)
+            clauses = qry.parse('"dia dos pais"', self.analyzer).clauses
+            expected = self.brute_force(clauses)
+            result = searcher.search('"dia dos pais"', prods_to_show=100)
+            self.assertEqual(set(result), expected)
+            self.assertLessEqual(len(result), len(searcher.search('dia dos pais', 100)))
+            conjunctive = sch.Searcher(self.indexer, cache_size=0, ranking=ranking,
+                                       operator='and')
+            self.assertEqual(conjunctive.search('lembrancinha personalizada', 100),
+                             searcher.search('lembrancinha AND personalizada', 100))
+
+
+    def test_upsert_compact(self):
+        doc = self.indexer.get_document(7621260)
+        doc['product_id'] = 1
+        doc['title'] = 'Saia kwyjibo rodada'
+        doc['concatenated_tags'] = 'rodada kwyjibo'
+        self.indexer.upsert(doc)
+        self.assertEqual(self.searcher.search('"kwyjibo rodada"'), [1])
+        self.assertEqual(self.searcher.search('title:"saia kwyjibo"'), [1])
+        self.assertEqual(self.searcher.search('tags:"saia kwyjibo"'), [])
+        self.indexer.remove(7621260)
+        self.indexer.compact()
+        self.assertEqual(self.searcher.search('tags:"rodada kwyjibo"'), [1])
+        clauses = qry.parse('title:saia', self.analyzer).clauses
+        found = set(self.indexer.get_product_ids(self.indexer.match(clauses)[0]).tolist())
+        self.assertEqual(found, self.brute_force(clauses))
+
+
+    def test_requires_positions(self):
+        indexer = idx.Indexer(self.datapath)
+        searcher = sch.Searcher(indexer)
+        self.assertRaises(ValueError, searcher.search, '"dia dos pais"')
+        self.assertGreater(len(searcher.search('lembrancinha AND personalizada')), 0)
@@ -2,14 +2,16 @@ import unittest
 import src.indexer as idx
 import src.searcher as sch
 import os
+import threading
+import numpy as np
 
 class TestIndexer(unittest.TestCase):
 
     def __init__(self, *args, **kwargs):
         unittest.TestCase.__init__(self,*args,**kwargs)
         datapath = os.path.abspath("data/elo7_recruitment_dataset_100.csv")
-        indexer = idx.Indexer(datapath)
-        self.searcher = sch.Searcher(indexer)
+        self.indexer = idx.Indexer(datapath)
+        self.searcher = sch.Searcher(self.indexer)
 
 
     def test_search_prods_to_show(self):
@@ -81,4 +83,124 @@ class TestIndexer(unittest.TestCase):
         result = self.searcher.search("adesivo", category="Decoração")[0]
         self.assertEqual(result, 15917108)
         result = self.searcher.search("adesivo", category="Papel e Cia")[0]
-        self.assertEqual(result, 15534262)
\ No newline at end of file
+        self.assertEqual(result, 15534262)
+
+
+    def test_search_many(self):
+        searcher = sch.Searcher(self.indexer, cache_size=0)
+        queries = ['bolsa', 'lembrancinha', 'mandala croche', 'xyzzy', '']
+        expected = [searcher.search(q, prods_to_show=7, price_max=150) for q in queries]
+        result = searcher.search_many(queries, prods_to_show=7, price_max=150)
+        self.assertEqual(expected, result)
+
+
+    def test_search_faceted(self):
+        queries = ['lembrancinha', 'mandala croche', 'xyzzy']
+        for ranking in sch.Searcher.RANKINGS:
+            searcher = sch.Searcher(self.indexer, cache_size=0, ranking=ranking)
+            result = searcher.search_faceted(queries, 5, price_max=100)
+            for query, (ranking, facets) in zip(queries, result):
+                self.assertEqual(ranking, searcher.search(query, 5, price_max=100))
+                matched = searcher.search(query, 1000, price_max=100)
+                self.assertEqual(sum(facets['category'].values()), len(matched))
+                self.assertEqual(sum(b['count'] for b in facets['price']), len(matched))
+                for category, count in facets['category'].items():
+                    self.assertEqual(count, len(searcher.search(query, 1000, price_max=100,
+                                                                category=category)))
+
+
+    def test_top_k(self):
+        rng = np.random.default_rng(7)
+        for scores in [rng.random(50), rng.integers(0, 4, 50).astype(float), np.ones(5)]:
+            expected = np.argsort(-scores, kind='stable')
+            for k in [0, 1, 3, 10, len(scores)-1, len(scores), len(scores)+5]:
+                self.assertEqual(self.searcher._top_k(scores, k).tolist(),
+                                 expected[:max(k, 0)].tolist())
+
+
+    def test_cosine_similarity(self):
+        queries = [self.indexer.preprocess(q) for q in ['saia longa', 'lembrancinha']]
+        query_mat = self.searcher._gen_query_vector(self.indexer, queries)
+        docs = np.arange(self.indexer.n_doc)
+        similarities = self.searcher._cosine_similarity_docs(self.indexer, query_mat, docs)
+        matrix, features, _ = self.indexer.get_vectors(docs)
+        doc_vecs = np.hstack((matrix.toarray(), features)).astype(np.float64)
+        n_feat = self.indexer.get_number_features()
+        for i, words in enumerate(queries):
+            query_vec = np.hstack((query_mat[i].toarray().ravel(), np.ones(n_feat)))
+            expected = doc_vecs.dot(query_vec)/(np.linalg.norm(doc_vecs, axis=1)*
+                                                np.linalg.norm(query_vec))
+            start, end = similarities.indptr[i], similarities.indptr[i+1]
+            columns = similarities.indices[start:end]
+            self.assertEqual(columns.tolist(),
+                             self.indexer.get_document_ordinals(words).tolist())
+            np.testing.assert_allclose(similarities.data[start:end], expected[columns],
+                                       rtol=1e-5)
+
+
+    def test_search_cache(self):
+        first = self.searcher.search('bolsa', prods_to_show=5, price_max=150)
+        second = self.searcher.search('bolsa', prods_to_show=3, price_max='150.0')
+        self.assertEqual(first[:3], second)
+        self.assertEqual(self.searcher.cache_stats()['hits'], 1)
+
+
+    def test_upsert_remove(self):
+        doc = self.indexer.get_document(7621260)
+        doc['product_id'] = 1
+        doc['title'] = 'Saia rodada kwyjibo'
+        self.indexer.upsert(doc)
+        self.assertEqual(self.searcher.search('kwyjibo'), [1])
+        self.assertIn(1, self.searcher.search('saia', seller_id=7274093))
+        doc = dict(doc, title='Saia longa')
+        self.indexer.upsert(doc)
+        self.assertEqual(self.searcher.search('kwyjibo'), [])
+        self.indexer.remove(7621260)
+        self.assertNotIn(7621260, self.searcher.search('saia'))
+        self.indexer.compact()
+        self.assertEqual(self.searcher.search('saia', seller_id=7274093), [1])
+        stem = self.indexer.preprocess('kwyjibo')[0]
+        self.assertNotIn(stem, self.indexer.word_idx)
+
+
+    def test_compact_off_lock(self):
+        building, release = threading.Event(), threading.Event()
+        compacted = self.indexer._compacted
+        def blocked(snapshot):
+            building.set()
+            release.wait(5)
+            return compacted(snapshot)
+        self.indexer._compacted = blocked
+        doc = self.indexer.get_document(7621260)
+        self.indexer.remove(7621260)
+        thread = threading.Thread(target=self.indexer.compact)
+        thread.start()
+        self.assertTrue(building.wait(5))
+        self.assertTrue(self.indexer.lock.acquire(timeout=1))
+        self.indexer.lock.release()
+        self.assertNotIn(7621260, self.searcher.search('saia'))
+        self.indexer.upsert(dict(doc, product_id=1, title='Saia rodada kwyjibo'))
+        self.indexer.upsert(dict(doc, product_id=2, title='Saia kwyjibo'))
+        self.indexer.remove(2)
+        removed = self.searcher.search('lembrancinha')[0]
+        self.indexer.remove(removed)
+        release.set()
+        thread.join()
+        self.assertEqual(self.searcher.search('kwyjibo'), [1])
+        self.assertNotIn(removed, self.searcher.search('lembrancinha', 100))
+        self.assertEqual((len(self.indexer.delta), len(self.indexer.tombstones)), (1, 1))
+        self.indexer.compact()
+        self.assertEqual(self.indexer.n_doc, len(self.indexer.doc_ids))
+        postings = np.diff(self.indexer.inverted_index.offsets)
+        self.assertEqual([self.indexer.doc_freq[w] for w in self.indexer.word_idx],
+                         postings.tolist())
+
+
+    def test_compact_documents(self):
+        before = {p: self.indexer.get_document(p) for p in [11394449, 16153119, 15534262]}
+        self.indexer.remove(15877252)
+        self.indexer.compact()
+        for product_id, doc in before.items():
+            after = self.indexer.get_document(product_id)
+            self.assertEqual((after['price'], after['weight']), (doc['price'], doc['weight']))
+        self.assertAlmostEqual(self.indexer.get_document(11394449)['price'], 171.89, 5)
@@ -0,0 +1,152 @@
+import unittest
+import asyncio
+import json
+import src.indexer as idx
+import src.searcher as sch
+import src.server as srv
+import benchmarks.load as load
+import os
+
+class TestServer(unittest.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        unittest.TestCase.__init__(self,*args,**kwargs)
+        self.indexer = idx.Indexer(os.path.abspath("data/elo7_recruitment_dataset_100.csv"))
+        self.searcher = sch.Searcher(self.indexer, cache_size=0)
+        self.queries = ['lembrancinha', 'mandala croche', 'kit bebe maternidade',
+                        'dia dos pais chaveiro', 'saia']
+
+
+    def serve(self, test, **options):
+        """
+        Runs test(server, port) against a server on a free port
+        """
+        async def main():
+            server = srv.SearchServer(self.searcher, port=0, **options)
+            port = await server.start()
+            try:
+                return await test(server, port)
+            finally:
+                await server.close()
+        return asyncio.run(main())
+
+
+    async def get(self, port, path):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        try:
+            return await load.request(reader, writer, path)
+        finally:
+            writer.close()
+
+
+    def test_parse_params(self):
+        query, k, filters = srv.parse_params({'q': 'saia', 'k': '5', 'price_max': '80',
+                                              'express_delivery': 'true', 'seller_id': 7})
+        self.assertEqual((query, k), ('saia', 5))
+        self.assertEqual(filters, {'price_max': 80.0, 'express_delivery': True,
+                                   'seller_id': 7})
+        for params in [{}, {'q': 'saia', 'k': 'ten'}, {'q': 'saia', 'price_max': 'abc'},
+                       {'q': 'saia', 'color': 'red'}, {'q': 'saia', 'k': -1},
+                       {'q': 'saia', 'seller_id': 1.5}]:
+            self.assertRaises(ValueError, srv.parse_params, params)
+
+
+    def test_endpoints(self):
+        async def test(server, port):
+            status, body = await self.get(port, '/health')
+            self.assertEqual((status, body['status']), (200, 'ok'))
+            status, body = await self.get(port, '/search?q=mandala+croche&k=5&price_max=80')
+            self.assertEqual(status, 200)
+            self.assertEqual(body['results'],
+                             self.searcher.search('mandala croche', 5, price_max=80))
+            self.assertEqual((await self.get(port, '/search?q=saia&price_max=x'))[0], 400)
+            self.assertEqual((await self.get(port, '/search?q=%22dia+dos+pais%22'))[0], 400)
+            self.assertEqual((await self.get(port, '/nothing'))[0], 404)
+            status, body = await self.get(port, '/stats')
+            self.assertEqual(status, 200)
+            self.assertEqual(body['server']['batched_queries'], 1)
+        self.serve(test)
+
+
+    def test_suggest(self):
+        async def test(server, port):
+            status, body = await self.get(port, '/suggest?q=lemb&k=3')
+            self.assertEqual(status, 200)
+            self.assertEqual(body['suggestions'], self.searcher.suggest('lemb', 3))
+            self.assertEqual((await self.get(port, '/suggest?q=lemb&k=x'))[0], 400)
+            self.assertEqual(server.stats()['server']['batched_queries'], 0)
+        self.serve(test)
+
+
+    def test_post(self):
+        async def test(server, port):
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            body = json.dumps({'q': 'lembrancinha', 'k': 3, 'category': 'Lembrancinhas'})
+            writer.write(('POST /search HTTP/1.1\r\nContent-Length: {}\r\n\r\n{}'\
+                          .format(len(body), body)).encode('utf-8'))
+            await writer.drain()
+            head = await reader.readuntil(b'\r\n\r\n')
+            length = int(head.split(b'Content-Length: ')[1].split(b'\r\n')[0])
+            result = json.loads(await reader.readexactly(length))
+            writer.close()
+            self.assertEqual(result['results'], self.searcher.search(
+                'lembrancinha', 3, category='Lembrancinhas'))
+        self.serve(test)
+
+
+    def test_micro_batching(self):
+        async def test(server, port):
+            results = await asyncio.gather(*[self.get(port, '/search?q='+q.replace(' ', '+'))\
+                                             for q in self.queries*4])
+            for (status, body), query in zip(results, self.queries*4):
+                self.assertEqual(status, 200)
+                self.assertEqual(body['results'], self.searcher.search(query))
+            stats = server.stats()['server']
+            self.assertEqual(stats['batched_queries'], 20)
+            self.assertLess(stats['batches'], 20)
+        self.serve(test, batch_window_ms=50)
+
+
+    def test_batch_errors(self):
+        async def test(server, port):
+            paths = ['/search?q=saia', '/search?q=%22dia+dos+pais%22', '/search?q=lembrancinha']
+            results = await asyncio.gather(*[self.get(port, p) for p in paths])
+            self.assertEqual([status for status, _ in results], [200, 400, 200])
+            self.assertEqual(results[2][1]['results'], self.searcher.search('lembrancinha'))
+            self.assertEqual(server.stats()['server']['batched_queries'], 2)
+        self.serve(test, batch_window_ms=50)
+        def search(queries, k):
+            if 'bad' in queries:
+                raise ValueError('bad query')
+            return 0, [[q] for q in queries]
+        async def main():
+            batcher = srv.MicroBatcher(search, window_ms=50)
+            batcher.start()
+            try:
+                return await asyncio.gather(*[batcher.submit(q, 10, {})\
+                                              for q in ['a', 'bad', 'b']],
+                                            return_exceptions=True)
+            finally:
+                await batcher.stop()
+        results = asyncio.run(main())
+        self.assertEqual(results[0], (0, ['a']))
+        self.assertIsInstance(results[1], ValueError)
+        self.assertEqual(results[2], (0, ['b']))
+
+
+    def test_backpressure(self):
+        async def test(server, port):
+            status, body = await self.get(port, '/search?q=saia')
+            self.assertEqual(status, 503)
+            self.assertEqual(server.stats()['server']['rejected'], 1)
+            self.assertEqual((await self.get(port, '/health'))[0], 200)
+        self.serve(test, max_pending=0)
+
+
+    def test_load(self):
+        async def test(server, port):
+            return await load.load_test('127.0.0.1', port, self.queries*10, concurrency=8)
+        result = self.serve(test, max_pending=4)
+        self.assertEqual(sum(result['status'].values()), 50)
+        self.assertEqual(set(result['status']) - {'200', '503'}, set())
+        self.assertGreater(result['status']['200'], 0)
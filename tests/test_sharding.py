@@ -0,0 +1,70 @@
+import unittest
+import src.indexer as idx
+import src.searcher as sch
+import src.sharding as shd
+import pandas as pd
+import numpy as np
+import tempfile
+import shutil
+import os
+
+class TestSharding(unittest.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        unittest.TestCase.__init__(self,*args,**kwargs)
+        self.dataset = pd.read_csv(os.path.abspath("data/elo7_recruitment_dataset_100.csv"))
+        self.queries = ['lembrancinha', 'mandala croche', 'kit bebe maternidade',
+                        'dia dos pais chaveiro', 'saia', 'xyzzy', 'bolsa AND praia']
+
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'dataset.csv')
+        self.dataset.to_csv(self.path, index=False)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+
+    def test_partition(self):
+        manifest = shd.partition(self.path, 3)
+        self.assertEqual(manifest.header['n_shards'], 3)
+        shards = [pd.read_csv(os.path.join(self.tmp_dir, 'dataset_shards', name))\
+                  for name in manifest.header['shards']]
+        self.assertEqual(sum(len(s) for s in shards), len(self.dataset))
+        for i, shard in enumerate(shards):
+            self.assertTrue((shd.shard_of(shard['product_id'], 3) == i).all())
+        self.assertEqual(manifest.header['max_features']['view_counts'],
+                         self.dataset['view_counts'].max())
+        self.assertEqual(shd.partition(self.path, 3).path, manifest.path)
+        ids = self.dataset['product_id'].to_numpy()
+        positions = manifest.array('positions')[np.searchsorted(manifest.array('product_ids'), ids)]
+        self.assertEqual(ids[positions].tolist(), ids.tolist())
+
+
+    def test_merge_stats(self):
+        stats = [{'n_doc': 2, 'n_rows': 2, 'total_length': 5,
+                  'doc_freq': {'a': 1, 'b': 2}, 'row_freq': {'a': 1, 'b': 2}},
+                 {'n_doc': 3, 'n_rows': 2, 'total_length': 4,
+                  'doc_freq': {'b': 1, 'c': 3}, 'row_freq': {'b': 1, 'c': 2}}]
+        total = shd.merge_stats(stats)
+        self.assertEqual((total['n_doc'], total['n_rows'], total['total_length']), (5, 4, 9))
+        self.assertEqual(total['doc_freq'], {'a': 1, 'b': 3, 'c': 3})
+
+
+    def test_rankings(self):
+        indexer = idx.Indexer(self.path)
+        with shd.ShardedIndex(self.path, n_shards=3) as index:
+            self.assertEqual(len(index), 3)
+            for ranking in sch.Searcher.RANKINGS:
+                searcher = sch.Searcher(indexer, ranking=ranking)
+                sharded = shd.ShardedSearcher(index, ranking=ranking)
+                for k in [3, 10, 100]:
+                    for params in [{}, {'price_max': 80}, {'category': 'Bebê'}]:
+                        self.assertEqual(searcher.search_many(self.queries, k, **params),
+                                         sharded.search_many(self.queries, k, **params))
+            sharded = shd.ShardedSearcher(index)
+            self.assertEqual(sharded.search('saia'), sharded.search('saia'))
+            self.assertEqual(sharded.cache_stats()['hits'], 1)
+            self.assertRaises(ValueError, sharded.search, '"dia dos pais"')
@@ -0,0 +1,126 @@
+import unittest
+import asyncio
+import threading
+import tempfile
+import shutil
+import os
+import pandas as pd
+import src.indexer as idx
+import src.searcher as sch
+import src.snapshots as snp
+import src.server as srv
+import benchmarks.load as load
+
+class TestSnapshots(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'catalog.csv')
+        shutil.copy('data/elo7_recruitment_dataset_100.csv', self.path)
+        self.searcher = sch.Searcher(idx.Indexer(self.path))
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+
+    def rewrite(self, rows):
+        """
+        Keeps the first rows of the dataset only
+        """
+        pd.read_csv(self.path).head(rows).to_csv(self.path, index=False)
+
+
+    def test_swap(self):
+        before = self.searcher.search('lembrancinha')
+        self.rewrite(50)
+        index = idx.Indexer(self.path)
+        self.assertEqual(self.searcher.swap(index), 1)
+        self.assertIs(self.searcher.index, index)
+        self.assertEqual(self.searcher.stats()['generation'], 1)
+        after = self.searcher.search('lembrancinha')
+        self.assertNotEqual(before, after)
+        self.assertTrue(set(after) <= set(index.doc_ids))
+
+
+    def test_in_flight_search(self):
+        snapshot = self.searcher._acquire()
+        swapped = threading.Event()
+        thread = threading.Thread(target=lambda: self.searcher.swap(
+            idx.Indexer(self.path)) and swapped.set())
+        thread.start()
+        self.assertFalse(swapped.wait(0.2))
+        self.assertEqual(self.searcher.generation, 1)
+        self.assertEqual(snapshot.generation, 0)
+        self.assertEqual(self.searcher.search_versioned(['saia'])[0], 1)
+        snapshot.release()
+        thread.join()
+        self.assertTrue(swapped.is_set())
+        self.assertTrue(snapshot.wait_idle(0))
+
+
+    def test_swap_timeout(self):
+        snapshot = self.searcher._acquire()
+        self.searcher.swap(idx.Indexer(self.path), timeout=0.01)
+        self.assertEqual(snapshot.active, 1)
+        snapshot.release()
+
+
+    def test_reload(self):
+        self.rewrite(30)
+        generation = self.searcher.reload(warm_queries=['saia', 'mandala'], precision='float32')
+        self.assertEqual(generation, 1)
+        self.assertEqual(self.searcher.index.n_doc, 30)
+        self.assertEqual(self.searcher.index.precision, 'float32')
+        self.assertTrue(self.searcher.reload_async())
+        self.searcher._reloader.join()
+        self.assertEqual(self.searcher.generation, 2)
+        self.assertEqual(self.searcher.index.precision, 'float32')
+        self.assertIsNone(self.searcher.reload_error)
+
+
+    def test_failed_reload(self):
+        self.searcher.reload_async(os.path.join(self.tmp_dir, 'missing.csv'))
+        self.searcher._reloader.join()
+        self.assertIsNotNone(self.searcher.reload_error)
+        self.assertEqual(self.searcher.generation, 0)
+        self.assertTrue(self.searcher.search('saia'))
+
+
+    def test_watcher(self):
+        watcher = snp.IndexWatcher(self.searcher)
+        self.assertFalse(watcher.poll())
+        self.rewrite(40)
+        self.assertFalse(watcher.poll())
+        self.assertTrue(watcher.poll())
+        self.searcher._reloader.join()
+        self.assertEqual(self.searcher.generation, 1)
+        self.assertEqual(self.searcher.index.n_doc, 40)
+        self.assertFalse(watcher.poll())
+        self.assertEqual(watcher.reloads, 1)
+
+
+    def test_server_reload(self):
+        async def test():
+            server = srv.SearchServer(self.searcher, port=0)
+            port = await server.start()
+            try:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                status, body = await load.request(reader, writer, '/search?q=saia')
+                self.assertEqual((status, body['generation']), (200, 0))
+                writer.write(b'POST /reload HTTP/1.1\r\nContent-Length: 0\r\n\r\n')
+                await writer.drain()
+                head = await reader.readuntil(b'\r\n\r\n')
+                self.assertTrue(head.startswith(b'HTTP/1.1 202'))
+                await reader.readexactly(int(head.split(b'Content-Length: ')[1]\
+                                             .split(b'\r\n')[0]))
+                while self.searcher.reloading():
+                    await asyncio.sleep(0.01)
+                status, body = await load.request(reader, writer, '/search?q=saia')
+                self.assertEqual((status, body['generation']), (200, 1))
+                status, body = await load.request(reader, writer, '/health')
+                self.assertEqual((body['generation'], body['reloading']), (1, False))
+                writer.close()
+            finally:
+                await server.close()
+        asyncio.run(test())
@@ -0,0 +1,73 @@
+import unittest
+import tempfile
+import shutil
+import os
+import numpy as np
+import src.indexer as idx
+import src.storage as stg
+import src.suggestions as sgg
+
+class TestSuggestions(unittest.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        unittest.TestCase.__init__(self,*args,**kwargs)
+        documents = [('Caneca personalizada', 10), ('Caneca de porcelana', 0),
+                     ('Camiseta Dia dos Pais', 2), ('Crochê', 1), ('Capa 3D', 0)]
+        queries = [('caneca', 5), ('caneca', 0), ('dia dos pais', 1), ('dia das maes', 0),
+                   (np.nan, 0)]
+        self.suggester = sgg.Suggester.build(documents, queries, ['de', 'dos'], size=2)
+
+
+    def test_normalize(self):
+        self.assertEqual(sgg.normalize('  Crochê  Filé'), 'croche file')
+        self.assertEqual(sgg.normalize('dia ', partial=True), 'dia ')
+        self.assertEqual(sgg.normalize('dia '), 'dia')
+
+
+    def test_build(self):
+        self.assertEqual(self.suggester.keys, sorted(self.suggester.keys))
+        self.assertNotIn('de', self.suggester.keys)
+        self.assertNotIn('3d', self.suggester.keys)
+        self.assertIn('dia dos pais', self.suggester.keys)
+        position = self.suggester.keys.index('caneca')
+        self.assertAlmostEqual(self.suggester.scores[position], 4*(1+np.log1p(15/4)), 5)
+        self.assertEqual(self.suggester.texts[self.suggester.keys.index('croche')], 'crochê')
+        self.assertEqual(sorted(self.suggester.prefixes), ['c', 'ca', 'd', 'di', 'dia', 'p'])
+
+
+    def test_suggest(self):
+        self.assertEqual(self.suggester.suggest('c'), ['caneca', 'camiseta'])
+        self.assertEqual(self.suggester.suggest('CRO'), ['crochê'])
+        self.assertEqual(self.suggester.suggest('dia '), ['dia dos pais', 'dia das maes'])
+        self.assertEqual(self.suggester.suggest('dia d', 1), ['dia dos pais'])
+        self.assertEqual(self.suggester.suggest('canecas'), [])
+        self.assertEqual(self.suggester.suggest(' '), [])
+        self.assertEqual(self.suggester.suggest('c', 0), [])
+        for key in self.suggester.keys:
+            for i in range(1, len(key)+1):
+                matches = [j for j,k in enumerate(self.suggester.keys) if k.startswith(key[:i])]
+                matches.sort(key=lambda j: -self.suggester.scores[j])
+                self.assertEqual(self.suggester.suggest(key[:i]),
+                                 [self.suggester.texts[j] for j in matches[:2]])
+
+
+    def test_storage(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'suggest.idx')
+            stg.write_index(path, {}, self.suggester.to_sections())
+            suggester = sgg.Suggester.from_index_file(stg.IndexFile(path))
+            self.assertEqual(suggester.keys, self.suggester.keys)
+            self.assertEqual(suggester.suggest('d'), self.suggester.suggest('d'))
+            self.assertGreater(suggester.nbytes(), 0)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
+    def test_indexer(self):
+        path = os.path.abspath('data/elo7_recruitment_dataset_100.csv')
+        built = idx.Indexer(path)
+        loaded = idx.Indexer(path)
+        self.assertEqual(built.suggest('lemb', 3), loaded.suggest('lemb', 3))
+        self.assertEqual(loaded.suggest('lemb', 1), ['lembrancinha'])
+        self.assertEqual(loaded.suggest('xyz'), [])
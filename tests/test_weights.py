@@ -0,0 +1,78 @@
+import unittest
+import src.indexer as idx
+import src.searcher as sch
+import src.weights as wgt
+import src.storage as stg
+import numpy as np
+import pandas as pd
+from scipy import sparse
+import tempfile
+import shutil
+import os
+
+class TestWeights(unittest.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        unittest.TestCase.__init__(self,*args,**kwargs)
+        rng = np.random.default_rng(0)
+        self.matrix = sparse.random(50, 30, density=0.2, format='csr', random_state=1)
+        self.matrix.data = rng.uniform(0.01, 5, len(self.matrix.data))
+        self.matrix.sort_indices()
+        self.datapath = os.path.abspath("data/elo7_recruitment_dataset_100.csv")
+        self.queries = ['lembrancinha', 'mandala croche', 'kit bebe maternidade',
+                        'dia dos pais chaveiro', 'saia']
+
+
+    def test_quantize(self):
+        ordinals = np.array([0, 3, 7, 12, 49])
+        expected = self.matrix[ordinals].toarray()
+        maxima = expected.max(axis=1, keepdims=True)
+        tolerance = {'float32': 1e-6*maxima, 'float16': 1e-3*maxima,
+                     'int8': maxima/(2*wgt.INT8_MAX)+1e-6}
+        for precision, tol in tolerance.items():
+            weights = wgt.DocWeights.from_matrix(self.matrix, precision)
+            self.assertEqual(weights.precision, precision)
+            rows = weights.rows(ordinals)
+            self.assertEqual(rows.dtype, np.float32)
+            self.assertTrue((np.abs(rows.toarray()-expected) <= tol).all(), precision)
+        int8 = wgt.DocWeights.from_matrix(self.matrix, 'int8')
+        self.assertLess(int8.nbytes(), self.matrix.data.nbytes)
+        self.assertRaises(ValueError, wgt.DocWeights.from_matrix, self.matrix, 'float64')
+
+
+    def test_storage(self):
+        tmp_dir = tempfile.mkdtemp()
+        path = os.path.join(tmp_dir, 'weights.idx')
+        weights = wgt.DocWeights.from_matrix(self.matrix, 'int8')
+        stg.write_index(path, {}, weights.to_sections())
+        loaded = wgt.DocWeights.from_index_file(stg.IndexFile(path), self.matrix.indptr,
+                                                self.matrix.indices, self.matrix.shape)
+        self.assertTrue(np.array_equal(loaded.rows([1, 2]).toarray(),
+                                       weights.rows([1, 2]).toarray()))
+        del loaded
+        shutil.rmtree(tmp_dir)
+
+
+    def test_rankings(self):
+        tmp_dir = tempfile.mkdtemp()
+        path = os.path.join(tmp_dir, 'dataset.csv')
+        pd.read_csv(self.datapath).to_csv(path, index=False)
+        full = sch.Searcher(idx.Indexer(path), cache_size=0)
+        expected = full.search_many(self.queries, 20)
+        for precision in ['float32', 'int8']:
+            indexer = idx.Indexer(path, precision=precision)
+            self.assertEqual(indexer.doc_weights.precision, precision)
+            indexer.warm()
+            self.assertNotIn('tfidf_index', vars(indexer))
+            self.assertNotIn('tfidf_data', indexer._index_file._arrays)
+            searcher = sch.Searcher(indexer, cache_size=0)
+            rankings = searcher.search_many(self.queries, 20)
+            for ranking, reference in zip(rankings, expected):
+                self.assertEqual(len(ranking), len(reference))
+                self.assertGreaterEqual(len(set(ranking) & set(reference)), 0.8*len(reference))
+            doc = indexer.get_document(7621260)
+            doc['product_id'] = 1
+            indexer.upsert(doc)
+            self.assertIn(1, searcher.search(doc['title'], 20))
+        self.assertRaises(ValueError, idx.Indexer, path, precision='float8')
+        shutil.rmtree(tmp_dir)